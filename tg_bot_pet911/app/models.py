@@ -8,6 +8,8 @@ class PetLocation(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     address: Optional[str] = None
+    # District name resolved from the coordinates
+    district: Optional[str] = None
     
     def is_valid(self) -> bool:
         """Check if location is valid."""
@@ -77,6 +79,8 @@ class PetInfo(BaseModel):
         if self.location.address:
             parts.append(f"📍 Локация: {self.location.address}")
         elif self.location.latitude and self.location.longitude:
+            if self.location.district:
+                parts.append(f"🏙️ Район: {self.location.district}")
             parts.append(f"📍 Координаты: {self.location.latitude}, {self.location.longitude}")
         
         # Add comment if exists
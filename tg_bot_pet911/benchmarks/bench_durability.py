@@ -0,0 +1,64 @@
+"""
+Throughput of pet record writes at each durability level.
+
+Simulates a burst of confirmations: many concurrent writers, each writing
+a JSON record of typical size into its own sharded pet directory.
+
+    python -m tg_bot_pet911.benchmarks.bench_durability --records 500 --writers 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from tg_bot_pet911.utils import durable
+from tg_bot_pet911.utils.durable import DURABILITY_LEVELS, GroupCommitter, write_file
+
+
+def make_record(i: int) -> str:
+    """A JSON record roughly the size of a real one."""
+    return json.dumps({
+        "id": f"{i:08x}",
+        "pet_type": "dog",
+        "gender": "male",
+        "comment": "Рыжий, в ошейнике, очень дружелюбный " * 4,
+        "location": {"latitude": 55.75, "longitude": 37.61, "address": "Москва, Тверская улица"},
+        "photo_files": [f"dog_male_{i:08x}_image_{n}.jpg" for n in range(1, 4)]
+    }, ensure_ascii=False, indent=2)
+
+
+async def run_level(root: str, durability: str, records: int, writers: int) -> float:
+    """Write records with concurrent writers and return records per second."""
+    semaphore = asyncio.Semaphore(writers)
+
+    async def write_one(i: int):
+        pet_dir = os.path.join(root, f"{i % 100:02d}", f"pet_{i}")
+        async with semaphore:
+            await asyncio.to_thread(os.makedirs, pet_dir, exist_ok=True)
+            await write_file(os.path.join(pet_dir, "data.json"), make_record(i), durability, root=root)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(write_one(i) for i in range(records)))
+    return records / (time.perf_counter() - started)
+
+
+async def main(records: int, writers: int, window_ms: float, directory: str):
+    durable._group_committer = GroupCommitter(window=window_ms / 1000)
+    print(f"{records} records, {writers} concurrent writers, group window {window_ms} ms")
+    for durability in DURABILITY_LEVELS:
+        with tempfile.TemporaryDirectory(dir=directory) as root:
+            rate = await run_level(root, durability, records, writers)
+        extra = f" ({durable._group_committer.batches} batches)" if durability == "group" else ""
+        print(f"{durability:>7}: {rate:8.0f} records/s{extra}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pet record durability levels")
+    parser.add_argument("--records", type=int, default=500)
+    parser.add_argument("--writers", type=int, default=50, help="Concurrent writers")
+    parser.add_argument("--window-ms", type=float, default=10, help="Group commit window")
+    parser.add_argument("--dir", default=None, help="Directory on the disk to test, defaults to the temp dir")
+    args = parser.parse_args()
+    asyncio.run(main(args.records, args.writers, args.window_ms, args.dir))
@@ -0,0 +1,112 @@
+"""
+Size and speed of FSM conversation data in each serializer.
+
+Replays the data a registration writes to storage after every step (type,
+gender, each photo, location, comment) and reports the bytes written per
+conversation and how many encode/decode operations run per second.
+"aiogram-json" is what RedisStorage does by default: json.dumps of the
+same data with datetimes as strings. "+patches" lines write each step
+after the first as a patch of the fields it changed (see fsm_patch).
+
+    python -m tg_bot_pet911.benchmarks.bench_fsm_serializer --conversations 2000
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from tg_bot_pet911.app.models import PetInfo, PetLocation, PetPhoto
+from tg_bot_pet911.config.config import MAX_PHOTOS
+from tg_bot_pet911.utils.fsm_patch import diff_patch
+from tg_bot_pet911.utils.fsm_serializer import JsonSerializer, MsgpackSerializer
+
+
+class AiogramJson:
+    """RedisStorage's default encoding: json.dumps/json.loads, datetimes made strings beforehand."""
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, default=str).encode("utf-8")
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload.decode("utf-8"))
+
+
+def conversation_steps(i: int) -> List[Dict[str, Any]]:
+    """The data written after each step of one registration."""
+    pet_info = PetInfo(user_id=100000 + i, chat_id=100000 + i, username=f"user{i}", pet_type="dog", gender="")
+    steps = [{"pet_info": pet_info.model_dump()}]
+
+    pet_info.gender = "male"
+    steps.append({"pet_info": pet_info.model_dump()})
+    for n in range(MAX_PHOTOS):
+        pet_info.photos.append(PetPhoto(
+            file_id=f"AgACAgIAAxkBAAIBY2Zk{i:08d}{n}pQ2VjYW5kbGVzLWJsdWUtbGlnaHQtbWFudWFs",
+            file_unique_id=f"AQADxr4xG{i:06d}{n}"
+        ))
+        steps.append({"pet_info": pet_info.model_dump()})
+
+    pet_info.location = PetLocation(latitude=55.75 + i * 1e-5, longitude=37.61, district="Тверской")
+    steps.append({"pet_info": pet_info.model_dump()})
+    pet_info.comment = "Рыжий пёс в синем ошейнике, очень дружелюбный"
+    steps.append({"pet_info": pet_info.model_dump()})
+    return steps
+
+
+def measure(serializer, conversations: List[List[Dict[str, Any]]]) -> Dict[str, float]:
+    payloads = []
+    started = time.perf_counter()
+    for steps in conversations:
+        for data in steps:
+            payloads.append(serializer.dumps(data))
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for payload in payloads:
+        serializer.loads(payload)
+    decode_seconds = time.perf_counter() - started
+
+    return {
+        "bytes": sum(len(payload) for payload in payloads) / len(conversations),
+        "last_step": len(payloads[-1]),
+        "encode": len(payloads) / encode_seconds,
+        "decode": len(payloads) / decode_seconds
+    }
+
+
+def measure_patches(serializer, conversations: List[List[Dict[str, Any]]]) -> Dict[str, float]:
+    written = 0
+    writes = 0
+    started = time.perf_counter()
+    for steps in conversations:
+        written += len(serializer.dumps(steps[0]))
+        for before, after in zip(steps, steps[1:]):
+            patch = diff_patch("pet_info", before["pet_info"], after["pet_info"])
+            for value in list(patch.fields.values()) + [item for items in patch.appends.values() for item in items]:
+                written += len(serializer.dumps_value(value))
+                writes += 1
+    return {"bytes": written / len(conversations), "encode": writes / (time.perf_counter() - started)}
+
+
+def main(conversations: int):
+    data = [conversation_steps(i) for i in range(conversations)]
+    print(f"{conversations} conversations, {len(data[0])} writes each")
+    for name, serializer in [
+        ("aiogram-json", AiogramJson()),
+        ("json", JsonSerializer()),
+        ("msgpack", MsgpackSerializer()),
+    ]:
+        result = measure(serializer, data)
+        print(
+            f"{name:>15}: {result['bytes']:7.0f} bytes/conversation, {result['last_step']:5d} bytes at the last step, "
+            f"encode {result['encode']:8.0f} ops/s, decode {result['decode']:8.0f} ops/s"
+        )
+    for name, serializer in [("json", JsonSerializer()), ("msgpack", MsgpackSerializer())]:
+        result = measure_patches(serializer, data)
+        print(f"{name + '+patches':>15}: {result['bytes']:7.0f} bytes/conversation, encode {result['encode']:8.0f} ops/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FSM data serializers")
+    parser.add_argument("--conversations", type=int, default=2000, help="Registrations to replay")
+    args = parser.parse_args()
+    main(args.conversations)
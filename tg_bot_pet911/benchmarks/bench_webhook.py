@@ -0,0 +1,214 @@
+"""
+Update-to-reply latency and throughput of polling and webhook mode.
+
+A stand-in Telegram server on localhost hands out updates through
+getUpdates (polling) or posts them to the bot's webhook, and records when
+the bot's sendMessage reply arrives. The bot replies to every message, so
+the numbers measure the delivery path, not the handlers.
+
+    python -m tg_bot_pet911.benchmarks.bench_webhook --updates 2000 --burst 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from aiohttp import ClientSession, TCPConnector, web
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+
+from tg_bot_pet911.bot.webhook import create_webhook_app
+
+
+TOKEN = "123456:benchmark"
+SECRET = "benchmark-secret"
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+
+
+class FakeTelegramServer:
+    """Just enough of the Bot API for receiving updates and sending replies."""
+
+    def __init__(self):
+        self.pending: List[Dict[str, Any]] = []
+        self.new_updates = asyncio.Event()
+        self.sent_at: Dict[int, float] = {}
+        self.replies: Dict[int, asyncio.Future] = {}
+        self.webhook_url: Optional[str] = None
+        self._next_id = 1
+        self._webhook_session: Optional[ClientSession] = None
+        self._push_limit = asyncio.Semaphore(40)  # Telegram's default max_connections
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        result = await getattr(self, f"api_{method}")(params)
+        return web.json_response({"ok": True, "result": result})
+
+    async def api_getMe(self, params):
+        return {"id": 123456, "is_bot": True, "first_name": "Benchmark"}
+
+    async def api_deleteWebhook(self, params):
+        self.webhook_url = None
+        return True
+
+    async def api_setWebhook(self, params):
+        self.webhook_url = params["url"]
+        return True
+
+    async def api_getUpdates(self, params):
+        offset = int(params.get("offset", 0))
+        self.pending = [update for update in self.pending if update["update_id"] >= offset]
+        if not self.pending:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:100]
+
+    async def api_sendMessage(self, params):
+        update_id = int(params["text"])
+        self.replies.pop(update_id).set_result(time.perf_counter() - self.sent_at.pop(update_id))
+        return {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": int(params["chat_id"]), "type": "private"},
+            "text": params["text"]
+        }
+
+    def make_update(self) -> Dict[str, Any]:
+        update_id = self._next_id
+        self._next_id += 1
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": update_id % 1000 + 1, "type": "private"},
+                "from": {"id": update_id % 1000 + 1, "is_bot": False, "first_name": "User"},
+                "text": str(update_id)
+            }
+        }
+
+    async def deliver(self, update: Dict[str, Any]) -> asyncio.Future:
+        """Hand an update to the bot and return a future with its update-to-reply latency."""
+        update_id = update["update_id"]
+        self.replies[update_id] = asyncio.get_running_loop().create_future()
+        self.sent_at[update_id] = time.perf_counter()
+        if self.webhook_url:
+            asyncio.create_task(self._push(update))
+        else:
+            self.pending.append(update)
+            self.new_updates.set()
+        return self.replies[update_id]
+
+    async def _push(self, update: Dict[str, Any]):
+        if self._webhook_session is None:
+            self._webhook_session = ClientSession(connector=TCPConnector(limit=40))
+        async with self._push_limit:
+            async with self._webhook_session.post(
+                self.webhook_url, data=json.dumps(update),
+                headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": SECRET}
+            ) as response:
+                response.raise_for_status()
+
+    async def close(self):
+        if self._webhook_session is not None:
+            await self._webhook_session.close()
+
+
+def make_dispatcher() -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def echo(message: Message):
+        await message.answer(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def measure(server: FakeTelegramServer, updates: int, burst: int) -> Dict[str, float]:
+    """Sequential update-to-reply latency, then the throughput of a burst."""
+    latencies = []
+    for _ in range(updates):
+        latencies.append(await (await server.deliver(server.make_update())))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[await server.deliver(server.make_update()) for _ in range(burst)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "throughput": burst / elapsed
+    }
+
+
+async def run_polling(server: FakeTelegramServer, updates: int, burst: int) -> Dict[str, float]:
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}")))
+    dp = make_dispatcher()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    try:
+        return await measure(server, updates, burst)
+    finally:
+        await dp.stop_polling()
+        server.new_updates.set()  # Release the pending getUpdates
+        await polling
+
+
+async def run_webhook(server: FakeTelegramServer, updates: int, burst: int, max_concurrent: int) -> Dict[str, float]:
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}")))
+    app = create_webhook_app(make_dispatcher(), bot, SECRET, path="/webhook", max_concurrent=max_concurrent)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", WEBHOOK_PORT).start()
+    await bot.set_webhook(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", secret_token=SECRET)
+    try:
+        return await measure(server, updates, burst)
+    finally:
+        await bot.delete_webhook()
+        await runner.cleanup()
+
+
+async def main(updates: int, burst: int, max_concurrent: int):
+    server = FakeTelegramServer()
+    api_runner = web.AppRunner(server.app())
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", API_PORT).start()
+
+    try:
+        print(f"{updates} sequential updates, burst of {burst}")
+        for name, run in [
+            ("polling", run_polling(server, updates, burst)),
+            ("webhook", run_webhook(server, updates, burst, max_concurrent)),
+        ]:
+            result = await run
+            print(
+                f"{name:>8}: p50 {result['p50_ms']:6.2f} ms, p95 {result['p95_ms']:6.2f} ms, "
+                f"burst {result['throughput']:7.0f} updates/s"
+            )
+    finally:
+        await server.close()
+        await api_runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark polling against webhook mode")
+    parser.add_argument("--updates", type=int, default=500, help="Sequential updates for the latency")
+    parser.add_argument("--burst", type=int, default=500, help="Updates sent at once for the throughput")
+    parser.add_argument("--max-concurrent", type=int, default=64, help="Webhook updates processed at once")
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.burst, args.max_concurrent))
@@ -5,6 +5,7 @@ from aiogram.fsm.context import FSMContext
 from tg_bot_pet911.app.models import PetInfo
 from tg_bot_pet911.keyboards.inline import get_confirmation_keyboard, get_location_keyboard
 from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils.fsm_patch import edit_data
 
 
 router = Router()
@@ -20,15 +21,9 @@ async def process_comment(message: Message, state: FSMContext):
     if comment.lower() == "нет":
         comment = ""
     
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
-    
-    # Update pet_info with comment
-    pet_info_dict["comment"] = comment
-    
-    # Save updated pet_info back to state
-    await state.update_data(pet_info=pet_info_dict)
+    # Update pet_info with comment, only the field is written back to state
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["comment"] = comment
     
     # Create a PetInfo object to format the preview
     pet_info = PetInfo(**pet_info_dict)
@@ -51,13 +46,9 @@ async def process_comment(message: Message, state: FSMContext):
 @router.callback_query(PetRegistration.entering_comment, F.data == "back")
 async def back_to_location(callback: CallbackQuery, state: FSMContext):
     """Return to location entry."""
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
-    
     # Clear comment if it was set
-    pet_info_dict["comment"] = ""
-    await state.update_data(pet_info=pet_info_dict)
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["comment"] = ""
     
     # Move back to location input
     await callback.message.edit_text(
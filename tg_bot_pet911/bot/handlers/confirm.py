@@ -1,19 +1,88 @@
 from aiogram import Router, F, Bot
 from aiogram.types import CallbackQuery, InputMediaPhoto
 from aiogram.fsm.context import FSMContext
-from aiogram.exceptions import TelegramAPIError
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from typing import Any, Dict, List, Optional, Union
+import asyncio
 import json
+import uuid
 
-from tg_bot_pet911.app.models import PetInfo, PetPhoto
-from tg_bot_pet911.config.config import CHANNEL_ID, ADMIN_IDS, NOTIFICATION_ID
+from tg_bot_pet911.app.models import PetInfo, PetLocation, PetPhoto
+from tg_bot_pet911.bot.outbound import Priority, outbound_priority
+from tg_bot_pet911.config.config import CHANNEL_ID, ADMIN_IDS, NOTIFICATION_ID, SUBSCRIPTION_NOTIFY_CONCURRENCY
 from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils.catalog import get_catalog
+from tg_bot_pet911.utils.job_queue import PermanentJobError, get_persistence_queue, register_job_handler
+from tg_bot_pet911.utils.phash import get_duplicate_index
 from tg_bot_pet911.utils.storage import save_pet_data
+from tg_bot_pet911.utils.subscriptions import matching_chats
 
 
 router = Router()
 
+# Longest caption Telegram accepts on a photo
+CAPTION_LIMIT = 1024
 
-async def send_notification(bot: Bot, pet_info: PetInfo, saved_dir: str, pet_data_json: str):
+
+def format_location(location: PetLocation) -> str:
+    """Short location description for notifications."""
+    if location.address:
+        return location.address
+    if location.latitude is not None:
+        return f"{location.district} (GPS)" if location.district else "GPS координаты"
+    return "Не указана"
+
+
+async def send_album(bot: Bot, chat_id: Union[int, str], photos: List[PetPhoto], captions: Optional[List[str]] = None):
+    """
+    Send photos in a single request: one photo as a photo, several as a media group.
+
+    Args:
+        bot: Bot instance
+        chat_id: Recipient
+        photos: Photos to send, at most 10
+        captions: Caption per photo, a media group shows the first one under the album
+    """
+    captions = captions or []
+    if len(photos) == 1:
+        await bot.send_photo(chat_id=chat_id, photo=photos[0].file_id, caption=captions[0] if captions else None)
+        return
+    await bot.send_media_group(
+        chat_id=chat_id,
+        media=[
+            InputMediaPhoto(media=photo.file_id, caption=captions[i] if i < len(captions) else None)
+            for i, photo in enumerate(photos)
+        ]
+    )
+
+
+async def notify_admins(bot: Bot, text: str, photos: List[PetPhoto]):
+    """
+    Send a report to every admin at once, each gets one message or album.
+
+    The text becomes the album caption when it fits, otherwise it is sent
+    before the album. A failing admin does not hold back the others.
+    """
+    async def notify(admin_id: int):
+        try:
+            if not photos:
+                await bot.send_message(chat_id=admin_id, text=text)
+            elif len(text) <= CAPTION_LIMIT:
+                await send_album(bot, admin_id, photos, captions=[text])
+            else:
+                await bot.send_message(chat_id=admin_id, text=text)
+                await send_album(bot, admin_id, photos)
+        except TelegramAPIError:
+            # Silently ignore if cannot send to an admin
+            pass
+    
+    with outbound_priority(Priority.NOTIFICATION):
+        await asyncio.gather(*(notify(admin_id) for admin_id in ADMIN_IDS))
+
+
+async def send_notification(
+    bot: Bot, pet_info: PetInfo, saved_dir: str, pet_data_json: str, duplicates: Optional[List[Dict[str, Any]]] = None
+):
     """Send notification to the main notification ID about new pet entry."""
     try:
         # Get photos for notification
@@ -24,169 +93,193 @@ async def send_notification(bot: Bot, pet_info: PetInfo, saved_dir: str, pet_dat
             f"🆕 НОВОЕ ОБЪЯВЛЕНИЕ О ПИТОМЦЕ!\n\n"
             f"🐾 Тип: {pet_info.pet_type_text if hasattr(pet_info, 'pet_type_text') else pet_info.pet_type}\n"
             f"🧬 Пол: {pet_info.gender_text if hasattr(pet_info, 'gender_text') else pet_info.gender}\n"
-            f"🗺️ Локация: {'GPS координаты' if pet_info.location.latitude else pet_info.location.address or 'Не указана'}\n"
+            f"🗺️ Локация: {format_location(pet_info.location)}\n"
             f"👤 Пользователь: {pet_info.username or pet_info.user_id}\n\n"
             f"📂 Сохранено в: {saved_dir}\n\n"
-            f"💾 Данные:\n<pre>{pet_data_json[:500]}...</pre>" # Limit JSON to 500 chars to avoid message too long
         )
         
-        # Send text notification first
-        await bot.send_message(
-            chat_id=NOTIFICATION_ID,
-            text=notification_text,
-            parse_mode="HTML"
-        )
+        # Flag likely duplicates of earlier reports
+        if duplicates:
+            notification_text += "⚠️ Возможные дубликаты:\n" + "\n".join(
+                f"• ID {duplicate['id']} (различие {duplicate['distance']} бит)"
+                for duplicate in duplicates[:5]
+            ) + "\n\n"
         
-        # Send photos as separate messages to avoid large media groups
-        if photos:
-            for i, photo in enumerate(photos[:3]):  # Limit to 3 photos max
-                await bot.send_photo(
-                    chat_id=NOTIFICATION_ID,
-                    photo=photo.file_id,
-                    caption=f"Фото {i+1} из объявления"
+        notification_text += f"💾 Данные:\n<pre>{pet_data_json[:500]}...</pre>" # Limit JSON to 500 chars to avoid message too long
+        
+        with outbound_priority(Priority.NOTIFICATION):
+            # Send text notification first, it is too long for a caption
+            await bot.send_message(
+                chat_id=NOTIFICATION_ID,
+                text=notification_text,
+                parse_mode="HTML"
+            )
+            
+            # Send the photos as one album
+            if photos:
+                await send_album(
+                    bot,
+                    NOTIFICATION_ID,
+                    photos[:3],  # Limit to 3 photos max
+                    captions=[f"Фото {i+1} из объявления" for i in range(len(photos[:3]))]
                 )
                 
     except TelegramAPIError as e:
         print(f"Failed to send notification: {e}")
 
 
+@register_job_handler("save_pet")
+async def process_save_job(bot: Bot, payload: Dict[str, Any]):
+    """Save a confirmed submission and send the notification (runs in the persistence queue)."""
+    pet_info = PetInfo(**payload["pet_info"])
+    pet_id = payload["pet_id"]
+    
+    # A retried job must not save the same submission twice
+    pet_data = await asyncio.to_thread(get_catalog().get_record, pet_id)
+    if pet_data is None:
+        saved_dir, pet_data = await save_pet_data(pet_info, bot, pet_id=pet_id)
+    else:
+        saved_dir = pet_data.pop("pet_dir")
+    
+    # Look for earlier reports with similar photos, then index this one
+    duplicate_index = await asyncio.to_thread(get_duplicate_index)
+    duplicates = duplicate_index.find_duplicates(
+        (pet_data.get("photo_hashes") or {}).values(), exclude_id=pet_id
+    )
+    duplicate_index.add_record(pet_data)
+    
+    # Convert to pretty JSON string for output
+    pet_data_json = json.dumps(pet_data, ensure_ascii=False, indent=2)
+    
+    # Send notification to the main notification ID
+    await send_notification(bot, pet_info, saved_dir, pet_data_json, duplicates)
+
+
+async def notify_subscriber(bot: Bot, chat_id: int, pet_info: PetInfo, pet_id: str, distance: float):
+    """Tell a subscriber about a report found in their area."""
+    text = (
+        f"🔔 В {distance:.1f} км от вашей области поиска найден питомец!\n\n"
+        f"{pet_info.format_for_publication()}\n\n"
+        f"🆔 {pet_id}"
+    )
+    if pet_info.photos:
+        await bot.send_photo(chat_id=chat_id, photo=pet_info.photos[0].file_id, caption=text[:CAPTION_LIMIT])
+    else:
+        await bot.send_message(chat_id=chat_id, text=text)
+
+
+@register_job_handler("notify_subscribers")
+async def process_notify_job(bot: Bot, payload: Dict[str, Any]):
+    """Notify all matched subscribers about a report concurrently (runs in the persistence queue)."""
+    pet_info = PetInfo(**payload["pet_info"])
+    semaphore = asyncio.Semaphore(SUBSCRIPTION_NOTIFY_CONCURRENCY)
+    
+    async def notify(chat_id: int, distance: float):
+        async with semaphore:
+            try:
+                await notify_subscriber(bot, chat_id, pet_info, payload["pet_id"], distance)
+            except TelegramAPIError as e:
+                # A blocked bot or a deleted chat must not hold back the others
+                print(f"Failed to notify subscriber {chat_id}: {e}")
+    
+    with outbound_priority(Priority.NOTIFICATION):
+        await asyncio.gather(*(notify(chat_id, distance) for chat_id, distance in payload["recipients"]))
+
+
+@register_job_handler("publish_pet")
+async def process_publish_job(bot: Bot, payload: Dict[str, Any]):
+    """Post a report to the channel, or send it to the admins without one (runs in the persistence queue)."""
+    pet_info = PetInfo(**payload["pet_info"])
+    
+    if CHANNEL_ID:
+        text = pet_info.format_for_publication()
+        try:
+            # The announcement is the album caption when it fits, otherwise it goes before the album
+            if len(text) <= CAPTION_LIMIT:
+                await send_album(bot, CHANNEL_ID, pet_info.photos, captions=[text])
+            else:
+                await bot.send_message(chat_id=CHANNEL_ID, text=text)
+                await send_album(bot, CHANNEL_ID, pet_info.photos)
+        except TelegramBadRequest as e:
+            # Telegram refused the post itself, sending it again gets the same answer
+            raise PermanentJobError(str(e)) from e
+    elif ADMIN_IDS:
+        admin_message = (
+            "🆕 Новое объявление о найденном питомце!\n\n" +
+            pet_info.format_for_publication()
+        )
+        await notify_admins(bot, admin_message, pet_info.photos)
+
+
 @router.callback_query(PetRegistration.confirming, F.data == "confirm:yes")
 async def confirm_submission(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    """Handle confirmation and publish the announcement."""
+    """Handle confirmation and queue the announcement for publication."""
     # Get current state data
     data = await state.get_data()
     pet_info_dict = data.get("pet_info", {})
     
     # Create PetInfo object
     pet_info = PetInfo(**pet_info_dict)
+    pet_info_json = pet_info.model_dump(mode="json")
+    
+    # A channel post needs photos, nothing is queued without them
+    photos_missing = bool(CHANNEL_ID) and not pet_info.photos
     
-    # Save the data locally
-    pet_data_json = None
+    # Queue saving, publication and the notifications, the workers take it from here
+    pet_id = str(uuid.uuid4())[:8]
     try:
-        saved_dir, pet_data = await save_pet_data(pet_info, bot)
+        await asyncio.to_thread(get_persistence_queue().enqueue, "save_pet", {"pet_id": pet_id, "pet_info": pet_info_json})
         local_save_success = True
-        
-        # Convert to pretty JSON string for output
-        pet_data_json = json.dumps(pet_data, ensure_ascii=False, indent=2)
-        
-        # Send notification to the main notification ID
-        await send_notification(bot, pet_info, saved_dir, pet_data_json)
-        
     except Exception as e:
         local_save_success = False
-        saved_dir = None
-        print(f"Error saving pet data: {e}")
+        print(f"Error queueing pet data: {e}")
     
-    # Check if we have a channel to publish to
-    if CHANNEL_ID:
+    if not photos_missing and (CHANNEL_ID or ADMIN_IDS):
         try:
-            # Get photo IDs
-            photos = [PetPhoto(**photo) for photo in pet_info_dict.get("photos", [])]
-            
-            if photos:
-                # If we have multiple photos, create a media group
-                if len(photos) > 1:
-                    media = [
-                        InputMediaPhoto(
-                            media=photos[0].file_id,
-                            caption=pet_info.format_for_publication()
-                        )
-                    ]
-                    
-                    # Add remaining photos without captions
-                    for photo in photos[1:]:
-                        media.append(
-                            InputMediaPhoto(media=photo.file_id)
-                        )
-                    
-                    # Send as media group
-                    await bot.send_media_group(
-                        chat_id=CHANNEL_ID,
-                        media=media
-                    )
-                else:
-                    # Send as single photo with caption
-                    await bot.send_photo(
-                        chat_id=CHANNEL_ID,
-                        photo=photos[0].file_id,
-                        caption=pet_info.format_for_publication()
-                    )
-                
-                # Notify user about successful publication
-                success_message = (
-                    "✅ Ваше объявление успешно опубликовано в канале!\n\n"
-                    "Спасибо за помощь животным! ❤️\n\n"
-                )
-                
-                # Add local save status
-                if local_save_success:
-                    success_message += f"📁 Данные сохранены локально в: {saved_dir}\n\n"
-                    
-                    # Add JSON data
-                    if pet_data_json:
-                        success_message += f"📋 Собранные данные:\n<pre>{pet_data_json}</pre>\n\n"
-                
-                success_message += "Чтобы создать новое объявление, используйте команду /start."
-                
-                await callback.message.edit_text(success_message, parse_mode="HTML")
-            else:
-                # If something went wrong with photos
-                await callback.message.edit_text(
-                    "⚠️ Произошла ошибка: не найдены фотографии для публикации.\n\n"
-                    "Пожалуйста, попробуйте создать объявление заново с помощью команды /start."
-                )
-        
-        except TelegramAPIError as e:
-            # Handle API errors
-            await callback.message.edit_text(
-                f"⚠️ Ошибка при публикации объявления: {str(e)}\n\n"
-                f"Пожалуйста, попробуйте позже или обратитесь к администратору."
+            await asyncio.to_thread(
+                get_persistence_queue().enqueue, "publish_pet", {"pet_id": pet_id, "pet_info": pet_info_json}
             )
-    else:
-        # If no channel ID is configured, send to admin or just confirm to user
-        if ADMIN_IDS:
-            # Send notification to admins
-            admin_message = (
-                "🆕 Новое объявление о найденном питомце!\n\n" +
-                pet_info.format_for_publication()
+        except Exception as e:
+            print(f"Error queueing publication: {e}")
+    
+    # Match the report against the subscribed areas and queue their notifications
+    location = pet_info.location
+    if location.latitude is not None and location.longitude is not None:
+        try:
+            recipients = matching_chats(
+                location.latitude, location.longitude, pet_info.pet_type, exclude_chat_id=pet_info.chat_id
             )
-            
-            for admin_id in ADMIN_IDS:
-                try:
-                    await bot.send_message(
-                        chat_id=admin_id,
-                        text=admin_message
-                    )
-                    
-                    # Send photos to admin
-                    photos = [PetPhoto(**photo) for photo in pet_info_dict.get("photos", [])]
-                    if photos:
-                        for photo in photos:
-                            await bot.send_photo(
-                                chat_id=admin_id,
-                                photo=photo.file_id
-                            )
-                except TelegramAPIError:
-                    # Silently ignore if cannot send to an admin
-                    pass
-        
-        # Notify user
-        success_message = (
-            "✅ Ваше объявление успешно отправлено!"
+            if recipients:
+                await asyncio.to_thread(
+                    get_persistence_queue().enqueue,
+                    "notify_subscribers",
+                    {"pet_id": pet_id, "pet_info": pet_info_json, "recipients": recipients}
+                )
+        except Exception as e:
+            print(f"Error queueing subscriber notifications: {e}")
+    
+    # Stop the button spinner before anything else is sent
+    await callback.answer()
+    
+    if photos_missing:
+        # If something went wrong with photos
+        await callback.message.edit_text(
+            "⚠️ Произошла ошибка: не найдены фотографии для публикации.\n\n"
+            "Пожалуйста, попробуйте создать объявление заново с помощью команды /start."
         )
-        
-        if ADMIN_IDS:
-            success_message += "\n\nПосле проверки администратором оно будет опубликовано."
+    else:
+        if CHANNEL_ID:
+            success_message = "✅ Ваше объявление принято и скоро появится в канале!"
+        else:
+            success_message = "✅ Ваше объявление успешно отправлено!"
+            if ADMIN_IDS:
+                success_message += "\n\nПосле проверки администратором оно будет опубликовано."
         
         success_message += "\nСпасибо за помощь животным! ❤️\n\n"
         
         # Add local save status
         if local_save_success:
-            success_message += f"📁 Данные сохранены локально"
-            
-            # Add JSON data
-            if pet_data_json:
-                success_message += f"📋 Собранные данные:\n<pre>{pet_data_json}</pre>\n\n"
+            success_message += f"📁 Данные приняты на сохранение (ID: {pet_id})\n\n"
         
         success_message += "Чтобы создать новое объявление, используйте команду /start."
         
@@ -194,7 +287,6 @@ async def confirm_submission(callback: CallbackQuery, state: FSMContext, bot: Bo
     
     # Clear state
     await state.clear()
-    await callback.answer()
 
 
 @router.callback_query(PetRegistration.confirming, F.data == "confirm:no")
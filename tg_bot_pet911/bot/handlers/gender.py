@@ -5,6 +5,7 @@ from aiogram.fsm.context import FSMContext
 from tg_bot_pet911.app.models import PetInfo
 from tg_bot_pet911.keyboards.inline import get_photos_keyboard
 from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils.fsm_patch import edit_data
 
 
 router = Router()
@@ -16,15 +17,9 @@ async def process_gender_selection(callback: CallbackQuery, state: FSMContext):
     # Extract gender from callback data
     gender = callback.data.split(":")[-1]
     
-    # Get current state data
-    data = await state.get_data()
-    
-    # Update pet_info with the gender
-    pet_info_dict = data.get("pet_info", {})
-    pet_info_dict["gender"] = gender
-    
-    # Save updated pet_info back to state
-    await state.update_data(pet_info=pet_info_dict)
+    # Update pet_info with the gender, only the field is written back to state
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["gender"] = gender
     
     # Map to human-readable gender
     gender_text = {
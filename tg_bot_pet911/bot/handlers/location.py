@@ -1,3 +1,4 @@
+import asyncio
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
@@ -5,6 +6,9 @@ from aiogram.fsm.context import FSMContext
 from tg_bot_pet911.app.models import PetLocation
 from tg_bot_pet911.keyboards.inline import get_photos_keyboard, get_location_keyboard
 from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils.districts import find_district
+from tg_bot_pet911.utils.fsm_patch import edit_data
+from tg_bot_pet911.utils.geocoder import geocode
 
 
 router = Router()
@@ -25,28 +29,24 @@ async def process_geo_location_request(callback: CallbackQuery, state: FSMContex
 @router.message(PetRegistration.entering_location, F.location)
 async def process_geo_location(message: Message, state: FSMContext):
     """Handle geolocation message."""
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
+    # Name the district the coordinates fall into
+    district = await asyncio.to_thread(find_district, message.location.latitude, message.location.longitude)
     
     # Create location object
     location = PetLocation(
         latitude=message.location.latitude,
-        longitude=message.location.longitude
+        longitude=message.location.longitude,
+        district=district.label() if district else None
     )
     
-    # Update pet_info with location
-    if "location" not in pet_info_dict:
-        pet_info_dict["location"] = {}
-    
-    pet_info_dict["location"] = location.model_dump()
-    
-    # Save updated pet_info back to state
-    await state.update_data(pet_info=pet_info_dict)
+    # Update pet_info with location, only the field is written back to state
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["location"] = location.model_dump()
     
     # Move to comment step
+    found = f"\n🏙️ Район: {location.district}" if location.district else ""
     await message.answer(
-        "✅ Геопозиция сохранена!\n\n"
+        f"✅ Геопозиция сохранена!{found}\n\n"
         "Теперь добавьте комментарий о питомце: особые приметы, поведение, наличие ошейника и т.д.\n"
         "Или напишите 'нет', если комментариев нет."
     )
@@ -78,25 +78,26 @@ async def process_manual_location(message: Message, state: FSMContext):
         )
         return
     
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
+    # Resolve coordinates from the local gazetteer, the address is kept as entered
+    result = await asyncio.to_thread(geocode, address)
+    district = await asyncio.to_thread(find_district, result.latitude, result.longitude) if result else None
     
     # Create location object
-    location = PetLocation(address=address)
-    
-    # Update pet_info with location
-    if "location" not in pet_info_dict:
-        pet_info_dict["location"] = {}
-    
-    pet_info_dict["location"] = location.model_dump()
+    location = PetLocation(
+        address=address,
+        latitude=result.latitude if result else None,
+        longitude=result.longitude if result else None,
+        district=district.label() if district else None
+    )
     
-    # Save updated pet_info back to state
-    await state.update_data(pet_info=pet_info_dict)
+    # Update pet_info with location, only the field is written back to state
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["location"] = location.model_dump()
     
     # Move to comment step
+    found = f"\n📍 Найдено на карте: {result.matched}" if result else ""
     await message.answer(
-        f"✅ Адрес '{address}' сохранен!\n\n"
+        f"✅ Адрес '{address}' сохранен!{found}\n\n"
         f"Теперь добавьте комментарий о питомце: особые приметы, поведение, наличие ошейника и т.д.\n"
         f"Или напишите 'нет', если комментариев нет."
     )
@@ -108,14 +109,10 @@ async def process_manual_location(message: Message, state: FSMContext):
 @router.callback_query(PetRegistration.entering_location, F.data == "back")
 async def back_to_photos(callback: CallbackQuery, state: FSMContext):
     """Return to photo upload."""
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
-    
     # Clear location if it was set
-    if "location" in pet_info_dict:
-        pet_info_dict["location"] = {}
-        await state.update_data(pet_info=pet_info_dict)
+    async with edit_data(state) as pet_info_dict:
+        if "location" in pet_info_dict:
+            pet_info_dict["location"] = {}
     
     # Move back to photo upload
     await callback.message.edit_text(
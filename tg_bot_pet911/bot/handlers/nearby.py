@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+
+from tg_bot_pet911.config.config import NEARBY_RESULTS, NEARBY_MAX_DISTANCE_KM, NEARBY_MAX_AGE_DAYS
+from tg_bot_pet911.states.pet_states import NearbySearch
+from tg_bot_pet911.utils.catalog import CREATED_AT_FORMAT, get_catalog
+from tg_bot_pet911.utils.geo_index import get_geo_index
+
+
+router = Router()
+
+PET_TYPES = {
+    "dog": "🐶 Собака",
+    "cat": "🐱 Кошка",
+    "other": "🐾 Другое животное"
+}
+
+GENDERS = {
+    "male": "♂️",
+    "female": "♀️",
+    "unknown": "❓"
+}
+
+
+def find_nearby_reports(latitude: float, longitude: float) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Find the closest recent reports around a point.
+
+    Returns:
+        List of (distance in km, pet record), closest first
+    """
+    since = (datetime.now() - timedelta(days=NEARBY_MAX_AGE_DAYS)).strftime(CREATED_AT_FORMAT)
+    nearest = get_geo_index().nearest(
+        latitude, longitude, k=NEARBY_RESULTS, max_distance_km=NEARBY_MAX_DISTANCE_KM, since=since
+    )
+
+    catalog = get_catalog()
+    reports = []
+    for distance, point in nearest:
+        record = catalog.get_record(point.pet_id)
+        if record:
+            reports.append((distance, record))
+    return reports
+
+
+def format_nearby_reports(reports: List[Tuple[float, Dict[str, Any]]]) -> str:
+    """Format found reports for the reply."""
+    parts = [f"🔎 Найдено объявлений рядом: {len(reports)}\n"]
+    for number, (distance, record) in enumerate(reports, start=1):
+        distance_str = f"{distance * 1000:.0f} м" if distance < 1 else f"{distance:.1f} км"
+        parts.append(
+            f"{number}. {PET_TYPES.get(record.get('pet_type'), '🐾 Питомец')} "
+            f"{GENDERS.get(record.get('gender'), '')} — {distance_str}, {record.get('created_at', '')[:16]}"
+        )
+        location = record.get("location") or {}
+        if location.get("address"):
+            parts.append(f"   📍 {location['address']}")
+        if record.get("comment"):
+            parts.append(f"   💬 {record['comment'][:100]}")
+        parts.append(f"   🆔 {record['id']}")
+    return "\n".join(parts)
+
+
+@router.message(Command("nearby"))
+async def cmd_nearby(message: Message, state: FSMContext):
+    """Handle /nearby command."""
+    await message.answer(
+        "📍 Отправьте геопозицию, и я покажу ближайшие объявления о найденных питомцах.\n\n"
+        "Для этого нажмите на скрепку (📎) в меню ввода и выберите 'Геопозиция'.\n"
+        "Или введите /cancel для отмены."
+    )
+    # Remember the step the user was on, an unfinished registration continues afterwards
+    previous_state = await state.get_state()
+    if previous_state not in NearbySearch:
+        await state.update_data(nearby_return_state=previous_state)
+    await state.set_state(NearbySearch.waiting_for_location)
+
+
+@router.message(NearbySearch.waiting_for_location, F.location)
+async def process_nearby_location(message: Message, state: FSMContext):
+    """Reply with the reports closest to the shared location."""
+    reports = await asyncio.to_thread(
+        find_nearby_reports, message.location.latitude, message.location.longitude
+    )
+
+    if not reports:
+        await message.answer(
+            f"🤷 За последние {NEARBY_MAX_AGE_DAYS} дней в радиусе {NEARBY_MAX_DISTANCE_KM:g} км "
+            f"объявлений не найдено."
+        )
+    else:
+        await message.answer(format_nearby_reports(reports))
+
+    # Back to where the user was before /nearby, keeping any unfinished registration data
+    data = await state.get_data()
+    previous_state = data.pop("nearby_return_state", None)
+    await state.set_state(previous_state)
+    await state.set_data(data)
+
+
+@router.message(NearbySearch.waiting_for_location)
+async def process_nearby_not_location(message: Message, state: FSMContext):
+    """Remind that a location is expected."""
+    await message.answer(
+        "⚠️ Для поиска нужна геопозиция. Отправьте её через скрепку (📎) или введите /cancel."
+    )
@@ -6,6 +6,7 @@ from tg_bot_pet911.app.models import PetPhoto, PetInfo
 from tg_bot_pet911.keyboards.inline import get_photos_keyboard, get_location_keyboard, get_gender_keyboard
 from tg_bot_pet911.states.pet_states import PetRegistration
 from tg_bot_pet911.config.config import MAX_PHOTOS
+from tg_bot_pet911.utils.fsm_patch import edit_data
 
 
 router = Router()
@@ -14,10 +15,6 @@ router = Router()
 @router.message(PetRegistration.uploading_photos, F.photo)
 async def process_photo_upload(message: Message, state: FSMContext):
     """Handle photo uploads."""
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
-    
     # Get photo from message
     photo = message.photo[-1]  # Get the largest version of the photo
     
@@ -27,11 +24,17 @@ async def process_photo_upload(message: Message, state: FSMContext):
         file_unique_id=photo.file_unique_id
     )
     
-    # Add to photos list in pet_info
-    photos = pet_info_dict.get("photos", [])
+    # Only the added photo is written back to state
+    async with edit_data(state) as pet_info_dict:
+        photos = pet_info_dict.setdefault("photos", [])
+        if len(photos) < MAX_PHOTOS:
+            photos.append(pet_photo.model_dump())
+            added = True
+        else:
+            added = False
     
     # Check if we've reached maximum photos
-    if len(photos) >= MAX_PHOTOS:
+    if not added:
         await message.answer(
             f"⚠️ Вы уже загрузили максимальное количество фото ({MAX_PHOTOS}).\n"
             f"Нажмите 'Завершить загрузку', чтобы перейти к следующему шагу.",
@@ -39,13 +42,6 @@ async def process_photo_upload(message: Message, state: FSMContext):
         )
         return
     
-    # Add new photo
-    photos.append(pet_photo.model_dump())
-    pet_info_dict["photos"] = photos
-    
-    # Save updated pet_info back to state
-    await state.update_data(pet_info=pet_info_dict)
-    
     # Send confirmation
     await message.answer(
         f"✅ Фото {len(photos)}/{MAX_PHOTOS} загружено!\n\n"
@@ -82,13 +78,9 @@ async def complete_photo_upload(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(PetRegistration.uploading_photos, F.data == "back")
 async def back_to_gender(callback: CallbackQuery, state: FSMContext):
     """Return to gender selection."""
-    # Get current state data
-    data = await state.get_data()
-    pet_info_dict = data.get("pet_info", {})
-    
     # Clear any photos that might have been uploaded
-    pet_info_dict["photos"] = []
-    await state.update_data(pet_info=pet_info_dict)
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["photos"] = []
     
     # Move back to gender selection
     await callback.message.edit_text(
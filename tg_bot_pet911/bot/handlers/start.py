@@ -35,9 +35,6 @@ async def process_pet_type(callback: CallbackQuery, state: FSMContext):
     # Extract pet type from callback data
     pet_type = callback.data.split(":")[-1]
     
-    # Save to state
-    await state.update_data(pet_type=pet_type)
-    
     # Create initial PetInfo object
     user = callback.from_user
     pet_info = PetInfo(
@@ -0,0 +1,135 @@
+import asyncio
+
+from aiogram import Router, F
+from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+
+from tg_bot_pet911.config.config import SUBSCRIPTION_RADII_KM, SUBSCRIPTION_MAX_PER_USER
+from tg_bot_pet911.keyboards.inline import get_subscription_radius_keyboard, get_subscription_type_keyboard
+from tg_bot_pet911.states.pet_states import SubscriptionSetup
+from tg_bot_pet911.utils.subscriptions import get_subscription_store, subscribe, unsubscribe
+
+
+router = Router()
+
+PET_TYPES = {
+    "dog": "собаках",
+    "cat": "кошках",
+    "other": "других животных"
+}
+
+# Data of the /subscribe flow, removed when it ends
+SUBSCRIPTION_KEYS = ("subscription", "subscription_return_state")
+
+
+@router.message(Command("subscribe"))
+async def cmd_subscribe(message: Message, state: FSMContext):
+    """Handle /subscribe command."""
+    subscriptions = await asyncio.to_thread(get_subscription_store().list_user, message.from_user.id)
+    if len(subscriptions) >= SUBSCRIPTION_MAX_PER_USER:
+        await message.answer(
+            f"⚠️ У вас уже {len(subscriptions)} подписок, это максимум.\n"
+            "Используйте /unsubscribe, чтобы удалить их."
+        )
+        return
+
+    await message.answer(
+        "🔔 Я сообщу вам, когда рядом найдут питомца.\n\n"
+        "📍 Отправьте геопозицию центра области, где вы ищете питомца.\n"
+        "Для этого нажмите на скрепку (📎) в меню ввода и выберите 'Геопозиция'.\n"
+        "Или введите /cancel для отмены."
+    )
+    # Remember the step the user was on, an unfinished registration continues afterwards
+    previous_state = await state.get_state()
+    if previous_state not in SubscriptionSetup:
+        await state.update_data(subscription_return_state=previous_state)
+    await state.set_state(SubscriptionSetup.waiting_for_location)
+
+
+@router.message(SubscriptionSetup.waiting_for_location, F.location)
+async def process_subscription_location(message: Message, state: FSMContext):
+    """Save the center of the area and ask for the radius."""
+    await state.update_data(subscription={
+        "latitude": message.location.latitude,
+        "longitude": message.location.longitude
+    })
+    await message.answer(
+        "📏 В каком радиусе от этой точки искать?",
+        reply_markup=get_subscription_radius_keyboard(SUBSCRIPTION_RADII_KM)
+    )
+    await state.set_state(SubscriptionSetup.selecting_radius)
+
+
+@router.message(SubscriptionSetup.waiting_for_location)
+async def process_subscription_not_location(message: Message, state: FSMContext):
+    """Remind that a location is expected."""
+    await message.answer(
+        "⚠️ Для подписки нужна геопозиция. Отправьте её через скрепку (📎) или введите /cancel."
+    )
+
+
+@router.callback_query(SubscriptionSetup.selecting_radius, F.data.startswith("sub_radius:"))
+async def process_subscription_radius(callback: CallbackQuery, state: FSMContext):
+    """Save the radius and ask for the pet type."""
+    # Only the radii offered on the keyboard, a forged one could cover the whole grid
+    radii = {f"{radius:g}": radius for radius in SUBSCRIPTION_RADII_KM}
+    radius_km = radii.get(callback.data.split(":")[-1])
+    if radius_km is None:
+        await callback.answer("⚠️ Выберите радиус на клавиатуре.", show_alert=True)
+        return
+
+    data = await state.get_data()
+    subscription = data.get("subscription", {})
+    subscription["radius_km"] = radius_km
+    await state.update_data(subscription=subscription)
+
+    await callback.message.edit_text(
+        f"📏 Радиус: {radius_km:g} км.\n\nО каких животных сообщать?",
+        reply_markup=get_subscription_type_keyboard()
+    )
+    await state.set_state(SubscriptionSetup.selecting_pet_type)
+    await callback.answer()
+
+
+@router.callback_query(SubscriptionSetup.selecting_pet_type, F.data.startswith("sub_type:"))
+async def process_subscription_type(callback: CallbackQuery, state: FSMContext):
+    """Save the subscription."""
+    pet_type = callback.data.split(":")[-1]
+    if pet_type != "any" and pet_type not in PET_TYPES:
+        await callback.answer("⚠️ Выберите животное на клавиатуре.", show_alert=True)
+        return
+    pet_type = None if pet_type == "any" else pet_type
+
+    data = await state.get_data()
+    subscription = data.get("subscription", {})
+    await asyncio.to_thread(
+        subscribe,
+        callback.from_user.id,
+        callback.message.chat.id,
+        pet_type,
+        subscription["latitude"],
+        subscription["longitude"],
+        subscription["radius_km"]
+    )
+
+    await callback.message.edit_text(
+        f"✅ Подписка оформлена! Я сообщу о найденных "
+        f"{PET_TYPES.get(pet_type, 'животных')} в радиусе {subscription['radius_km']:g} км.\n\n"
+        f"Чтобы отписаться, используйте команду /unsubscribe."
+    )
+    # Back to where the user was before /subscribe, keeping the rest of the data
+    await state.set_state(data.get("subscription_return_state"))
+    await state.set_data({key: value for key, value in data.items() if key not in SUBSCRIPTION_KEYS})
+    await callback.answer()
+
+
+@router.message(Command("unsubscribe"))
+async def cmd_unsubscribe(message: Message, state: FSMContext):
+    """Handle /unsubscribe command."""
+    removed = await asyncio.to_thread(unsubscribe, message.from_user.id)
+
+    if removed:
+        await message.answer(f"🔕 Подписки удалены: {removed}.")
+    else:
+        await message.answer("🤔 У вас нет подписок. Используйте /subscribe, чтобы оформить подписку.")
@@ -0,0 +1,275 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from tg_bot_pet911.config.config import (
+    CHANNEL_ID, OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE_PER_MINUTE,
+    OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES
+)
+
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Methods that post or change messages in a chat and count against Telegram's flood limits
+LIMITED_METHOD_PREFIXES = ("Send", "Forward", "Copy", "Edit")
+
+
+class Priority(IntEnum):
+    """Outbound message classes, lower values are sent first."""
+    USER = 0          # Replies to the user the bot is talking to
+    CHANNEL = 1       # Posts in the publication channel
+    NOTIFICATION = 2  # Admin and subscriber notifications
+
+
+# Priority set by the code sending the message, see outbound_priority()
+_priority: contextvars.ContextVar[Optional[Priority]] = contextvars.ContextVar("outbound_priority", default=None)
+
+
+@contextmanager
+def outbound_priority(priority: Priority) -> Iterator[None]:
+    """Send the messages of the block (and of tasks started in it) with the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Token bucket that may go into debt, so a media group larger than the burst still gets through."""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        # Telegram asked to wait until this moment (retry_after)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until ``cost`` messages may be sent, 0 if they may be sent now."""
+        self._refill(now)
+        needed = min(cost, self.capacity)
+        return max(0.0, self.blocked_until - now, (needed - self.tokens) / self.rate)
+
+    def take(self, cost: float):
+        self.tokens -= cost
+
+    def is_idle(self, now: float) -> bool:
+        """A full, unblocked bucket is the same as a new one and can be dropped."""
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Session middleware that paces messages to stay within Telegram's flood limits.
+
+    Every message waits for a token from the global bucket and from the
+    bucket of its chat (private chats and groups have different limits).
+    When several messages wait, the one with the highest priority that its
+    chat allows goes first, messages of one class and chat keep their order.
+    A 429 response blocks the chat for ``retry_after`` seconds and the
+    message is queued again, up to ``max_retries`` times.
+    Other requests (getFile, answerCallbackQuery, ...) are not paced.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = OUTBOUND_GLOBAL_RATE,
+        chat_rate: float = OUTBOUND_CHAT_RATE,
+        group_rate: float = OUTBOUND_GROUP_RATE_PER_MINUTE / 60,
+        chat_burst: float = OUTBOUND_CHAT_BURST,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = TokenBucket(global_rate, max(1.0, global_rate), clock())
+        self._chats: Dict[ChatId, TokenBucket] = {}
+        # Waiting messages: (priority, arrival, chat id, cost, future)
+        self._waiting: List[Tuple[int, int, ChatId, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump: Optional[asyncio.Task] = None
+        self._last_eviction = 0.0
+        self.sent = 0
+        self.retried = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(LIMITED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = self.classify(chat_id)
+        cost = len(getattr(method, "media", None) or ()) or 1
+        attempt = 0
+        while True:
+            await self.acquire(chat_id, priority, cost)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retried += 1
+                logger.warning(
+                    f"Flood limit in chat {chat_id}, retrying {type(method).__name__} in {e.retry_after} s"
+                )
+                self._block(chat_id, e.retry_after)
+                continue
+            self.sent += 1
+            return response
+
+    @staticmethod
+    def classify(chat_id: ChatId) -> Priority:
+        """Priority of a message: set by the sender, channel posts, otherwise a user reply."""
+        priority = _priority.get()
+        if priority is not None:
+            return priority
+        if CHANNEL_ID and str(chat_id) == str(CHANNEL_ID):
+            return Priority.CHANNEL
+        return Priority.USER
+
+    async def acquire(self, chat_id: ChatId, priority: Priority = Priority.USER, cost: int = 1):
+        """Wait until ``cost`` messages may be sent to the chat."""
+        self._ensure_pump()
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((int(priority), next(self._arrivals), chat_id, cost, future))
+        self._wakeup.set()
+        await future
+
+    def queue_depth(self) -> Dict[str, int]:
+        """Messages waiting to be sent by priority class."""
+        depth = {priority.name.lower(): 0 for priority in Priority}
+        for priority, _, _, _, future in self._waiting:
+            if not future.done():
+                depth[Priority(priority).name.lower()] += 1
+        return depth
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, sent messages, flood-limit retries and chats with a bucket."""
+        return {"queued": self.queue_depth(), "sent": self.sent, "retried": self.retried, "chats": len(self._chats)}
+
+    async def close(self):
+        """Stop the scheduler, messages still waiting are cancelled."""
+        if self._pump is not None:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+            self._pump = None
+        for _, _, _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+
+    def _bucket(self, chat_id: ChatId, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Groups and channels have negative ids or @usernames and a lower limit
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    def _block(self, chat_id: ChatId, seconds: float):
+        now = self._clock()
+        bucket = self._bucket(chat_id, now)
+        bucket.blocked_until = max(bucket.blocked_until, now + seconds)
+
+    def _ensure_pump(self):
+        loop = asyncio.get_running_loop()
+        if self._pump is None or self._pump.done() or self._pump.get_loop() is not loop:
+            # Messages queued on a loop that is gone can never be sent
+            self._waiting = [entry for entry in self._waiting if entry[4].get_loop() is loop]
+            self._wakeup = asyncio.Event()
+            self._pump = loop.create_task(self._run(), name="outbound-scheduler")
+
+    async def _run(self):
+        while True:
+            delay = self._grant()
+            self._wakeup.clear()
+            if delay is not None and delay <= 0:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self) -> Optional[float]:
+        """
+        Let through every message that may be sent now.
+
+        Returns:
+            Seconds until the next waiting message may be sent, None if nothing waits
+        """
+        while True:
+            now = self._clock()
+            self._evict(now)
+            next_delay = None
+            for entry in sorted(self._waiting, key=lambda entry: entry[:2]):
+                _, _, chat_id, cost, future = entry
+                if future.done():
+                    self._waiting.remove(entry)
+                    continue
+                global_wait = self._global.wait_time(cost, now)
+                if global_wait > 0:
+                    # Lower classes may not overtake this message for the shared budget
+                    return global_wait if next_delay is None else min(next_delay, global_wait)
+                bucket = self._bucket(chat_id, now)
+                chat_wait = bucket.wait_time(cost, now)
+                if chat_wait > 0:
+                    next_delay = chat_wait if next_delay is None else min(next_delay, chat_wait)
+                    continue
+                self._global.take(cost)
+                bucket.take(cost)
+                self._waiting.remove(entry)
+                future.set_result(None)
+                break
+            else:
+                return next_delay
+
+    def _evict(self, now: float):
+        """Drop the buckets of chats that have been quiet long enough to be full again."""
+        if now - self._last_eviction < 1.0:
+            return
+        self._last_eviction = now
+        waiting = {entry[2] for entry in self._waiting}
+        for chat_id in [chat_id for chat_id, bucket in self._chats.items() if bucket.is_idle(now)]:
+            if chat_id not in waiting:
+                del self._chats[chat_id]
+
+
+# Shared scheduler instance, installed on the bot session in main
+_outbound_scheduler: Optional[OutboundScheduler] = None
+
+
+def get_outbound_scheduler() -> OutboundScheduler:
+    """Get the shared outbound scheduler."""
+    global _outbound_scheduler
+    if _outbound_scheduler is None:
+        _outbound_scheduler = OutboundScheduler()
+    return _outbound_scheduler
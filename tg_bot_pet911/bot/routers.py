@@ -0,0 +1,89 @@
+import importlib
+import logging
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from aiogram import Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message
+
+from tg_bot_pet911.config.config import ENABLE_TEST_ROUTER
+
+
+logger = logging.getLogger(__name__)
+
+
+class RouterSpec(NamedTuple):
+    """A router of the registry, referenced by import path so it is only imported when used."""
+    path: str                                # "package.module:attribute"
+    enabled: Callable[[], bool] = lambda: True
+    # Commands that import the module on first use instead of at startup
+    lazy_commands: Optional[List[str]] = None
+
+
+# Routers in the order they are included: the cancel handler comes first to work from any state,
+# then the commands that can interrupt a registration, before its steps take any text as input
+ROUTERS: List[RouterSpec] = [
+    RouterSpec("tg_bot_pet911.bot.handlers.cancel:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.nearby:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.subscribe:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.start:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.gender:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.photo:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.location:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.comment:router"),
+    RouterSpec("tg_bot_pet911.bot.handlers.confirm:router"),
+    # /test runs the test suite, which needs pytest and every test module
+    RouterSpec(
+        "tg_bot_pet911.tests.test_all_handlers:cmd_test",
+        enabled=lambda: ENABLE_TEST_ROUTER,
+        lazy_commands=["test"]
+    ),
+]
+
+
+def import_object(path: str) -> Any:
+    """Import ``package.module:attribute``."""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def lazy_command_router(path: str, commands: List[str]) -> Router:
+    """
+    Router that answers the commands with a handler imported on first use.
+
+    Args:
+        path: Import path of a ``handler(message, state)`` coroutine
+        commands: Commands the handler answers
+    """
+    router = Router(name=f"lazy:{path}")
+    handler = None
+
+    @router.message(Command(*commands))
+    async def run_lazy_command(message: Message, state: FSMContext):
+        nonlocal handler
+        if handler is None:
+            logger.info(f"Loading {path} for /{message.text.split()[0].lstrip('/')}")
+            handler = import_object(path)
+        return await handler(message, state)
+
+    return router
+
+
+def include_routers(dp: Dispatcher, routers: List[RouterSpec] = ROUTERS) -> List[str]:
+    """
+    Include the enabled routers of the registry in the dispatcher.
+
+    Returns:
+        Import paths of the included routers
+    """
+    included = []
+    for spec in routers:
+        if not spec.enabled():
+            continue
+        if spec.lazy_commands:
+            dp.include_router(lazy_command_router(spec.path, spec.lazy_commands))
+        else:
+            dp.include_router(import_object(spec.path))
+        included.append(spec.path)
+    return included
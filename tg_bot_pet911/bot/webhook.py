@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from tg_bot_pet911.config.config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, MAX_CONCURRENT_UPDATES
+)
+from tg_bot_pet911.utils.shutdown import get_graceful_shutdown
+
+
+logger = logging.getLogger(__name__)
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that answers Telegram at once and processes updates in the background.
+
+    At most ``max_concurrent`` updates are processed at the same time, the
+    rest wait for a free slot, so a burst cannot start an unbounded number
+    of handlers at once.
+
+    Wraps aiogram's private ``_background_feed_update``, which is why
+    requirements.txt pins aiogram below the next minor release.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrent: int = MAX_CONCURRENT_UPDATES, **kwargs: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        # A shutdown also waits for the updates still waiting for a slot
+        get_graceful_shutdown().track_current_task()
+        async with self._semaphore:
+            await super()._background_feed_update(bot, update)
+
+
+def create_webhook_app(
+    dp: Dispatcher,
+    bot: Bot,
+    secret_token: Optional[str],
+    path: str = WEBHOOK_PATH,
+    max_concurrent: int = MAX_CONCURRENT_UPDATES
+) -> web.Application:
+    """
+    Create the aiohttp application serving webhook updates.
+
+    The dispatcher's startup and shutdown hooks run with the application's.
+    The shutdown hooks run before the handler closes the bot session, so
+    updates drained on shutdown can still send messages.
+    """
+    app = web.Application()
+    setup_application(app, dp, bot=bot)
+    handler = LimitedRequestHandler(dp, bot, max_concurrent=max_concurrent, secret_token=secret_token)
+    handler.register(app, path=path)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Serve updates through a webhook until SIGINT or SIGTERM."""
+    if not WEBHOOK_URL:
+        logger.error("No webhook URL provided. Set the WEBHOOK_URL environment variable.")
+        return
+
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        # A random secret only works for a single instance, every start replaces it
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET is not set, using a random secret for this run.")
+
+    app = create_webhook_app(dp, bot, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook server listening on {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await bot.set_webhook(
+            f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+            secret_token=secret_token,
+            max_connections=min(100, MAX_CONCURRENT_UPDATES)
+        )
+        logger.info("Bot started successfully!")
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        # Stops accepting requests, runs the dispatcher shutdown hooks (draining
+        # the updates in flight) and closes the bot session
+        await runner.cleanup()
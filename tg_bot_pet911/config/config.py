@@ -21,8 +21,140 @@ CHANNEL_ID = os.getenv("CHANNEL_ID")
 # Main notification ID - will always receive notifications for new pet entries
 NOTIFICATION_ID = 6629163755
 
+# FSM storage: "memory" (single process, lost on restart), "redis" (shared by all workers)
+# or "tiered" (Redis with hot conversations cached in each worker)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+
 # Redis connection for FSM
 REDIS_DSN = os.getenv("REDIS_DSN", "redis://localhost:6379/0")
 
+# Redis pool: connections per process, seconds to wait for a free one, timeouts in seconds
+# and how often idle connections are checked
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "5"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+
+# Prefix of all FSM keys, the bot id is added after it
+REDIS_KEY_PREFIX = os.getenv("REDIS_KEY_PREFIX", "fsm")
+
+# Expire conversations idle for this many seconds (a day by default), 0 keeps them forever
+FSM_TTL_SECONDS = int(os.getenv("FSM_TTL_SECONDS", "86400"))
+
+# Append expired drafts of the memory storage to data/abandoned_drafts.jsonl before dropping them
+FSM_ARCHIVE_ABANDONED = os.getenv("FSM_ARCHIVE_ABANDONED", "0") == "1"
+
+# Format of conversation data in Redis: "msgpack" (compact, JSON if msgpack is missing) or "json"
+FSM_SERIALIZER = os.getenv("FSM_SERIALIZER", "msgpack")
+
+# Handle the updates of one chat one at a time (across all workers with Redis), other chats in parallel
+FSM_EVENT_ISOLATION = os.getenv("FSM_EVENT_ISOLATION", "1") == "1"
+
+# Tiered storage: conversations cached per worker, and milliseconds writes wait to go to Redis together
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_WRITE_BEHIND_MS = int(os.getenv("FSM_WRITE_BEHIND_MS", "50"))
+
 # Other settings
-MAX_PHOTOS = 5  # Maximum number of photos for a pet 
\ No newline at end of file
+MAX_PHOTOS = 5  # Maximum number of photos for a pet
+
+# Photo downloads running at once across all submissions (shared by every save)
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "8"))
+
+# Store photos once by content and only link them into pet directories
+PHOTO_STORE_ENABLED = os.getenv("PHOTO_STORE_ENABLED", "1") == "1"
+
+# Background workers saving confirmed submissions, and attempts before a job is given up
+PERSISTENCE_WORKERS = int(os.getenv("PERSISTENCE_WORKERS", "2"))
+PERSISTENCE_MAX_ATTEMPTS = int(os.getenv("PERSISTENCE_MAX_ATTEMPTS", "5"))
+# Seconds a claimed job stays with its worker without a heartbeat before another process may take it over
+PERSISTENCE_LEASE_SECONDS = float(os.getenv("PERSISTENCE_LEASE_SECONDS", "60"))
+
+# Pet record storage backend: "files" (one directory per pet) or "log" (append-only segments)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "files")
+
+# Image derivatives: worker processes, square thumbnail sizes and the medium JPEG size/quality
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+THUMBNAIL_SIZES: List[int] = [
+    int(size.strip())
+    for size in os.getenv("THUMBNAIL_SIZES", "128,320").split(",")
+    if size.strip()
+]
+MEDIUM_SIZE = int(os.getenv("MEDIUM_SIZE", "1280"))
+MEDIUM_QUALITY = int(os.getenv("MEDIUM_QUALITY", "85"))
+
+# Photos whose perceptual hashes differ in at most this many of 64 bits are likely duplicates
+DUPLICATE_HASH_RADIUS = int(os.getenv("DUPLICATE_HASH_RADIUS", "10"))
+
+# Durability of pet JSON writes: "none", "atomic", "fsync" or "group" (writes synced together
+# over a short window, see utils/durable.py)
+WRITE_DURABILITY = os.getenv("WRITE_DURABILITY", "group")
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "10"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))
+
+# Pet directory layout: "sharded" (YYYY/MM/DD/<id prefix>/) or "flat" (all in data/pets)
+PETS_LAYOUT = os.getenv("PETS_LAYOUT", "sharded")
+
+# Log backend: rotate segments at this size, compact after this many sealed segments
+LOG_SEGMENT_MAX_BYTES = int(os.getenv("LOG_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024)))
+LOG_COMPACT_SEGMENTS = int(os.getenv("LOG_COMPACT_SEGMENTS", "8"))
+
+# /nearby: number of reports returned, their maximum distance and age
+NEARBY_RESULTS = int(os.getenv("NEARBY_RESULTS", "5"))
+NEARBY_MAX_DISTANCE_KM = float(os.getenv("NEARBY_MAX_DISTANCE_KM", "20"))
+NEARBY_MAX_AGE_DAYS = int(os.getenv("NEARBY_MAX_AGE_DAYS", "30"))
+
+# Offline geocoder: gazetteer CSV (defaults to data/gazetteer.csv), cached addresses and allowed typos
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH")
+GEOCODER_CACHE_SIZE = int(os.getenv("GEOCODER_CACHE_SIZE", "4096"))
+GEOCODER_MAX_TYPOS = int(os.getenv("GEOCODER_MAX_TYPOS", "2"))
+
+# District boundaries GeoJSON (defaults to data/districts.geojson), cached lookups and
+# the number of decimals coordinates are rounded to for the cache (4 is about 10 m)
+DISTRICTS_PATH = os.getenv("DISTRICTS_PATH")
+DISTRICT_CACHE_SIZE = int(os.getenv("DISTRICT_CACHE_SIZE", "16384"))
+DISTRICT_CACHE_PRECISION = int(os.getenv("DISTRICT_CACHE_PRECISION", "4"))
+
+# /subscribe: radius choices, subscriptions per user and notifications sent at once
+SUBSCRIPTION_RADII_KM: List[float] = [
+    float(radius.strip())
+    for radius in os.getenv("SUBSCRIPTION_RADII_KM", "1,3,5,10").split(",")
+    if radius.strip()
+]
+SUBSCRIPTION_MAX_PER_USER = int(os.getenv("SUBSCRIPTION_MAX_PER_USER", "5"))
+SUBSCRIPTION_NOTIFY_CONCURRENCY = int(os.getenv("SUBSCRIPTION_NOTIFY_CONCURRENCY", "20"))
+
+# Seconds between checks for reports and subscriptions saved by other workers, which are then
+# added to this worker's /nearby, duplicate and subscription indexes; 0 turns the checks off
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", "5"))
+
+# How updates are received: "polling" or "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+
+# Updates processed at the same time, in both run modes
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+# Webhook mode: public base URL Telegram posts to, the path served, the secret token Telegram
+# sends back in every request (required with several instances) and the local address to listen on
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Outbound flood limits: messages per second for the whole bot and per private chat, per minute
+# for groups and channels, messages a quiet chat may get at once, and retries after a 429
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_GROUP_RATE_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_RATE_PER_MINUTE", "20"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# Answer /test by running the test suite (needs pytest, imported on the first /test only)
+ENABLE_TEST_ROUTER = os.getenv("ENABLE_TEST_ROUTER", "0") == "1"
+
+# Log import times and the time to the first handled update at startup
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+
+# Seconds a shutdown waits for updates being handled and running jobs before cancelling them
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "25"))
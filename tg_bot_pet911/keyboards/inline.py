@@ -1,3 +1,4 @@
+from typing import List
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
@@ -74,4 +75,33 @@ def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     builder.row(
         InlineKeyboardButton(text="🔄 Начать заново", callback_data="confirm:restart"),
     )
-    return builder.as_markup() 
\ No newline at end of file
+    return builder.as_markup() 
+
+def get_subscription_radius_keyboard(radii: List[float]) -> InlineKeyboardMarkup:
+    """Keyboard for selecting the subscription radius."""
+    builder = InlineKeyboardBuilder()
+    builder.row(*[
+        InlineKeyboardButton(text=f"{radius:g} км", callback_data=f"sub_radius:{radius:g}")
+        for radius in radii
+    ])
+    builder.row(
+        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"),
+    )
+    return builder.as_markup()
+
+
+def get_subscription_type_keyboard() -> InlineKeyboardMarkup:
+    """Keyboard for selecting the pet type of a subscription."""
+    builder = InlineKeyboardBuilder()
+    builder.row(
+        InlineKeyboardButton(text="🐶 Собака", callback_data="sub_type:dog"),
+        InlineKeyboardButton(text="🐱 Кошка", callback_data="sub_type:cat"),
+    )
+    builder.row(
+        InlineKeyboardButton(text="🐾 Другое", callback_data="sub_type:other"),
+        InlineKeyboardButton(text="🔔 Любые", callback_data="sub_type:any"),
+    )
+    builder.row(
+        InlineKeyboardButton(text="❌ Отмена", callback_data="cancel"),
+    )
+    return builder.as_markup()
@@ -1,13 +1,29 @@
 import asyncio
 import logging
 import sys
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.redis import RedisStorage
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from tg_bot_pet911.config.config import BOT_TOKEN, REDIS_DSN
-from tg_bot_pet911.bot.handlers import start, gender, photo, location, comment, confirm, cancel
-from tg_bot_pet911.tests.test_all_handlers import router as test_router
+from tg_bot_pet911.config.config import (
+    BOT_TOKEN, RUN_MODE, MAX_CONCURRENT_UPDATES, STARTUP_PROFILE, INDEX_REFRESH_SECONDS
+)
+from tg_bot_pet911.utils.startup_profile import startup_profiler
+
+# Time the imports below when profiling the startup
+if STARTUP_PROFILE:
+    startup_profiler.install()
+
+from aiogram import Bot, Dispatcher
+from tg_bot_pet911.bot.outbound import get_outbound_scheduler
+from tg_bot_pet911.bot.routers import include_routers
+from tg_bot_pet911.bot.webhook import run_webhook
+from tg_bot_pet911.utils.districts import get_district_index
+from tg_bot_pet911.utils.fsm_storage import create_event_isolation, create_fsm_storage
+from tg_bot_pet911.utils.geo_index import get_geo_index, refresh_geo_index
+from tg_bot_pet911.utils.geocoder import get_geocoder
+from tg_bot_pet911.utils.images import shutdown_image_executor
+from tg_bot_pet911.utils.job_queue import get_persistence_queue
+from tg_bot_pet911.utils.phash import refresh_duplicate_index
+from tg_bot_pet911.utils.shutdown import get_graceful_shutdown
+from tg_bot_pet911.utils.subscriptions import get_subscription_index, refresh_subscription_index
 
 
 # Configure logging
@@ -23,6 +39,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def refresh_indexes() -> int:
+    """Add what other workers saved to this worker's in-memory indexes."""
+    return refresh_geo_index() + refresh_duplicate_index() + refresh_subscription_index()
+
+
+async def refresh_indexes_forever(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(refresh_indexes)
+        except Exception as e:
+            logger.error(f"Failed to refresh the indexes: {e}")
+
+
 async def main():
     """Main function to start the bot."""
     logger.info("Starting bot...")
@@ -35,43 +65,67 @@ async def main():
     # Create bot and dispatcher instances
     bot = Bot(token=BOT_TOKEN)
     
-    # Use MemoryStorage by default, only try Redis if specifically requested
-    USE_REDIS = False  # Set to True to use Redis
+    # Pace outgoing messages to Telegram's flood limits, user replies first
+    outbound_scheduler = get_outbound_scheduler()
+    bot.session.middleware(outbound_scheduler)
     
-    if USE_REDIS and REDIS_DSN:
-        try:
-            # Try to use Redis storage
-            storage = RedisStorage.from_url(REDIS_DSN)
-            logger.info("Using Redis storage for FSM.")
-        except Exception as e:
-            # Fallback to memory storage if Redis is not available
-            logger.warning(f"Redis connection failed ({e}), using in-memory storage.")
-            storage = MemoryStorage()
-    else:
-        # Use memory storage
-        storage = MemoryStorage()
-        logger.info("Using in-memory storage for FSM.")
+    # FSM storage from the config, Redis lets several workers share conversations
+    storage = await create_fsm_storage()
+    dp = Dispatcher(storage=storage, events_isolation=create_event_isolation(storage))
+    
+    # Register the routers enabled in the config, the cancel handler first
+    include_routers(dp)
+    
+    # Track the updates being handled so a shutdown can wait for them
+    graceful_shutdown = get_graceful_shutdown()
+    dp.update.outer_middleware(graceful_shutdown.update_middleware)
     
-    dp = Dispatcher(storage=storage)
+    # Load the coordinates of saved reports for /nearby
+    geo_index = await asyncio.to_thread(get_geo_index)
+    logger.info(f"Geo index loaded with {len(geo_index)} reports.")
     
-    # Register the cancel handler first to make it available globally
-    dp.include_router(cancel.router)
+    # Load the gazetteer and district boundaries used to resolve locations
+    await asyncio.to_thread(get_geocoder)
+    await asyncio.to_thread(get_district_index)
     
-    # Register other routers
-    dp.include_router(start.router)
-    dp.include_router(gender.router)
-    dp.include_router(photo.router)
-    dp.include_router(location.router)
-    dp.include_router(comment.router)
-    dp.include_router(confirm.router)
+    # Load the subscribed areas new reports are matched against
+    subscription_index = await asyncio.to_thread(get_subscription_index)
+    logger.info(f"Subscription index loaded with {len(subscription_index)} subscriptions.")
     
-    # Register test router
-    dp.include_router(test_router)
+    # Start the workers that save confirmed submissions in the background
+    persistence_queue = get_persistence_queue()
+    await persistence_queue.start(bot)
     
-    # Start polling
-    await bot.delete_webhook(drop_pending_updates=True)
-    logger.info("Bot started successfully!")
-    await dp.start_polling(bot)
+    async def drain():
+        # Runs once updates stop arriving, before anything below is closed
+        await graceful_shutdown.run(persistence_queue, outbound_scheduler)
+    
+    dp.shutdown.register(drain)
+    
+    # Pick up reports and subscriptions saved by other workers sharing the data directory
+    if INDEX_REFRESH_SECONDS:
+        index_refresh = asyncio.create_task(refresh_indexes_forever(INDEX_REFRESH_SECONDS), name="index-refresh")
+        
+        async def stop_index_refresh():
+            index_refresh.cancel()
+        
+        dp.shutdown.register(stop_index_refresh)
+    dp.shutdown.register(shutdown_image_executor)
+    dp.shutdown.register(storage.close)
+    dp.shutdown.register(outbound_scheduler.close)
+    
+    if STARTUP_PROFILE:
+        startup_profiler.report_imports()
+        dp.update.outer_middleware(startup_profiler.first_update_middleware)
+    
+    if RUN_MODE == "webhook":
+        # Serve updates pushed by Telegram, several instances can share the load
+        await run_webhook(dp, bot)
+    else:
+        # Start polling, updates sent while the bot was restarting are handled too
+        await bot.delete_webhook(drop_pending_updates=False)
+        logger.info("Bot started successfully!")
+        await dp.start_polling(bot, tasks_concurrency_limit=MAX_CONCURRENT_UPDATES)
 
 
 if __name__ == "__main__":
@@ -19,4 +19,22 @@ class PetRegistration(StatesGroup):
     entering_comment = State()
     
     # Step 6: Final confirmation
-    confirming = State() 
\ No newline at end of file
+    confirming = State() 
+
+
+class NearbySearch(StatesGroup):
+    """States of the /nearby search."""
+    # Waiting for the location to search around
+    waiting_for_location = State()
+
+
+class SubscriptionSetup(StatesGroup):
+    """States of the /subscribe flow."""
+    # Step 1: Center of the area
+    waiting_for_location = State()
+    
+    # Step 2: Radius of the area
+    selecting_radius = State()
+    
+    # Step 3: Pet type to watch for
+    selecting_pet_type = State()
@@ -1,5 +1,8 @@
+import fnmatch
 import pytest
+import pytest_asyncio
 import asyncio
+import time
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.session.aiohttp import AiohttpSession
@@ -134,4 +137,219 @@ def mock_state():
     state.get_data = AsyncMock(return_value={})
     state.clear = AsyncMock()
     
-    return state 
\ No newline at end of file
+    return state
+
+
+class FakeRedisServer:
+    """Local Redis stand-in speaking RESP2 over TCP.
+
+    Supports the string, hash and key commands the FSM storage uses, so tests run
+    the real redis client and connection pool against it.
+    """
+    def __init__(self):
+        self.data: Dict[bytes, bytes] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.connections = 0
+        self.commands: List[str] = []
+        # Batches of commands answered, a pipeline is one
+        self.round_trips = 0
+        # Channel -> connections subscribed to it, with their protocol
+        self.subscribers: Dict[bytes, Dict[asyncio.StreamWriter, int]] = {}
+        # Awaited with the name of every command once it ran, lets tests act between the commands of a pipeline
+        self.after_command: Optional[Callable[[str], Awaitable[None]]] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        
+    @property
+    def url(self) -> str:
+        port = self._server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/0"
+        
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        
+    def _alive(self, key: bytes) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+        
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        protocol = 2
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:])):
+                    size = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                if args[0].upper() == b"HELLO":
+                    # Switch the connection to RESP3, it changes how nil and pub/sub messages are encoded here
+                    protocol = int(args[1]) if len(args) > 1 else protocol
+                    writer.write(b"%1\r\n+proto\r\n:" + str(protocol).encode() + b"\r\n")
+                elif args[0].upper() in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                    self.commands.append(args[0].decode().upper())
+                    for channel in args[1:]:
+                        subscribers = self.subscribers.setdefault(channel, {})
+                        if args[0].upper() == b"SUBSCRIBE":
+                            subscribers[writer] = protocol
+                        else:
+                            subscribers.pop(writer, None)
+                        count = sum(writer in connections for connections in self.subscribers.values())
+                        writer.write(self._push([args[0].lower(), channel, count], protocol))
+                else:
+                    writer.write(self._execute(args, protocol))
+                    if self.after_command is not None:
+                        await self.after_command(args[0].decode().upper())
+                if not reader._buffer:
+                    self.round_trips += 1
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for subscribers in self.subscribers.values():
+                subscribers.pop(writer, None)
+            writer.close()
+
+    @classmethod
+    def _push(cls, values: list, protocol: int) -> bytes:
+        """Out-of-band pub/sub message: a push under RESP3, an array under RESP2."""
+        return b"%s%d\r\n" % (b">" if protocol == 3 else b"*", len(values)) + b"".join(
+            cls._encode(value, protocol) for value in values
+        )
+            
+    @staticmethod
+    def _encode(value, protocol: int = 2) -> bytes:
+        if value is None:
+            return b"_\r\n" if protocol == 3 else b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            return b"+" + value.encode() + b"\r\n"
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(FakeRedisServer._encode(item, protocol) for item in value)
+        if isinstance(value, dict):
+            # A map under RESP3, a flat array of field and value under RESP2
+            items = [item for pair in value.items() for item in pair]
+            if protocol == 3:
+                return b"%%%d\r\n" % len(value) + b"".join(FakeRedisServer._encode(item, protocol) for item in items)
+            return FakeRedisServer._encode(items, protocol)
+        return b"$%d\r\n" % len(value) + value + b"\r\n"
+        
+    def _execute(self, args: List[bytes], protocol: int = 2) -> bytes:
+        command = args[0].decode().upper()
+        self.commands.append(command)
+        handler = getattr(self, f"cmd_{command.lower()}", None)
+        if handler is None:
+            return f"-ERR unknown command '{command}'\r\n".encode()
+        return self._encode(handler(*args[1:]), protocol)
+        
+    def cmd_ping(self, *args):
+        return "PONG"
+        
+    def cmd_client(self, *args):
+        return "OK"
+        
+    def cmd_select(self, db):
+        return "OK"
+        
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+        
+    def cmd_get(self, key):
+        return self.data.get(key) if self._alive(key) else None
+        
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if b"NX" in options and self._alive(key):
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                self.expires[key] = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        return "OK"
+        
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+        
+    def cmd_exists(self, *keys):
+        return sum(self._alive(key) for key in keys)
+        
+    def cmd_ttl(self, key):
+        if not self._alive(key):
+            return -2
+        expires_at = self.expires.get(key)
+        return -1 if expires_at is None else max(0, round(expires_at - time.monotonic()))
+        
+    def cmd_keys(self, pattern):
+        return [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+        
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+        
+    def cmd_hset(self, key, *pairs):
+        self._alive(key)
+        fields = self.data.setdefault(key, {})
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in fields
+            fields[field] = value
+        return added
+        
+    def cmd_hgetall(self, key):
+        return dict(self.data[key]) if self._alive(key) else {}
+        
+    def cmd_hdel(self, key, *fields):
+        if not self._alive(key):
+            return 0
+        removed = sum(self.data[key].pop(field, None) is not None for field in fields)
+        if not self.data[key]:
+            self.cmd_del(key)
+        return removed
+        
+    def cmd_incrby(self, key, amount):
+        value = int(self.cmd_get(key) or 0) + int(amount)
+        self.data[key] = str(value).encode()
+        return value
+        
+    def cmd_publish(self, channel, message):
+        subscribers = self.subscribers.get(channel, {})
+        for writer, protocol in subscribers.items():
+            writer.write(self._push([b"message", channel, message], protocol))
+        return len(subscribers)
+        
+    def cmd_eval(self, script, numkeys, *args):
+        # Only the compare-and-delete lock release script is understood
+        keys, argv = args[:int(numkeys)], args[int(numkeys):]
+        if b'redis.call("get", KEYS[1]) == ARGV[1]' not in script:
+            raise NotImplementedError(script)
+        return self.cmd_del(keys[0]) if self.cmd_get(keys[0]) == argv[0] else 0
+
+
+@pytest_asyncio.fixture
+async def redis_server():
+    """Start a local Redis stand-in."""
+    server = FakeRedisServer()
+    await server.start()
+    yield server
+    await server.stop()
+
@@ -0,0 +1,68 @@
+import json
+import pytest
+from datetime import datetime
+
+from tg_bot_pet911.utils.catalog import PetCatalog, index_pet_directories
+
+
+def make_record(pet_id: str, created_at: str, pet_type: str = "dog", gender: str = "male",
+                user_id: int = 1, latitude: float = None, longitude: float = None) -> dict:
+    """Create a pet record shaped like the saved JSON."""
+    return {
+        "id": pet_id,
+        "user_id": user_id,
+        "chat_id": user_id,
+        "username": "test_user",
+        "pet_type": pet_type,
+        "gender": gender,
+        "location": {"latitude": latitude, "longitude": longitude, "address": None},
+        "comment": "",
+        "created_at": created_at,
+        "photo_files": [f"{pet_type}_{gender}_{pet_id}_image_1.jpg"]
+    }
+
+
+@pytest.fixture
+def pet_catalog(tmp_path):
+    """Create a catalog in a temporary directory."""
+    catalog = PetCatalog(str(tmp_path / "catalog.sqlite3"))
+    yield catalog
+    catalog.close()
+
+
+def test_get_record(pet_catalog):
+    """A record can be fetched back by id."""
+    pet_catalog.add_record(make_record("aaaa0001", "2025-05-08 07:51:50"), "/data/pets/a")
+
+    record = pet_catalog.get_record("aaaa0001")
+
+    assert record["pet_type"] == "dog"
+    assert record["pet_dir"] == "/data/pets/a"
+    assert pet_catalog.get_record("missing") is None
+
+
+def test_find_records_filters(pet_catalog):
+    """Filters by type, gender, user, date and coordinates are combined."""
+    pet_catalog.add_record(make_record("a1", "2025-05-01 10:00:00", latitude=55.75, longitude=37.62))
+    pet_catalog.add_record(make_record("a2", "2025-05-08 10:00:00", latitude=59.93, longitude=30.33))
+    pet_catalog.add_record(make_record("a3", "2025-05-09 10:00:00", pet_type="cat", gender="female"))
+    pet_catalog.add_record(make_record("a4", "2025-05-10 10:00:00", user_id=2))
+
+    dogs_this_week = pet_catalog.find_records(pet_type="dog", since=datetime(2025, 5, 5))
+    assert [r["id"] for r in dogs_this_week] == ["a4", "a2"]
+
+    assert [r["id"] for r in pet_catalog.find_records(gender="female")] == ["a3"]
+    assert [r["id"] for r in pet_catalog.find_records(user_id=2)] == ["a4"]
+    assert [r["id"] for r in pet_catalog.find_records(bbox=(55.0, 37.0, 56.0, 38.0))] == ["a1"]
+    assert pet_catalog.count(pet_type="dog") == 3
+
+
+def test_index_pet_directories(pet_catalog, tmp_path):
+    """Existing pet directories are indexed from their JSON files."""
+    pet_dir = tmp_path / "pets" / "20250508_075149_dog_male_ec5af450"
+    pet_dir.mkdir(parents=True)
+    record = make_record("ec5af450", "2025-05-08 07:51:50")
+    (pet_dir / "dog_male_ec5af450_data.json").write_text(json.dumps(record), encoding="utf-8")
+
+    assert index_pet_directories(pet_catalog, str(tmp_path / "pets")) == 1
+    assert pet_catalog.get_pet_dir("ec5af450") == str(pet_dir)
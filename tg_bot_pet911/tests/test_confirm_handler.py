@@ -1,9 +1,12 @@
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
-from tg_bot_pet911.bot.handlers.confirm import confirm_submission, reject_submission, restart_submission
+from tg_bot_pet911.bot.handlers.confirm import (
+    confirm_submission, reject_submission, restart_submission, process_save_job, process_publish_job, notify_admins,
+    send_notification
+)
 from tg_bot_pet911.states.pet_states import PetRegistration
 from tg_bot_pet911.app.models import PetInfo, PetLocation, PetPhoto
 
@@ -67,24 +70,113 @@ async def test_confirm_submission(mock_callback_query, mock_state, mock_bot):
         "pet_info": pet_info.model_dump()
     }
     
-    # Patch the functions that would be called
-    with patch('tg_bot_pet911.bot.handlers.confirm.save_pet_data') as mock_save_pet_data:
-        mock_save_pet_data.return_value = ("/path/to/save", {"test": "data"})
+    # Patch the persistence queue, saving happens in the background workers
+    with patch('tg_bot_pet911.bot.handlers.confirm.get_persistence_queue') as mock_get_queue, \
+            patch('tg_bot_pet911.bot.handlers.confirm.matching_chats', return_value=[]), \
+            patch('tg_bot_pet911.bot.handlers.confirm.CHANNEL_ID', "-100123"):
+        mock_queue = MagicMock()
+        mock_get_queue.return_value = mock_queue
+        calls = MagicMock()
+        calls.attach_mock(mock_queue.enqueue, "enqueue")
+        calls.attach_mock(mock_callback_query.answer, "answer")
+        calls.attach_mock(mock_callback_query.message.edit_text, "edit_text")
         
-        with patch('tg_bot_pet911.bot.handlers.confirm.send_notification') as mock_send_notification:
-            mock_send_notification.return_value = None
-            
-            # Execute handler
-            await confirm_submission(mock_callback_query, mock_state, mock_bot)
-            
-            # Verify state was cleared
-            mock_state.clear.assert_called_once()
-            
-            # Verify message was edited
-            mock_callback_query.message.edit_text.assert_called_once()
-            
-            # Verify callback was answered
-            mock_callback_query.answer.assert_called_once()
+        # Execute handler
+        await confirm_submission(mock_callback_query, mock_state, mock_bot)
+        
+        # Verify the submission was queued for saving and publication
+        kinds = [call[0][0] for call in mock_queue.enqueue.call_args_list]
+        assert kinds == ["save_pet", "publish_pet"]
+        payload = mock_queue.enqueue.call_args_list[0][0][1]
+        assert payload["pet_info"]["photos"][0]["file_id"] == "test_file_id"
+        
+        # Verify the callback was answered right after queueing, before the message edit
+        assert [call[0] for call in calls.mock_calls] == ["enqueue", "enqueue", "answer", "edit_text"]
+        assert "принято" in mock_callback_query.message.edit_text.call_args[0][0]
+        
+        # Verify state was cleared
+        mock_state.clear.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_process_publish_job():
+    """The publish job posts the album to the channel, or sends the report to the admins without one."""
+    bot = make_sending_bot()
+    pet_info = PetInfo(user_id=1, chat_id=1, pet_type="dog", gender="male")
+    pet_info.location = PetLocation(address="Москва")
+    pet_info.photos = [PetPhoto(file_id=f"photo_{i}", file_unique_id=f"unique_{i}") for i in range(2)]
+    payload = {"pet_id": "abcd1234", "pet_info": pet_info.model_dump(mode="json")}
+    
+    with patch('tg_bot_pet911.bot.handlers.confirm.CHANNEL_ID', "-100123"):
+        await process_publish_job(bot, payload)
+    bot.send_media_group.assert_called_once()
+    assert bot.send_media_group.call_args.kwargs["chat_id"] == "-100123"
+    
+    bot = make_sending_bot()
+    with patch('tg_bot_pet911.bot.handlers.confirm.CHANNEL_ID', None), \
+            patch('tg_bot_pet911.bot.handlers.confirm.ADMIN_IDS', [1, 2]):
+        await process_publish_job(bot, payload)
+    assert sorted(call.kwargs["chat_id"] for call in bot.send_media_group.call_args_list) == [1, 2]
+
+
+
+@pytest.mark.asyncio
+async def test_publish_job_long_announcement():
+    """An announcement too long for a caption goes before the album, a refused post is not retried."""
+    from aiogram.exceptions import TelegramBadRequest
+    from tg_bot_pet911.utils.job_queue import PermanentJobError
+    
+    bot = make_sending_bot()
+    pet_info = PetInfo(user_id=1, chat_id=1, pet_type="dog", gender="male", comment="Очень длинный комментарий. " * 60)
+    pet_info.location = PetLocation(address="Москва")
+    pet_info.photos = [PetPhoto(file_id=f"photo_{i}", file_unique_id=f"unique_{i}") for i in range(2)]
+    payload = {"pet_id": "abcd1234", "pet_info": pet_info.model_dump(mode="json")}
+    
+    with patch('tg_bot_pet911.bot.handlers.confirm.CHANNEL_ID', "-100123"):
+        await process_publish_job(bot, payload)
+        assert bot.send_message.call_args.kwargs["text"] == pet_info.format_for_publication()
+        assert [media.caption for media in bot.send_media_group.call_args.kwargs["media"]] == [None, None]
+        
+        bot.send_media_group.side_effect = TelegramBadRequest(method=MagicMock(), message="MEDIA_CAPTION_TOO_LONG")
+        with pytest.raises(PermanentJobError):
+            await process_publish_job(bot, payload)
+
+
+@pytest.mark.asyncio
+async def test_process_save_job(mock_bot):
+    """Test the background job that saves a submission and notifies."""
+    pet_info = PetInfo(
+        user_id=123456789,
+        chat_id=123456789,
+        username="test_user",
+        pet_type="dog",
+        gender="male"
+    )
+    pet_info.location = PetLocation(address="Москва")
+    payload = {"pet_id": "abcd1234", "pet_info": pet_info.model_dump(mode="json")}
+    
+    with patch('tg_bot_pet911.bot.handlers.confirm.get_catalog') as mock_get_catalog, \
+            patch('tg_bot_pet911.bot.handlers.confirm.save_pet_data') as mock_save_pet_data, \
+            patch('tg_bot_pet911.bot.handlers.confirm.send_notification') as mock_send_notification, \
+            patch('tg_bot_pet911.bot.handlers.confirm.get_duplicate_index') as mock_get_duplicate_index:
+        mock_get_catalog.return_value.get_record.return_value = None
+        mock_save_pet_data.return_value = ("/path/to/save", {"id": "abcd1234", "photo_hashes": {"a.jpg": "ff"}})
+        duplicates = [{"id": "feed0001", "photo": "b.jpg", "distance": 2}]
+        mock_get_duplicate_index.return_value.find_duplicates.return_value = duplicates
+        
+        await process_save_job(mock_bot, payload)
+        
+        # Verify the record was saved under the queued id and notified about duplicates
+        assert mock_save_pet_data.call_args.kwargs["pet_id"] == "abcd1234"
+        mock_send_notification.assert_called_once()
+        assert mock_send_notification.call_args[0][4] == duplicates
+        mock_get_duplicate_index.return_value.add_record.assert_called_once()
+        
+        # A retried job reuses the saved record
+        mock_save_pet_data.reset_mock()
+        mock_get_catalog.return_value.get_record.return_value = {"id": "abcd1234", "pet_dir": "/path/to/save"}
+        await process_save_job(mock_bot, payload)
+        mock_save_pet_data.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -129,4 +221,52 @@ async def test_restart_submission(mock_callback_query, mock_state):
     assert "Начинаем заново" in edit_text_args
     
     # Verify callback was answered
-    mock_callback_query.answer.assert_called_once() 
\ No newline at end of file
+    mock_callback_query.answer.assert_called_once() 
+
+def make_sending_bot() -> MagicMock:
+    """Bot mock recording the messages, photos and albums it sends."""
+    bot = MagicMock()
+    bot.send_message = AsyncMock()
+    bot.send_photo = AsyncMock()
+    bot.send_media_group = AsyncMock()
+    return bot
+
+
+@pytest.mark.asyncio
+async def test_notify_admins():
+    """Every admin gets the report as one album, a long text goes before the album."""
+    bot = make_sending_bot()
+    photos = [PetPhoto(file_id=f"photo_{i}", file_unique_id=f"unique_{i}") for i in range(3)]
+    
+    with patch('tg_bot_pet911.bot.handlers.confirm.ADMIN_IDS', [1, 2]):
+        await notify_admins(bot, "Новое объявление", photos)
+        
+        albums = [call.kwargs for call in bot.send_media_group.call_args_list]
+        assert sorted(album["chat_id"] for album in albums) == [1, 2]
+        assert [media.media for media in albums[0]["media"]] == ["photo_0", "photo_1", "photo_2"]
+        assert albums[0]["media"][0].caption == "Новое объявление"
+        bot.send_message.assert_not_called()
+        
+        # A text too long for a caption is sent first, then the photo
+        await notify_admins(bot, "x" * 2000, photos[:1])
+        assert bot.send_message.call_count == 2
+        assert bot.send_photo.call_count == 2
+        assert bot.send_photo.call_args.kwargs["caption"] is None
+
+
+@pytest.mark.asyncio
+async def test_send_notification_album():
+    """The notification is the text and one album of at most 3 photos."""
+    bot = make_sending_bot()
+    pet_info = PetInfo(user_id=1, chat_id=1, pet_type="dog", gender="male")
+    pet_info.location = PetLocation(address="Москва")
+    pet_info.photos = [PetPhoto(file_id=f"photo_{i}", file_unique_id=f"unique_{i}") for i in range(5)]
+    
+    await send_notification(bot, pet_info, "/path/to/save", "{}")
+    
+    assert "НОВОЕ ОБЪЯВЛЕНИЕ" in bot.send_message.call_args.kwargs["text"]
+    bot.send_media_group.assert_called_once()
+    assert [media.caption for media in bot.send_media_group.call_args.kwargs["media"]] == [
+        "Фото 1 из объявления", "Фото 2 из объявления", "Фото 3 из объявления"
+    ]
+    bot.send_photo.assert_not_called()
@@ -0,0 +1,97 @@
+import random
+import pytest
+from unittest.mock import MagicMock
+
+from tg_bot_pet911.app.models import PetInfo, PetLocation
+from tg_bot_pet911.bot.handlers.location import process_geo_location
+from tg_bot_pet911.utils import districts as districts_module
+from tg_bot_pet911.utils.districts import District, DistrictIndex, RTree
+
+
+def square(x: float, y: float, size: float) -> list:
+    """Closed GeoJSON ring of a square with its lower left corner at (x, y)."""
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def feature(name: str, polygons: list, city: str = "Москва", kind: str = "Polygon") -> dict:
+    return {
+        "type": "Feature",
+        "properties": {"name": name, "city": city},
+        "geometry": {"type": kind, "coordinates": polygons}
+    }
+
+
+@pytest.fixture
+def district_index():
+    """A city with a district that has a hole and a two-part district."""
+    return DistrictIndex.from_geojson({
+        "type": "FeatureCollection",
+        "features": [
+            feature("Москва", [square(37.0, 55.0, 2.0)], city="Москва"),
+            feature("Центральный район", [square(37.5, 55.5, 0.5), square(37.7, 55.7, 0.1)]),
+            feature("Островной район", [[square(36.0, 54.0, 0.2)], [square(36.5, 54.5, 0.2)]], kind="MultiPolygon"),
+            feature("Без геометрии", [], kind="Point"),
+        ]
+    })
+
+
+def test_rtree_matches_linear_scan():
+    """Point queries return exactly the boxes containing the point."""
+    rng = random.Random(42)
+    boxes = []
+    for _ in range(2000):
+        x, y = rng.random() * 100, rng.random() * 100
+        boxes.append((x, y, x + rng.random() * 5, y + rng.random() * 5))
+    tree = RTree(boxes, node_size=8)
+
+    for _ in range(200):
+        x, y = rng.random() * 100, rng.random() * 100
+        expected = [i for i, (x1, y1, x2, y2) in enumerate(boxes) if x1 <= x <= x2 and y1 <= y <= y2]
+        assert sorted(tree.query_point(x, y)) == expected
+
+    assert RTree([]).query_point(1, 1) == []
+
+
+def test_lookup(district_index):
+    """The smallest district containing the point is returned, holes excluded."""
+    assert len(district_index) == 3
+    assert district_index.lookup(55.6, 37.6) == District("Центральный район", "Москва")
+    assert district_index.lookup(55.75, 37.75).name == "Москва"  # Inside the hole
+    assert district_index.lookup(55.1, 37.1).label() == "Москва"
+    assert district_index.lookup(54.6, 36.6).name == "Островной район"
+    assert district_index.lookup(54.3, 36.3) is None
+    assert district_index.lookup(10, 10) is None
+
+
+def test_lookup_cache(district_index):
+    """Points closer than the cache precision share one cache entry."""
+    district_index.lookup(55.60001, 37.60001)
+    district_index.lookup(55.60002, 37.60002)
+
+    info = district_index.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_publication_shows_district():
+    """Published GPS reports name their district next to the coordinates."""
+    pet_info = PetInfo(user_id=1, chat_id=1, pet_type="dog", gender="male")
+    pet_info.location = PetLocation(latitude=55.6, longitude=37.6, district="Центральный район, Москва")
+
+    text = pet_info.format_for_publication()
+
+    assert "Район: Центральный район, Москва" in text
+    assert "Координаты: 55.6, 37.6" in text
+
+
+@pytest.mark.asyncio
+async def test_geo_location_gets_district(district_index, monkeypatch, mock_message, mock_state):
+    """Shared locations are saved with their district."""
+    monkeypatch.setattr(districts_module, "_district_index", district_index)
+    mock_message.location = MagicMock(latitude=55.6, longitude=37.6)
+    mock_state.get_data.return_value = {"pet_info": {"pet_type": "dog"}}
+
+    await process_geo_location(mock_message, mock_state)
+
+    location = mock_state.update_data.call_args[1]["pet_info"]["location"]
+    assert location["district"] == "Центральный район, Москва"
+    assert "Центральный район" in mock_message.answer.call_args[0][0]
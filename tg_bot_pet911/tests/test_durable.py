@@ -0,0 +1,107 @@
+import asyncio
+import os
+import pytest
+
+from tg_bot_pet911.utils import durable
+from tg_bot_pet911.utils.durable import GroupCommitter, write_file
+
+
+@pytest.fixture
+def committer(monkeypatch):
+    """Use a fresh group committer with a short window."""
+    group_committer = GroupCommitter(window=0.01, max_batch=64)
+    monkeypatch.setattr(durable, "_group_committer", group_committer)
+    return group_committer
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("durability", durable.DURABILITY_LEVELS)
+async def test_write_file_levels(tmp_path, committer, durability):
+    """Every durability level writes the content and leaves no temp files."""
+    path = tmp_path / "pets" / "record.json"
+    path.parent.mkdir()
+    path.write_text("old content")
+
+    await write_file(str(path), "новое содержимое", durability=durability, root=str(tmp_path))
+
+    assert path.read_text(encoding="utf-8") == "новое содержимое"
+    assert os.listdir(path.parent) == ["record.json"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("syncfs", [True, False])
+async def test_group_commit_batches_concurrent_writes(tmp_path, committer, monkeypatch, syncfs):
+    """Writes within one window are committed together, with one filesystem sync or per-file fsyncs."""
+    synced = []
+    if syncfs:
+        if durable._syncfs is None:
+            pytest.skip("syncfs is not available")
+        real_syncfs = durable._syncfs
+        monkeypatch.setattr(durable, "_syncfs", lambda fd: synced.append(fd) or real_syncfs(fd))
+    else:
+        monkeypatch.setattr(durable, "_syncfs", None)
+    paths = [tmp_path / f"record_{i}.json" for i in range(10)]
+
+    await asyncio.gather(*(write_file(str(path), f"{i}", durability="group") for i, path in enumerate(paths)))
+
+    assert committer.batches == 1
+    assert [path.read_text() for path in paths] == [f"{i}" for i in range(10)]
+    # Before and after the renames
+    assert len(synced) == (2 if syncfs else 0)
+
+
+@pytest.mark.asyncio
+async def test_group_commit_full_batch_flushes_early(tmp_path, monkeypatch):
+    """A full batch is committed without waiting for the window."""
+    committer = GroupCommitter(window=60, max_batch=3)
+    monkeypatch.setattr(durable, "_group_committer", committer)
+
+    writes = [write_file(str(tmp_path / f"record_{i}.json"), "x", durability="group") for i in range(3)]
+    await asyncio.wait_for(asyncio.gather(*writes), timeout=5)
+
+    assert committer.batches == 1
+
+
+@pytest.mark.asyncio
+async def test_group_commit_failure_reaches_writer(tmp_path, committer):
+    """A failed commit raises in the writer and removes the temp file."""
+    path = tmp_path / "record.json"
+    path.mkdir()  # Renaming a file over a directory fails
+
+    with pytest.raises(OSError):
+        await write_file(str(path), "x", durability="group")
+
+    assert os.listdir(tmp_path) == ["record.json"]
+
+
+@pytest.mark.asyncio
+async def test_flush_pending_writes(tmp_path, monkeypatch):
+    """Pending writes are committed on flush instead of after the window."""
+    committer = GroupCommitter(window=60, max_batch=64)
+    monkeypatch.setattr(durable, "_group_committer", committer)
+    path = tmp_path / "record.json"
+
+    write = asyncio.create_task(write_file(str(path), "x", durability="group"))
+    await asyncio.sleep(0.05)
+    assert not path.exists()
+
+    await durable.flush_pending_writes()
+    await write
+    assert path.read_text() == "x"
+
+
+@pytest.mark.asyncio
+async def test_unknown_durability(tmp_path):
+    """Unknown durability levels are rejected."""
+    with pytest.raises(ValueError):
+        await write_file(str(tmp_path / "record.json"), "x", durability="paranoid")
+
+
+def test_sync_dirs_stops_at_root(tmp_path):
+    """Directories are synced from the file up to the root."""
+    path = tmp_path / "a" / "b" / "record.json"
+
+    assert durable._sync_dirs(str(path), str(tmp_path)) == [
+        str(tmp_path / "a" / "b"), str(tmp_path / "a"), str(tmp_path)
+    ]
+    assert durable._sync_dirs(str(path), None) == [str(tmp_path / "a" / "b")]
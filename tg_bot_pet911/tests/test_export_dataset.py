@@ -0,0 +1,97 @@
+import json
+import os
+import tarfile
+import pytest
+from datetime import datetime
+
+from tg_bot_pet911.utils import catalog as catalog_module
+from tg_bot_pet911.utils.catalog import PetCatalog
+from tg_bot_pet911.utils.export_dataset import export_dataset
+
+
+@pytest.fixture
+def pet_catalog(tmp_path, monkeypatch):
+    """Create a catalog with five saved records, each with a photo on disk."""
+    catalog = PetCatalog(str(tmp_path / "catalog.sqlite3"))
+    monkeypatch.setattr(catalog_module, "_catalog", catalog)
+    for i in range(5):
+        pet_id = f"a{i}"
+        pet_type = "cat" if i == 4 else "dog"
+        pet_dir = tmp_path / "pets" / pet_id
+        pet_dir.mkdir(parents=True)
+        (pet_dir / f"{pet_type}_male_{pet_id}_image_1.jpg").write_bytes(f"jpeg {i}".encode())
+        catalog.add_record({
+            "id": pet_id,
+            "pet_type": pet_type,
+            "gender": "male",
+            "created_at": f"2025-05-0{i + 1} 10:00:00",
+            "user_id": 1000 + i,
+            "chat_id": 1000 + i,
+            "username": f"user{i}",
+            "location": {"latitude": 55.75, "longitude": 37.62, "address": "Тверская, 1"},
+            "photo_files": [f"{pet_type}_male_{pet_id}_image_1.jpg"],
+            "photo_hashes": {f"{pet_type}_male_{pet_id}_image_1.jpg": "00000000000000ff"}
+        }, str(pet_dir))
+    yield catalog
+    catalog.close()
+
+
+def read_shard(path) -> dict:
+    """Read all members of a tar shard."""
+    with tarfile.open(path) as tar:
+        return {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+
+
+def test_export_writes_shards_and_manifest(pet_catalog, tmp_path):
+    """Filtered records are written into fixed-size shards with a manifest."""
+    out_dir = tmp_path / "export"
+
+    result = export_dataset(str(out_dir), pet_catalog, pet_type="dog", samples_per_shard=3)
+
+    assert result == {"shards": 2, "samples": 4, "total_shards": 2, "total_samples": 4}
+    members = read_shard(out_dir / "shard-000000.tar")
+    assert sorted(members) == [
+        "a0.1.jpg", "a0.json", "a1.1.jpg", "a1.json", "a2.1.jpg", "a2.json"
+    ]
+    assert members["a1.1.jpg"] == b"jpeg 1"
+    assert json.loads(members["a0.json"]) == {
+        "id": "a0", "pet_type": "dog", "gender": "male", "created_at": "2025-05-01 10:00:00",
+        "latitude": 55.75, "longitude": 37.62, "photo_hashes": {"a0.1.jpg": "00000000000000ff"}, "images": ["a0.1.jpg"]
+    }
+
+    with open(out_dir / "manifest.jsonl", encoding="utf-8") as f:
+        manifest = [json.loads(line) for line in f]
+    assert [entry["keys"] for entry in manifest] == [["a0", "a1", "a2"], ["a3"]]
+
+
+def test_export_resumes_after_last_shard(pet_catalog, tmp_path):
+    """A second run only exports records added after the last completed shard."""
+    out_dir = tmp_path / "export"
+    export_dataset(str(out_dir), pet_catalog, since=datetime(2025, 5, 2), samples_per_shard=2)
+
+    pet_catalog.add_record({"id": "b0", "created_at": "2025-06-01 10:00:00", "photo_files": []})
+    result = export_dataset(str(out_dir), pet_catalog, since=datetime(2025, 5, 2), samples_per_shard=2)
+
+    assert result == {"shards": 1, "samples": 1, "total_shards": 3, "total_samples": 5}
+    assert sorted(read_shard(out_dir / "shard-000002.tar")) == ["b0.json"]
+    assert not [name for name in os.listdir(out_dir) if name.endswith(".tmp")]
+
+    # Resuming with different filters would mix two exports
+    with pytest.raises(ValueError):
+        export_dataset(str(out_dir), pet_catalog, pet_type="cat", samples_per_shard=2)
+
+
+def test_export_resumes_after_torn_manifest_line(pet_catalog, tmp_path):
+    """A manifest line cut off by a crash is dropped and its shard written again."""
+    out_dir = tmp_path / "export"
+    export_dataset(str(out_dir), pet_catalog, samples_per_shard=2)
+    manifest_path = out_dir / "manifest.jsonl"
+    lines = manifest_path.read_bytes().splitlines(keepends=True)
+    manifest_path.write_bytes(b"".join(lines[:2]) + lines[2][:20])
+
+    result = export_dataset(str(out_dir), pet_catalog, samples_per_shard=2)
+
+    assert result == {"shards": 1, "samples": 1, "total_shards": 3, "total_samples": 5}
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = [json.loads(line) for line in f]
+    assert [entry["keys"] for entry in manifest] == [["a0", "a1"], ["a2", "a3"], ["a4"]]
@@ -0,0 +1,110 @@
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from redis.asyncio import Redis
+from unittest.mock import AsyncMock, MagicMock
+
+from tg_bot_pet911.bot.handlers.photo import process_photo_upload
+from tg_bot_pet911.utils.fsm_patch import diff_patch, edit_data
+from tg_bot_pet911.utils.fsm_storage import create_fsm_storage, create_redis_pool, create_redis_storage
+from tg_bot_pet911.utils.memory_storage import ExpiringMemoryStorage
+
+
+KEY = StorageKey(bot_id=42, chat_id=100, user_id=200)
+
+PHOTO = {"file_id": "AgACAgIAAxkBAAIBY2Zk", "file_unique_id": "AQADxr4xG"}
+
+
+def test_diff_patch():
+    """Only changed fields end up in the patch, a grown list as the items appended."""
+    before = {"pet_type": "dog", "gender": "", "photos": [PHOTO]}
+    patch = diff_patch("pet_info", before, {"pet_type": "dog", "gender": "male", "photos": [PHOTO, PHOTO]})
+
+    assert patch.fields == {"gender": "male"}
+    assert patch.appends == {"photos": [PHOTO]}
+    assert diff_patch("pet_info", before, {"pet_type": "dog", "gender": "", "photos": []}).fields == {"photos": []}
+    assert diff_patch("pet_info", before, {"pet_type": "dog"}) is None
+
+
+async def register(state: FSMContext):
+    """The steps of a registration, as the handlers write them."""
+    await state.update_data(pet_info={"user_id": 1, "pet_type": "dog", "gender": "", "photos": [], "comment": ""})
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["gender"] = "male"
+    for _ in range(3):
+        async with edit_data(state) as pet_info_dict:
+            pet_info_dict["photos"].append(PHOTO)
+    # Back to gender and photos again
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["photos"] = []
+    for _ in range(11):
+        async with edit_data(state) as pet_info_dict:
+            pet_info_dict["photos"].append(dict(PHOTO, file_unique_id=str(len(pet_info_dict["photos"]))))
+    async with edit_data(state) as pet_info_dict:
+        pet_info_dict["location"] = {"latitude": 55.75, "longitude": 37.61, "address": None, "district": None}
+
+
+EXPECTED = {
+    "user_id": 1,
+    "pet_type": "dog",
+    "gender": "male",
+    "photos": [dict(PHOTO, file_unique_id=str(i)) for i in range(11)],
+    "comment": "",
+    "location": {"latitude": 55.75, "longitude": 37.61, "address": None, "district": None}
+}
+
+
+@pytest.mark.asyncio
+async def test_redis_writes_changed_fields(redis_server):
+    """With Redis a step writes only its fields to a hash, reads merge them back."""
+    storage = create_redis_storage(Redis(connection_pool=create_redis_pool(redis_server.url)))
+    state = FSMContext(storage, KEY)
+    await register(state)
+
+    assert (await state.get_data())["pet_info"] == EXPECTED
+    fields = redis_server.data[b"fsm:42:100:200:fields"]
+    assert b"pet_info.photos+10" in fields and b"pet_info.photos+11" not in fields
+    # Appending a photo wrote the photo, not the report
+    assert len(fields[b"pet_info.photos+10"]) < len(redis_server.data[b"fsm:42:100:200:data"])
+
+    await state.update_data(comment_asked=True)
+    assert sorted(redis_server.data) == [b"fsm:42:100:200:data"]
+    assert (await state.get_data())["pet_info"] == EXPECTED
+    await state.clear()
+    assert redis_server.data == {}
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_tiered_and_memory_apply_patches(redis_server):
+    """The tiered and memory storages apply patches to the conversation they hold."""
+    tiered = await create_fsm_storage("tiered", Redis(connection_pool=create_redis_pool(redis_server.url)))
+    memory = ExpiringMemoryStorage(ttl=100, archive_path=None)
+    for storage in (tiered, memory):
+        state = FSMContext(storage, KEY)
+        await register(state)
+        assert (await state.get_data())["pet_info"] == EXPECTED
+
+    await tiered.close()
+    reader = create_redis_storage(Redis(connection_pool=create_redis_pool(redis_server.url)))
+    assert (await reader.get_data(KEY))["pet_info"] == EXPECTED
+    assert b"fsm:42:100:200:fields" not in redis_server.data
+    await reader.close()
+
+
+@pytest.mark.asyncio
+async def test_photo_handler_appends_once():
+    """The photo handler adds one photo per message with a real FSM context."""
+    storage = ExpiringMemoryStorage(ttl=100, archive_path=None)
+    state = FSMContext(storage, KEY)
+    await state.update_data(pet_info={"pet_type": "dog", "photos": []})
+    message = MagicMock()
+    message.photo = [MagicMock(file_id="small", file_unique_id="s"), MagicMock(file_id="big", file_unique_id="b")]
+    message.answer = AsyncMock()
+
+    for _ in range(6):
+        await process_photo_upload(message, state)
+
+    photos = (await state.get_data())["pet_info"]["photos"]
+    assert photos == [{"file_id": "big", "file_unique_id": "b"}] * 5
+    assert "максимальное" in message.answer.call_args[0][0]
@@ -0,0 +1,98 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from aiogram.fsm.storage.base import StorageKey
+from redis.asyncio import Redis
+
+from tg_bot_pet911.app.models import PetInfo, PetLocation, PetPhoto
+from tg_bot_pet911.utils import fsm_serializer
+from tg_bot_pet911.utils.fsm_serializer import JsonSerializer, MsgpackSerializer, create_serializer
+from tg_bot_pet911.utils.fsm_storage import create_redis_pool, create_redis_storage
+
+pytest.importorskip("msgpack")
+
+
+def make_data() -> dict:
+    """Conversation data at the confirmation step."""
+    pet_info = PetInfo(
+        user_id=123456789,
+        chat_id=123456789,
+        username="test_user",
+        pet_type="dog",
+        gender="male",
+        photos=[PetPhoto(file_id=f"AgACAgIAAxkBAAI{i}" * 3, file_unique_id=f"AQAD{i}") for i in range(3)],
+        location=PetLocation(latitude=55.753215, longitude=37.622504, district="Тверской"),
+        comment="Рыжий, в ошейнике"
+    )
+    return {"pet_info": pet_info.model_dump(), "custom": {"nested": [1, 2.5, None, True]}}
+
+
+def test_msgpack_round_trip():
+    """Data, datetimes and other keys survive, and the payload is smaller than JSON."""
+    data = make_data()
+    serializer = MsgpackSerializer()
+
+    payload = serializer.dumps(data)
+
+    assert payload[0] == fsm_serializer.CURRENT_VERSION
+    assert serializer.loads(payload) == data
+    assert len(payload) < len(JsonSerializer().dumps(data)) * 0.8
+
+    # A pet_info that does not match the schema is kept as a map
+    data["pet_info"]["breed"] = "terrier"
+    assert serializer.loads(serializer.dumps(data)) == data
+
+    aware = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone(timedelta(hours=3)))
+    assert serializer.loads(serializer.dumps({"at": aware}))["at"] == aware
+
+
+def test_formats_read_each_other():
+    """Switching the serializer keeps conversations stored with the other one readable."""
+    data = make_data()
+    json_payload = JsonSerializer().dumps(data)
+    msgpack_payload = MsgpackSerializer().dumps(data)
+
+    from_json = MsgpackSerializer().loads(json_payload)
+    assert from_json["pet_info"]["created_at"] == data["pet_info"]["created_at"].isoformat()
+    assert PetInfo(**from_json["pet_info"]) == PetInfo(**data["pet_info"])
+    assert JsonSerializer().loads(msgpack_payload) == data
+
+    with pytest.raises(ValueError):
+        MsgpackSerializer().loads(b"\x7f" + msgpack_payload[1:])
+
+
+def test_field_values():
+    """Single fields written by patches round-trip, and either format reads the other's."""
+    aware = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    for value in (make_data()["pet_info"]["photos"][0], "male", None, 55.75, [aware]):
+        for writer in (JsonSerializer(), MsgpackSerializer()):
+            payload = writer.dumps_value(value)
+            expected = [aware.isoformat()] if value == [aware] and isinstance(writer, JsonSerializer) else value
+            assert MsgpackSerializer().loads_value(payload) == expected
+            assert JsonSerializer().loads_value(payload) == expected
+
+
+def test_create_serializer(monkeypatch):
+    """msgpack falls back to JSON when it is not installed."""
+    assert isinstance(create_serializer("msgpack"), MsgpackSerializer)
+    assert isinstance(create_serializer("json"), JsonSerializer)
+    with pytest.raises(ValueError):
+        create_serializer("pickle")
+
+    monkeypatch.setattr(fsm_serializer, "msgpack", None)
+    assert isinstance(create_serializer("msgpack"), JsonSerializer)
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_with_serializer(redis_server):
+    """Redis keeps the binary payload and returns the data with its datetimes."""
+    storage = create_redis_storage(Redis(connection_pool=create_redis_pool(redis_server.url)), serializer="msgpack")
+    key = StorageKey(bot_id=42, chat_id=100, user_id=200)
+    data = make_data()
+
+    await storage.set_data(key, data)
+
+    assert redis_server.data[b"fsm:42:100:200:data"][0] == fsm_serializer.CURRENT_VERSION
+    assert await storage.get_data(key) == data
+    await storage.set_data(key, {})
+    assert await storage.get_data(key) == {}
+    await storage.close()
@@ -0,0 +1,148 @@
+import asyncio
+import pytest
+from aiogram import Dispatcher, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisEventIsolation
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+
+from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils import fsm_storage
+from tg_bot_pet911.utils.fsm_storage import (
+    KeyedEventIsolation, create_event_isolation, create_fsm_storage, create_redis_pool
+)
+
+
+KEY = StorageKey(bot_id=42, chat_id=100, user_id=200)
+
+
+@pytest.mark.asyncio
+async def test_memory_backend():
+    """The memory backend needs no Redis and isolates chats in the process."""
+    storage = await create_fsm_storage("memory")
+
+    assert isinstance(storage, MemoryStorage)
+    assert isinstance(create_event_isolation(storage), KeyedEventIsolation)
+
+    with pytest.raises(ValueError):
+        await create_fsm_storage("sqlite")
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_workers_share_conversations(redis_server):
+    """Two workers on one Redis see each other's states under the bot's key prefix."""
+    first = await create_fsm_storage("redis", Redis(connection_pool=create_redis_pool(redis_server.url)))
+    second = await create_fsm_storage("redis", Redis(connection_pool=create_redis_pool(redis_server.url)))
+
+    await first.set_state(KEY, PetRegistration.uploading_photos)
+    await first.set_data(KEY, {"pet_info": {"pet_type": "dog"}})
+
+    assert await second.get_state(KEY) == PetRegistration.uploading_photos.state
+    assert await second.get_data(KEY) == {"pet_info": {"pet_type": "dog"}}
+    assert sorted(redis_server.data) == [b"fsm:42:100:200:data", b"fsm:42:100:200:state"]
+    assert isinstance(create_event_isolation(first), RedisEventIsolation)
+
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_is_bounded_and_reused(redis_server, monkeypatch):
+    """Concurrent handlers share at most REDIS_MAX_CONNECTIONS connections."""
+    monkeypatch.setattr(fsm_storage, "REDIS_MAX_CONNECTIONS", 4)
+    storage = await create_fsm_storage("redis", Redis(connection_pool=create_redis_pool(redis_server.url)))
+
+    async def conversation(user_id: int):
+        key = StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+        for step in range(5):
+            await storage.set_data(key, {"step": step})
+            assert await storage.get_data(key) == {"step": step}
+
+    # Twice as many conversations as connections wait for each other instead of failing
+    await asyncio.gather(*(conversation(user_id) for user_id in range(8)))
+
+    assert redis_server.connections <= 4
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_ttl(redis_server, monkeypatch):
+    """Unfinished conversations expire when FSM_TTL_SECONDS is set."""
+    monkeypatch.setattr(fsm_storage, "FSM_TTL_SECONDS", 3600)
+    storage = await create_fsm_storage("redis", Redis(connection_pool=create_redis_pool(redis_server.url)))
+
+    await storage.set_state(KEY, PetRegistration.entering_comment)
+
+    assert 0 < redis_server.cmd_ttl(b"fsm:42:100:200:state") <= 3600
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_unreachable_redis(redis_server):
+    """A worker refuses to start without Redis instead of keeping private state."""
+    url = redis_server.url
+    await redis_server.stop()
+
+    with pytest.raises(ConnectionError):
+        await create_fsm_storage("redis", Redis(connection_pool=create_redis_pool(url)))
+
+
+@pytest.mark.asyncio
+async def test_keyed_isolation_orders_chats_and_evicts():
+    """Updates of one chat run in arrival order, other chats run alongside, idle locks are dropped."""
+    isolation = KeyedEventIsolation()
+    events = []
+
+    async def handle(chat_id: int, name: str):
+        async with isolation.lock(StorageKey(bot_id=42, chat_id=chat_id, user_id=chat_id)):
+            events.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            events.append(f"end {name}")
+
+    await asyncio.gather(handle(1, "a1"), handle(1, "a2"), handle(1, "a3"), handle(2, "b1"))
+
+    chat_a = [event for event in events if event.endswith(("a1", "a2", "a3"))]
+    assert chat_a == ["start a1", "end a1", "start a2", "end a2", "start a3", "end a3"]
+    # The other chat did not wait for the first one
+    assert events.index("start b1") < events.index("end a1")
+    assert isolation.active_chats == 0
+
+
+@pytest.mark.asyncio
+async def test_album_photos_are_not_lost(mock_bot):
+    """Photos of an album handled concurrently all end up in the conversation data."""
+    router = Router()
+
+    @router.message()
+    async def add_photo(message, state: FSMContext):
+        data = await state.get_data()
+        await asyncio.sleep(0.01)  # Another update of the chat would read the same data here
+        await state.update_data(photos=data.get("photos", []) + [message.message_id])
+
+    storage = await create_fsm_storage("memory")
+    isolation = create_event_isolation(storage)
+    dp = Dispatcher(storage=storage, events_isolation=isolation)
+    dp.include_router(router)
+
+    updates = [
+        {
+            "update_id": i,
+            "message": {
+                "message_id": i,
+                "date": 0,
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "User"},
+                "media_group_id": "album"
+            }
+        }
+        for i in range(5)
+    ]
+    await asyncio.gather(*(dp.feed_raw_update(mock_bot, update) for update in updates))
+
+    key = StorageKey(bot_id=mock_bot.id, chat_id=1, user_id=1)
+    assert (await storage.get_data(key))["photos"] == [0, 1, 2, 3, 4]
+    assert isolation.active_chats == 0
+    await storage.close()
@@ -0,0 +1,134 @@
+import random
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from unittest.mock import MagicMock
+
+from tg_bot_pet911.bot.handlers.nearby import cmd_nearby, process_nearby_location
+from tg_bot_pet911.states.pet_states import NearbySearch, PetRegistration
+from tg_bot_pet911.utils import catalog as catalog_module, geo_index as geo_index_module, phash as phash_module
+from tg_bot_pet911.utils.catalog import PetCatalog
+from tg_bot_pet911.utils.geo_index import GeoIndex, get_geo_index, haversine_km, refresh_geo_index
+from tg_bot_pet911.utils.memory_storage import ExpiringMemoryStorage
+from tg_bot_pet911.utils.phash import get_duplicate_index, refresh_duplicate_index
+
+
+def test_nearest_matches_linear_scan():
+    """k nearest queries return exactly what a full scan would."""
+    rng = random.Random(42)
+    index = GeoIndex(cell_size=0.01)
+    points = []
+    for i in range(3000):
+        lat, lon = 55.5 + rng.random() * 0.5, 37.3 + rng.random() * 0.6
+        created_at = f"2025-05-{rng.randint(1, 28):02d} 10:00:00"
+        index.add(f"p{i}", lat, lon, created_at)
+        points.append((f"p{i}", lat, lon, created_at))
+
+    for query_lat, query_lon in [(55.75, 37.62), (55.51, 37.31), (56.5, 38.5)]:
+        expected = sorted(
+            (haversine_km(query_lat, query_lon, lat, lon), pet_id)
+            for pet_id, lat, lon, created_at in points
+            if created_at >= "2025-05-15"
+        )[:7]
+
+        results = index.nearest(query_lat, query_lon, k=7, since="2025-05-15")
+
+        assert [point.pet_id for _distance, point in results] == [pet_id for _distance, pet_id in expected]
+
+
+def test_nearest_max_distance_and_replace():
+    """Reports farther than the limit are skipped and re-added reports move."""
+    index = GeoIndex()
+    index.add("near", 55.7510, 37.6170, "2025-05-01 10:00:00")
+    index.add("far", 55.9000, 37.6170, "2025-05-01 10:00:00")
+
+    assert [point.pet_id for _d, point in index.nearest(55.75, 37.617, k=5, max_distance_km=2)] == ["near"]
+
+    index.add("far", 55.7500, 37.6171, "2025-05-01 10:00:00")
+    results = index.nearest(55.75, 37.617, k=5, max_distance_km=2)
+    assert [point.pet_id for _d, point in results] == ["far", "near"]
+    assert len(index) == 2
+
+
+def test_nearest_empty_index():
+    """An empty index returns nothing."""
+    assert GeoIndex().nearest(0, 0, k=3) == []
+
+
+@pytest.fixture
+def saved_reports(tmp_path, monkeypatch):
+    """Shared catalog with two reports near the Kremlin and one without coordinates."""
+    catalog = PetCatalog(str(tmp_path / "catalog.sqlite3"))
+    monkeypatch.setattr(catalog_module, "_catalog", catalog)
+    monkeypatch.setattr(geo_index_module, "_geo_index", None)
+    catalog.add_record({
+        "id": "a1", "pet_type": "dog", "gender": "male", "created_at": "2099-01-01 10:00:00",
+        "location": {"latitude": 55.7520, "longitude": 37.6175, "address": None}
+    })
+    catalog.add_record({
+        "id": "a2", "pet_type": "cat", "gender": "female", "created_at": "2099-01-01 11:00:00",
+        "location": {"latitude": 55.7600, "longitude": 37.6300, "address": "Лубянка"}
+    })
+    catalog.add_record({
+        "id": "a3", "pet_type": "cat", "created_at": "2099-01-01 12:00:00",
+        "location": {"address": "Москва"}
+    })
+    yield catalog
+    catalog.close()
+
+
+def test_geo_index_loaded_from_catalog(saved_reports):
+    """The shared index holds every saved report with coordinates."""
+    assert len(get_geo_index()) == 2
+
+
+def test_indexes_pick_up_reports_of_other_workers(saved_reports, monkeypatch):
+    """A refresh adds the reports another worker saved to the shared catalog since the last one."""
+    monkeypatch.setattr(phash_module, "_duplicate_index", None)
+    assert len(get_geo_index()) == 2
+    assert get_duplicate_index().find_duplicates(["00000000000000ff"]) == []
+
+    other_worker = PetCatalog(saved_reports.db_path)
+    other_worker.add_record({
+        "id": "b1", "pet_type": "dog", "created_at": "2099-01-02 10:00:00",
+        "location": {"latitude": 55.7530, "longitude": 37.6200}, "photo_hashes": {"b1_1.jpg": "00000000000000ff"}
+    })
+    other_worker.close()
+
+    assert refresh_geo_index() == 1
+    assert refresh_duplicate_index() == 1
+    assert len(get_geo_index()) == 3
+    assert [d["id"] for d in get_duplicate_index().find_duplicates(["00000000000000fe"])] == ["b1"]
+    assert refresh_geo_index() == 0
+
+
+@pytest.mark.asyncio
+async def test_nearby_command(saved_reports, mock_message, mock_state):
+    """/nearby asks for a location and answers with the closest reports."""
+    await cmd_nearby(mock_message, mock_state)
+    mock_state.set_state.assert_called_once_with(NearbySearch.waiting_for_location)
+
+    mock_message.location = MagicMock(latitude=55.7539, longitude=37.6208)
+    await process_nearby_location(mock_message, mock_state)
+
+    answer = mock_message.answer.call_args[0][0]
+    assert "Найдено объявлений рядом: 2" in answer
+    assert answer.index("a1") < answer.index("a2")
+    assert "Лубянка" in answer
+    mock_state.set_state.assert_called_with(None)
+
+
+@pytest.mark.asyncio
+async def test_nearby_keeps_unfinished_registration(saved_reports, mock_message):
+    """/nearby in the middle of a registration returns to the same step with the report intact."""
+    state = FSMContext(ExpiringMemoryStorage(ttl=100, archive_path=None), StorageKey(bot_id=1, chat_id=2, user_id=3))
+    await state.set_state(PetRegistration.uploading_photos)
+    await state.update_data(pet_info={"pet_type": "dog", "photos": []})
+
+    await cmd_nearby(mock_message, state)
+    assert await state.get_state() == NearbySearch.waiting_for_location.state
+    mock_message.location = MagicMock(latitude=55.7539, longitude=37.6208)
+    await process_nearby_location(mock_message, state)
+
+    assert await state.get_state() == PetRegistration.uploading_photos.state
+    assert await state.get_data() == {"pet_info": {"pet_type": "dog", "photos": []}}
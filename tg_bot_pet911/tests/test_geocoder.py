@@ -0,0 +1,94 @@
+import pytest
+
+from tg_bot_pet911.bot.handlers.location import process_manual_location
+from tg_bot_pet911.utils import geocoder as geocoder_module
+from tg_bot_pet911.utils.geocoder import Geocoder, Trie, normalize_street
+
+
+GAZETTEER = """city,street,house_from,house_to,latitude,longitude
+Москва,,,,55.7558,37.6173
+Москва,ул. Пушкина,,,55.7600,37.6000
+Москва,ул. Пушкина,1,20,55.7610,37.6010
+Москва,ул. Пушкина,21,40,55.7620,37.6020
+Москва,проспект Мира,,,55.7800,37.6330
+Москва,улица Мира,,,55.7000,37.5000
+Санкт-Петербург,,,,59.9386,30.3141
+Санкт-Петербург,Невский проспект,1,100,59.9350,30.3250
+"""
+
+
+@pytest.fixture
+def geocoder(tmp_path):
+    """Load a small gazetteer."""
+    path = tmp_path / "gazetteer.csv"
+    path.write_text(GAZETTEER, encoding="utf-8")
+    return Geocoder.from_csv(str(path), max_typos=2)
+
+
+def test_normalize_street():
+    """Street types are canonical and moved after the name."""
+    assert normalize_street("ул. Пушкина") == "пушкина улица"
+    assert normalize_street("Пушкина улица") == "пушкина улица"
+    assert normalize_street("пр-т Мира") == "мира проспект"
+
+
+def test_trie_search():
+    """Exact, typo and prefix matches are found, best first."""
+    trie = Trie()
+    for key in ["пушкина улица", "пушкинская улица", "мира проспект"]:
+        trie.add(key, key)
+
+    assert trie.search("пушкина улица", 1)[0][2] == "пушкина улица"
+    assert trie.search("пушкена улица", 1)[0][2] == "пушкина улица"
+    assert [item[2] for item in trie.search("пушкин", 0)] == ["пушкина улица", "пушкинская улица"]
+    assert trie.search("лесная", 1) == []
+
+
+@pytest.mark.parametrize("address, precision, coordinates", [
+    ("Москва, ул. Пушкина, д. 10", "house", (55.7610, 37.6010)),
+    ("москва пушкина 25", "house", (55.7620, 37.6020)),
+    ("Москва, улица Пушкена, 30", "house", (55.7620, 37.6020)),
+    ("Москва, Пушкина", "street", (55.7600, 37.6000)),
+    ("Москва, ул. Пушкина, 99", "street", (55.7600, 37.6000)),
+    ("Москва, пр-т Мира, 5", "street", (55.7800, 37.6330)),
+    ("Москва, ул. Мира", "street", (55.7000, 37.5000)),
+    ("Санкт-Петербург, Невский пр., 28", "house", (59.9350, 30.3250)),
+    ("Невский проспект 28", "house", (59.9350, 30.3250)),
+    ("Москва, ул. Неизвестная, 1", "city", (55.7558, 37.6173)),
+])
+def test_geocode(geocoder, address, precision, coordinates):
+    """Free-text addresses resolve to the most precise known position."""
+    result = geocoder.geocode(address)
+
+    assert result.precision == precision
+    assert (result.latitude, result.longitude) == coordinates
+
+
+def test_geocode_unknown(geocoder):
+    """Addresses outside the gazetteer are not resolved."""
+    assert geocoder.geocode("Казань, ул. Баумана, 1") is None
+    assert geocoder.geocode("...") is None
+
+
+def test_geocode_cache(geocoder):
+    """Spellings with the same normalized form share one cache entry."""
+    geocoder.geocode("Москва, ул. Пушкина, 10")
+    geocoder.geocode("москва  ул пушкина 10")
+
+    info = geocoder.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_manual_location_is_geocoded(geocoder, monkeypatch, mock_message, mock_state):
+    """Manually entered addresses get coordinates next to the address."""
+    monkeypatch.setattr(geocoder_module, "_geocoder", geocoder)
+    mock_message.text = "Москва, ул. Пушкина, 10"
+    mock_state.get_data.return_value = {"pet_info": {"pet_type": "dog"}}
+
+    await process_manual_location(mock_message, mock_state)
+
+    location = mock_state.update_data.call_args[1]["pet_info"]["location"]
+    assert location["address"] == "Москва, ул. Пушкина, 10"
+    assert (location["latitude"], location["longitude"]) == (55.7610, 37.6010)
+    assert "Найдено на карте" in mock_message.answer.call_args[0][0]
@@ -0,0 +1,43 @@
+import pytest
+
+from tg_bot_pet911.utils import images
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture(autouse=True)
+def image_executor():
+    """Stop the process pool after each test."""
+    yield
+    images.shutdown_image_executor()
+
+
+@pytest.mark.asyncio
+async def test_process_photos(tmp_path):
+    """Thumbnails and a medium JPEG are written next to the original and the photo is hashed."""
+    Image.new("RGB", (2000, 1000), "orange").save(tmp_path / "dog_male_a1_image_1.png")
+
+    processed = await images.process_photos(str(tmp_path), ["dog_male_a1_image_1.png"])
+
+    result = processed["dog_male_a1_image_1.png"]
+    assert result["derivatives"] == {
+        "medium": "dog_male_a1_image_1_medium.jpg",
+        "thumb_128": "dog_male_a1_image_1_thumb_128.jpg",
+        "thumb_320": "dog_male_a1_image_1_thumb_320.jpg",
+    }
+    assert len(result["dhash"]) == 16
+    with Image.open(tmp_path / "dog_male_a1_image_1_medium.jpg") as medium:
+        assert medium.size == (1280, 640)
+    with Image.open(tmp_path / "dog_male_a1_image_1_thumb_128.jpg") as thumb:
+        assert thumb.size == (128, 128)
+
+
+@pytest.mark.asyncio
+async def test_broken_photo_is_skipped(tmp_path):
+    """A photo that cannot be decoded is left out."""
+    Image.new("RGB", (100, 100), "white").save(tmp_path / "good.jpg")
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+
+    processed = await images.process_photos(str(tmp_path), ["good.jpg", "broken.jpg"])
+
+    assert list(processed) == ["good.jpg"]
@@ -0,0 +1,196 @@
+import asyncio
+import pytest
+
+from tg_bot_pet911.utils import job_queue
+from tg_bot_pet911.utils.job_queue import PersistenceQueue
+
+
+@pytest.fixture
+def handled(monkeypatch):
+    """Register test job handlers and collect what they processed."""
+    processed = []
+
+    async def record(bot, payload):
+        processed.append(payload)
+
+    async def explode(bot, payload):
+        raise RuntimeError("disk full")
+
+    async def refuse(bot, payload):
+        raise job_queue.PermanentJobError("caption too long")
+
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "record", record)
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "explode", explode)
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "refuse", refuse)
+    return processed
+
+
+@pytest.mark.asyncio
+async def test_workers_process_jobs(tmp_path, handled):
+    """Enqueued jobs are processed by the worker pool and removed."""
+    queue = PersistenceQueue(str(tmp_path / "jobs.sqlite3"))
+    await queue.start(bot=None, workers=2)
+
+    for i in range(5):
+        queue.enqueue("record", {"n": i})
+    for _ in range(100):
+        if queue.pending_count() == 0:
+            break
+        await asyncio.sleep(0.02)
+    await queue.stop()
+
+    assert sorted(payload["n"] for payload in handled) == [0, 1, 2, 3, 4]
+    assert queue.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_jobs_survive_restart(tmp_path, handled, monkeypatch):
+    """Jobs left pending or running by a killed process are processed after restart."""
+    monkeypatch.setattr(job_queue.time, "time", lambda: 0.0)
+    db_path = str(tmp_path / "jobs.sqlite3")
+    killed = PersistenceQueue(db_path, lease_seconds=60)
+    killed.enqueue("record", {"n": 1})
+    killed.enqueue("record", {"n": 2})
+    killed._claim()  # Job 1 was running when the process died
+
+    # Restarted after the lease ran out
+    monkeypatch.setattr(job_queue.time, "time", lambda: 61.0)
+    queue = PersistenceQueue(db_path)
+    await queue.start(bot=None, workers=0)
+    await queue.run_pending(bot=None)
+
+    assert [payload["n"] for payload in handled] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_live_leases_are_not_taken_over(tmp_path, handled, monkeypatch):
+    """A second process leaves the jobs of a live worker alone and takes over expired leases only."""
+    clock = {"now": 0.0}
+    monkeypatch.setattr(job_queue.time, "time", lambda: clock["now"])
+    db_path = str(tmp_path / "jobs.sqlite3")
+    live = PersistenceQueue(db_path, lease_seconds=60)
+    live.enqueue("record", {"n": 1})
+    assert live._claim()["id"] == 1
+
+    # Starting another process sharing the database requeues nothing
+    clock["now"] = 50.0
+    other = PersistenceQueue(db_path, lease_seconds=60)
+    await other.start(bot=None, workers=0)
+    await other.run_pending(bot=None)
+    assert handled == []
+
+    # The heartbeat keeps the job with the live worker past the first lease
+    assert live._renew() == 1
+    clock["now"] = 100.0
+    await other.run_pending(bot=None)
+    assert handled == []
+
+    # Once the live worker stops renewing, the lease runs out and the job is taken over
+    clock["now"] = 111.0
+    await other.run_pending(bot=None)
+    assert [payload["n"] for payload in handled] == [1]
+    assert other.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_stop_releases_running_jobs(tmp_path, monkeypatch):
+    """Jobs interrupted by stop go straight back to the queue, without waiting for the lease."""
+    started = asyncio.Event()
+
+    async def hang(bot, payload):
+        started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "hang", hang)
+    queue = PersistenceQueue(str(tmp_path / "jobs.sqlite3"), lease_seconds=600)
+    queue.enqueue("hang", {})
+    await queue.start(bot=None, workers=1)
+    await asyncio.wait_for(started.wait(), 5)
+    await queue.stop()
+
+    other = PersistenceQueue(queue.db_path)
+    assert other._claim()["kind"] == "hang"
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_are_retried_then_given_up(tmp_path, handled, monkeypatch):
+    """A failing job is retried with backoff until it runs out of attempts."""
+    monkeypatch.setattr(job_queue.time, "time", lambda: 0.0)
+    queue = PersistenceQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2)
+    queue.enqueue("explode", {"n": 1})
+
+    await queue.run_pending(bot=None)
+    assert queue.pending_count() == 1
+
+    # Run again once the backoff has passed
+    monkeypatch.setattr(job_queue.time, "time", lambda: 100.0)
+    await queue.run_pending(bot=None)
+
+    failed = queue.failed_jobs()
+    assert len(failed) == 1
+    assert failed[0]["attempts"] == 2
+    assert "disk full" in failed[0]["error"]
+
+
+@pytest.mark.asyncio
+async def test_permanent_errors_are_not_retried(tmp_path, handled):
+    """A job failing with PermanentJobError is given up after the first attempt."""
+    queue = PersistenceQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=5)
+    queue.enqueue("refuse", {"n": 1})
+
+    await queue.run_pending(bot=None)
+
+    assert queue.pending_count() == 0
+    failed = queue.failed_jobs()
+    assert [job["attempts"] for job in failed] == [1]
+    assert "caption too long" in failed[0]["error"]
+
+
+class RacingConnection:
+    """Connection letting another queue claim right after a select, before the update."""
+
+    def __init__(self, conn, other: PersistenceQueue):
+        self._conn = conn
+        self._other = other
+        self.stolen = []
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def execute(self, sql, params=()):
+        cursor = self._conn.execute(sql, params)
+        if sql.startswith("SELECT id, kind") and not self.stolen:
+            row = cursor.fetchone()
+            self.stolen.append(self._other._claim())
+            return FetchedRow(row)
+        return cursor
+
+
+class FetchedRow:
+    """Cursor stand-in returning a row read earlier."""
+
+    def __init__(self, row):
+        self._row = row
+
+    def fetchone(self):
+        return self._row
+
+
+@pytest.mark.asyncio
+async def test_two_queues_never_lease_the_same_job(tmp_path, handled):
+    """A job leased by another process between the select and the update is skipped."""
+    db_path = str(tmp_path / "jobs.sqlite3")
+    first = PersistenceQueue(db_path)
+    second = PersistenceQueue(db_path)
+    first.enqueue("record", {"n": 1})
+    first.enqueue("record", {"n": 2})
+    racing = first._conn = RacingConnection(first._conn, second)
+
+    job = first._claim()
+
+    assert racing.stolen[0]["id"] == 1
+    assert job["id"] == 2
+    assert first._claim() is None
@@ -0,0 +1,91 @@
+import json
+import os
+import pytest
+
+from tg_bot_pet911.utils.log_store import PetLogStore
+
+
+def make_record(pet_id: str, comment: str = "test") -> dict:
+    """Create a pet record shaped like the saved JSON."""
+    return {
+        "id": pet_id,
+        "user_id": 123456789,
+        "pet_type": "dog",
+        "gender": "male",
+        "location": {"latitude": None, "longitude": None, "address": "Москва"},
+        "comment": comment,
+        "created_at": "2025-05-08 07:51:50",
+        "photo_files": [f"dog_male_{pet_id}_image_1.jpg"]
+    }
+
+
+def segment_files(root) -> list:
+    """List segment files in a log store directory."""
+    return sorted(name for name in os.listdir(root) if name.endswith(".log"))
+
+
+def test_append_and_get(tmp_path):
+    """Records are read back by id, and the latest version wins."""
+    store = PetLogStore(str(tmp_path))
+    store.append(make_record("a1"), "20250508_075149_dog_male_a1")
+    store.append(make_record("a1", comment="updated"))
+    store.append(make_record("a2"))
+
+    assert store.get("a1")["comment"] == "updated"
+    assert len(store) == 2
+
+    store.delete("a2")
+    assert store.get("a2") is None
+    assert "a2" not in store
+
+
+def test_rotation_and_compaction(tmp_path):
+    """Segments rotate by size and sealed segments are compacted."""
+    store = PetLogStore(str(tmp_path), segment_max_bytes=300, compact_segments=3)
+    for i in range(10):
+        store.append(make_record("same", comment=f"version {i}"))
+    store.append(make_record("other"))
+
+    # Superseded versions are gone after compaction
+    assert len(segment_files(tmp_path)) <= 3
+    assert store.get("same")["comment"] == "version 9"
+    assert store.get("other")["id"] == "other"
+
+    # A fresh store sees the same data
+    reopened = PetLogStore(str(tmp_path), segment_max_bytes=300, compact_segments=3)
+    assert reopened.get("same")["comment"] == "version 9"
+    assert len(reopened) == 2
+
+
+def test_recovers_from_torn_write(tmp_path):
+    """A partially written record is dropped and missing index lines are rebuilt."""
+    store = PetLogStore(str(tmp_path))
+    store.append(make_record("a1"))
+    segment = os.path.join(tmp_path, segment_files(tmp_path)[-1])
+
+    # Simulate a crash: record written without its index line, then a torn write
+    with open(segment, "ab") as f:
+        f.write(json.dumps({"id": "a2", "record": make_record("a2"), "seq": 2}).encode() + b"\n")
+        f.write(b'{"id": "a3", "rec')
+
+    reopened = PetLogStore(str(tmp_path))
+    assert reopened.get("a2")["id"] == "a2"
+    assert reopened.get("a3") is None
+    reopened.append(make_record("a4"))
+    assert PetLogStore(str(tmp_path)).get("a4")["id"] == "a4"
+
+
+def test_materialize(tmp_path):
+    """A record is written back in the legacy directory layout."""
+    store = PetLogStore(str(tmp_path / "log"))
+    with open(os.path.join(store.photos_path, "dog_male_a1_image_1.jpg"), "wb") as f:
+        f.write(b"jpeg")
+    store.append(make_record("a1"), "20250508_075149_dog_male_a1")
+
+    pet_dir = store.materialize("a1", str(tmp_path / "pets"))
+
+    assert pet_dir == str(tmp_path / "pets" / "20250508_075149_dog_male_a1")
+    with open(os.path.join(pet_dir, "dog_male_a1_data.json"), encoding="utf-8") as f:
+        assert json.load(f) == make_record("a1")
+    assert os.path.exists(os.path.join(pet_dir, "dog_male_a1_image_1.jpg"))
+    assert store.materialize("missing", str(tmp_path / "pets")) is None
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils.memory_storage import ExpiringMemoryStorage
+
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=42, chat_id=user_id, user_id=user_id)
+
+
+async def start_draft(storage: ExpiringMemoryStorage, user_id: int):
+    await storage.set_state(key(user_id), PetRegistration.uploading_photos)
+    await storage.set_data(key(user_id), {"pet_info": {"user_id": user_id, "photos": ["a", "b"]}})
+
+
+@pytest.mark.asyncio
+async def test_idle_conversations_expire():
+    """Conversations expire a TTL after they were last used, active ones stay."""
+    storage = ExpiringMemoryStorage(ttl=100, archive_path=None)
+    for user_id in range(3):
+        await start_draft(storage, user_id)
+    now = time.monotonic()
+
+    assert await storage.expire(now + 50) == 0
+    # User 1 comes back, moving the deadline
+    storage._deadlines[key(1)] = now + 150
+    assert await storage.expire(now + 101) == 2
+    assert storage.live_conversations == 1
+    assert await storage.get_data(key(0)) == {}
+    assert await storage.get_state(key(1)) == PetRegistration.uploading_photos.state
+
+    assert await storage.expire(now + 151) == 1
+    assert storage.metrics() == {"live_conversations": 0, "bytes_held": 0, "expired": 3, "archived": 0}
+    assert len(storage._heap) == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_accounting():
+    """Bytes held follow the data, finished and unknown conversations take nothing."""
+    storage = ExpiringMemoryStorage(ttl=100, archive_path=None)
+    await start_draft(storage, 1)
+    size = storage.bytes_held
+    assert size > 0
+
+    await storage.set_data(key(1), {"pet_info": {"user_id": 1, "photos": ["a", "b", "c"]}})
+    assert storage.bytes_held == size + 4
+    assert await storage.get_state(key(2)) is None
+    assert storage.live_conversations == 1
+
+    # state.clear() ends the conversation
+    await storage.set_state(key(1), None)
+    await storage.set_data(key(1), {})
+    assert storage.metrics()["live_conversations"] == 0
+    assert storage.bytes_held == 0
+    assert await storage.expire(time.monotonic() + 101) == 0
+
+
+@pytest.mark.asyncio
+async def test_abandoned_drafts_are_archived(tmp_path):
+    """Expired drafts with data are appended to the archive before being dropped."""
+    archive = tmp_path / "drafts" / "abandoned.jsonl"
+    storage = ExpiringMemoryStorage(ttl=0.05, archive_path=str(archive), resolution=0.01)
+    storage.start()
+    await start_draft(storage, 7)
+    await storage.set_state(key(8), PetRegistration.selecting_type)
+
+    await asyncio.sleep(0.2)
+
+    assert storage.metrics()["expired"] == 2
+    assert storage.metrics()["archived"] == 1
+    record = json.loads(archive.read_text().splitlines()[0])
+    assert record["user_id"] == 7
+    assert record["state"] == PetRegistration.uploading_photos.state
+    assert record["data"]["pet_info"]["photos"] == ["a", "b"]
+    await storage.close()
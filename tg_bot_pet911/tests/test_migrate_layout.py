@@ -0,0 +1,66 @@
+import os
+import pytest
+from datetime import datetime
+
+from tg_bot_pet911.utils import catalog, storage
+from tg_bot_pet911.utils.migrate_layout import migrate
+
+
+@pytest.fixture
+def pets_path(tmp_path, monkeypatch):
+    """Redirect saved pet data and the catalog to a temporary directory."""
+    path = tmp_path / "pets"
+    path.mkdir()
+    monkeypatch.setattr(storage, "PETS_DATA_PATH", str(path))
+    monkeypatch.setattr(catalog, "_catalog", catalog.PetCatalog(str(tmp_path / "catalog.sqlite3")))
+    return path
+
+
+def make_flat_dir(pets_path, name: str, pet_id: str):
+    """Create a pet directory in the flat layout."""
+    pet_dir = pets_path / name
+    pet_dir.mkdir()
+    (pet_dir / f"dog_male_{pet_id}_data.json").write_text("{}", encoding="utf-8")
+    return pet_dir
+
+
+def test_pet_dir_path_layouts(pets_path):
+    """The sharded layout nests directories by date and id prefix."""
+    created = datetime(2025, 5, 8, 7, 51, 49)
+    name = "20250508_075149_dog_male_ec5af450"
+
+    assert storage.pet_dir_path(name, "ec5af450", created, layout="sharded") == os.path.join(
+        str(pets_path), "2025", "05", "08", "ec", name
+    )
+    assert storage.pet_dir_path(name, "ec5af450", created, layout="flat") == os.path.join(str(pets_path), name)
+
+
+def test_migrate_moves_flat_directories(pets_path):
+    """Flat directories are moved into the sharded layout and stay resolvable."""
+    make_flat_dir(pets_path, "20250508_075149_dog_male_ec5af450", "ec5af450")
+    make_flat_dir(pets_path, "20250508_081751_dog_male_8660e701", "8660e701")
+    catalog.get_catalog().add_record(
+        {"id": "ec5af450", "created_at": "2025-05-08 07:51:50"},
+        str(pets_path / "20250508_075149_dog_male_ec5af450")
+    )
+
+    moved, errors = migrate(str(pets_path), workers=2)
+
+    assert (moved, errors) == (2, [])
+    expected = pets_path / "2025" / "05" / "08" / "ec" / "20250508_075149_dog_male_ec5af450"
+    assert (expected / "dog_male_ec5af450_data.json").exists()
+    assert catalog.get_catalog().get_pet_dir("ec5af450") == str(expected)
+
+    # Resolved through the catalog, and by looking in the sharded layout
+    assert storage.resolve_pet_dir("ec5af450") == str(expected)
+    assert storage.resolve_pet_dir("8660e701").endswith(os.path.join("86", "20250508_081751_dog_male_8660e701"))
+    assert storage.resolve_pet_dir("00000000") is None
+
+
+def test_migrate_dry_run_moves_nothing(pets_path):
+    """A dry run only reports the planned moves."""
+    pet_dir = make_flat_dir(pets_path, "20250508_075149_dog_male_ec5af450", "ec5af450")
+
+    assert migrate(str(pets_path), dry_run=True) == (0, [])
+    assert pet_dir.exists()
+    assert storage.resolve_pet_dir("ec5af450") == str(pet_dir)
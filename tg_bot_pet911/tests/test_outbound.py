@@ -0,0 +1,101 @@
+import asyncio
+import time
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetFile, SendMediaGroup, SendMessage
+from aiogram.types import InputMediaPhoto
+
+from tg_bot_pet911.bot.outbound import OutboundScheduler, Priority, outbound_priority
+
+
+@pytest.mark.asyncio
+async def test_priorities_when_global_budget_is_spent():
+    """Waiting user replies go before channel posts, channel posts before notifications."""
+    scheduler = OutboundScheduler(global_rate=20, chat_rate=100, chat_burst=1)
+    await scheduler.acquire(999, cost=20)  # Spend the whole global burst
+    order = []
+
+    async def send(chat_id: int, priority: Priority, name: str):
+        await scheduler.acquire(chat_id, priority)
+        order.append(name)
+
+    tasks = [
+        asyncio.create_task(send(1, Priority.NOTIFICATION, "admin")),
+        asyncio.create_task(send(2, Priority.CHANNEL, "channel")),
+        asyncio.create_task(send(3, Priority.USER, "user")),
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth() == {"user": 1, "channel": 1, "notification": 1}
+
+    await asyncio.gather(*tasks)
+    assert order == ["user", "channel", "admin"]
+    assert scheduler.queue_depth() == {"user": 0, "channel": 0, "notification": 0}
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_chat_pacing_does_not_hold_back_other_chats():
+    """A busy chat is paced to its own rate while another chat is served at once."""
+    scheduler = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=1)
+    sent_at = {}
+
+    async def send(chat_id: int, name: str):
+        await scheduler.acquire(chat_id)
+        sent_at[name] = time.monotonic()
+
+    started = time.monotonic()
+    await asyncio.gather(send(1, "a1"), send(1, "a2"), send(1, "a3"), send(2, "b1"))
+
+    assert sent_at["a3"] - started >= 0.09  # Two waits of 1/20 s
+    assert sent_at["b1"] - started < 0.04
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured(mock_bot):
+    """A 429 blocks the chat for retry_after and the request is sent again."""
+    scheduler = OutboundScheduler(max_retries=1)
+    method = SendMessage(chat_id=1, text="hello")
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        return "sent"
+
+    assert await scheduler(make_request, mock_bot, method) == "sent"
+    assert scheduler.metrics()["retried"] == 1
+    assert scheduler.metrics()["sent"] == 1
+
+    async def always_flooded(bot, method):
+        raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        await scheduler(always_flooded, mock_bot, method)
+    await scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_classification_and_bypass(mock_bot, monkeypatch):
+    """Channel posts are recognised by chat, notifications by context, other methods are not paced."""
+    monkeypatch.setattr("tg_bot_pet911.bot.outbound.CHANNEL_ID", "-100123")
+    scheduler = OutboundScheduler(global_rate=20, chat_burst=3)
+    seen = []
+
+    async def make_request(bot, method):
+        seen.append(type(method).__name__)
+        return True
+
+    assert scheduler.classify(-100123) == Priority.CHANNEL
+    assert scheduler.classify(42) == Priority.USER
+    with outbound_priority(Priority.NOTIFICATION):
+        assert scheduler.classify(42) == Priority.NOTIFICATION
+
+    album = SendMediaGroup(chat_id=-100123, media=[InputMediaPhoto(media=str(i)) for i in range(3)])
+    await scheduler(make_request, mock_bot, album)
+    await scheduler(make_request, mock_bot, GetFile(file_id="photo"))
+
+    assert seen == ["SendMediaGroup", "GetFile"]
+    assert scheduler.metrics()["sent"] == 1
+    await scheduler.close()
@@ -0,0 +1,51 @@
+import random
+import pytest
+
+from tg_bot_pet911.utils.phash import BKTree, DuplicateIndex, dhash, hamming
+
+
+def test_bk_tree_matches_linear_scan():
+    """Radius queries return exactly what a full scan would."""
+    rng = random.Random(42)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    tree = BKTree()
+    for i, value_hash in enumerate(hashes):
+        tree.add(value_hash, i)
+
+    query = hashes[7] ^ 0b1011  # 3 bits away from an indexed hash
+    expected = sorted(i for i, value_hash in enumerate(hashes) if hamming(query, value_hash) <= 12)
+
+    results = tree.search(query, 12)
+
+    assert sorted(value for _distance, value in results) == expected
+    assert results[0] == (3, 7)
+    assert len(tree) == 2000
+
+
+def test_duplicate_index():
+    """Similar records are found once each, closest first, without the record itself."""
+    index = DuplicateIndex(radius=4)
+    index.add_record({"id": "a1", "photo_hashes": {"a1_1.jpg": "00000000000000ff", "a1_2.jpg": "f0f0f0f0f0f0f0f0"}})
+    index.add_record({"id": "a2", "photo_hashes": {"a2_1.jpg": "00000000000000f0"}})
+    index.add_record({"id": "a2", "photo_hashes": {"a2_1.jpg": "00000000000000f0"}})  # Indexed once
+
+    duplicates = index.find_duplicates(["00000000000000fe", "00000000000000f0"], exclude_id="a2")
+
+    assert duplicates == [{"id": "a1", "photo": "a1_1.jpg", "distance": 1}]
+    assert [d["id"] for d in index.find_duplicates(["00000000000000f0"])] == ["a2", "a1"]
+
+
+def test_dhash_tolerates_resizing():
+    """A resized copy hashes close to the original, a different picture does not."""
+    Image = pytest.importorskip("PIL.Image")
+    ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+    original = Image.new("RGB", (640, 480), "white")
+    draw = ImageDraw.Draw(original)
+    draw.ellipse((100, 80, 400, 380), fill="brown")
+    draw.rectangle((420, 50, 600, 200), fill="black")
+    other = Image.new("RGB", (640, 480), "white")
+    ImageDraw.Draw(other).rectangle((0, 240, 640, 480), fill="green")
+
+    assert hamming(dhash(original), dhash(original.resize((320, 240)))) <= 4
+    assert hamming(dhash(original), dhash(other)) > 10
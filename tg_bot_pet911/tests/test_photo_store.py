@@ -0,0 +1,50 @@
+import hashlib
+import os
+import pytest
+
+from tg_bot_pet911.utils.photo_store import PhotoStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Create a photo store in a temporary directory."""
+    photo_store = PhotoStore(str(tmp_path / "blobs"))
+    yield photo_store
+    photo_store.close()
+
+
+def test_put_and_lookup(store):
+    """Stored photos are found by file_unique_id and named by content hash."""
+    blob = store.put("unique_1", b"jpeg bytes")
+
+    assert blob.sha256 == hashlib.sha256(b"jpeg bytes").hexdigest()
+    assert store.lookup("unique_1") == blob
+    assert store.lookup("unknown") is None
+    assert store.verify(blob)
+
+
+def test_same_content_is_stored_once(store):
+    """Different file_unique_ids with the same content share one blob."""
+    first = store.put("unique_1", b"jpeg bytes")
+    second = store.put("unique_2", b"jpeg bytes")
+
+    assert first.path == second.path
+    assert len(os.listdir(os.path.dirname(first.path))) == 1
+
+
+def test_damaged_blob_is_not_returned(store, tmp_path):
+    """A blob whose size changed is treated as missing and can be restored."""
+    blob = store.put("unique_1", b"jpeg bytes")
+    with open(blob.path, "wb") as f:
+        f.write(b"broken")
+
+    assert store.lookup("unique_1") is None
+    assert not store.verify(blob)
+
+    restored = store.put("unique_1", b"jpeg bytes")
+    assert store.verify(restored)
+
+    # Blobs are linked into pet directories
+    destination = str(tmp_path / "image_1.jpg")
+    store.link(restored, destination)
+    assert os.stat(destination).st_ino == os.stat(restored.path).st_ino
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+
+from tg_bot_pet911.utils import job_queue
+from tg_bot_pet911.utils.job_queue import PersistenceQueue
+from tg_bot_pet911.utils.shutdown import GracefulShutdown
+
+
+async def handle_update(shutdown: GracefulShutdown, seconds: float, done: list):
+    """An update handler that takes a while."""
+    async def handler(event, data):
+        await asyncio.sleep(seconds)
+        done.append(seconds)
+
+    await shutdown.update_middleware(handler, None, {})
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_updates_then_cancels():
+    """Updates finishing before the deadline complete, the rest are cancelled and counted."""
+    shutdown = GracefulShutdown(timeout=0.1)
+    done = []
+    tasks = [asyncio.create_task(handle_update(shutdown, seconds, done)) for seconds in (0.01, 0.05, 5)]
+    await asyncio.sleep(0)
+    assert shutdown.in_flight == 3
+
+    assert await shutdown.drain_updates() == 1
+    assert done == [0.01, 0.05]
+    assert tasks[2].cancelled()
+    assert shutdown.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_drain_finishes_running_jobs(tmp_path, monkeypatch):
+    """Running jobs finish within the deadline, queued ones stay on disk for the next start."""
+    started = asyncio.Event()
+    finished = []
+
+    async def slow(bot, payload):
+        started.set()
+        await asyncio.sleep(payload["seconds"])
+        finished.append(payload["seconds"])
+
+    monkeypatch.setitem(job_queue.JOB_HANDLERS, "slow", slow)
+    queue = PersistenceQueue(str(tmp_path / "jobs.sqlite3"))
+    await queue.start(bot=None, workers=1)
+    queue.enqueue("slow", {"seconds": 0.05})
+    queue.enqueue("slow", {"seconds": 0.05})
+    await started.wait()
+
+    assert await queue.drain(timeout=1) == 0
+    assert finished == [0.05]
+    assert queue.pending_count() == 1
+
+    # A job running past the deadline is interrupted and picked up again on the next start
+    started.clear()
+    queue = PersistenceQueue(str(tmp_path / "slow.sqlite3"))
+    await queue.start(bot=None, workers=1)
+    queue.enqueue("slow", {"seconds": 5})
+    await started.wait()
+
+    assert await queue.drain(timeout=0.05) == 1
+    assert queue.pending_count() == 1
+
+
+@pytest.mark.asyncio
+async def test_shutdown_report(tmp_path, monkeypatch):
+    """The whole sequence drains updates and jobs, flushes writes and reports what was left."""
+    flushed = []
+
+    async def flush():
+        flushed.append(True)
+
+    monkeypatch.setattr("tg_bot_pet911.utils.shutdown.flush_pending_writes", flush)
+    queue = PersistenceQueue(str(tmp_path / "jobs.sqlite3"))
+    await queue.start(bot=None, workers=1)
+    shutdown = GracefulShutdown(timeout=0.1)
+    done = []
+    asyncio.create_task(handle_update(shutdown, 0.01, done))
+    await asyncio.sleep(0)
+
+    await shutdown.run(queue)
+
+    assert done == [0.01]
+    assert flushed == [True]
+    assert shutdown.report["abandoned_updates"] == 0
+    assert shutdown.report["interrupted_jobs"] == 0
+    assert shutdown.report["queued_jobs"] == 0
@@ -0,0 +1,114 @@
+import sys
+import pytest
+from aiogram import Dispatcher
+from unittest.mock import AsyncMock
+
+from tg_bot_pet911.bot.routers import ROUTERS, RouterSpec, include_routers
+from tg_bot_pet911.states.pet_states import NearbySearch, PetRegistration, SubscriptionSetup
+from tg_bot_pet911.utils import subscriptions as subscriptions_module
+from tg_bot_pet911.utils.subscriptions import SubscriptionStore
+from tg_bot_pet911.utils.startup_profile import StartupProfiler
+
+
+def make_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "User"},
+            "text": text
+        }
+    }
+
+
+@pytest.fixture
+def dp():
+    """Dispatcher with the registry's routers, detached again afterwards so another test can include them."""
+    dispatcher = Dispatcher()
+    dispatcher.included = include_routers(dispatcher)
+    yield dispatcher
+    for router in dispatcher.sub_routers:
+        router._parent_router = None
+
+
+def test_test_router_is_disabled_by_default(dp):
+    """Production startup does not register /test unless ENABLE_TEST_ROUTER is set."""
+    included = dp.included
+
+    assert included[0] == "tg_bot_pet911.bot.handlers.cancel:router"
+    assert len(included) == len(ROUTERS) - 1
+    assert not any("tests" in path for path in included)
+
+
+@pytest.mark.asyncio
+async def test_lazy_command_imports_on_first_use(tmp_path, monkeypatch, mock_bot):
+    """A lazy router imports its handler only when the command is first used."""
+    (tmp_path / "lazy_command_module.py").write_text(
+        "calls = []\n"
+        "async def handler(message, state):\n"
+        "    calls.append(message.text)\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    dp = Dispatcher()
+    include_routers(dp, [RouterSpec("lazy_command_module:handler", lazy_commands=["ping"])])
+
+    assert "lazy_command_module" not in sys.modules
+    await dp.feed_raw_update(mock_bot, make_update(1, "hello"))
+    assert "lazy_command_module" not in sys.modules
+
+    await dp.feed_raw_update(mock_bot, make_update(2, "/ping"))
+    await dp.feed_raw_update(mock_bot, make_update(3, "/ping again"))
+    assert sys.modules["lazy_command_module"].calls == ["/ping", "/ping again"]
+    monkeypatch.delitem(sys.modules, "lazy_command_module")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("step", [PetRegistration.entering_comment, PetRegistration.entering_location])
+@pytest.mark.parametrize("command, expected", [
+    ("/nearby", NearbySearch.waiting_for_location),
+    ("/subscribe", SubscriptionSetup.waiting_for_location)
+])
+async def test_commands_interrupt_registration_steps(dp, tmp_path, monkeypatch, mock_bot, step, command, expected):
+    """/nearby and /subscribe start their flow from text-taking steps instead of becoming the step's input."""
+    monkeypatch.setattr(subscriptions_module, "_subscription_store", SubscriptionStore(str(tmp_path / "s.sqlite3")))
+    # Replies are not sent anywhere
+    monkeypatch.setattr(type(mock_bot), "__call__", AsyncMock())
+    state = dp.fsm.get_context(mock_bot, chat_id=1, user_id=1)
+    await state.set_state(step)
+    await state.update_data(pet_info={"pet_type": "dog"})
+
+    await dp.feed_raw_update(mock_bot, make_update(1, command))
+
+    assert await state.get_state() == expected.state
+    assert (await state.get_data())["pet_info"] == {"pet_type": "dog"}
+
+
+@pytest.mark.asyncio
+async def test_startup_profiler(tmp_path, monkeypatch, mock_bot):
+    """Import times exclude nested imports, the first update is timed once."""
+    (tmp_path / "profiled_outer.py").write_text("import profiled_inner\n")
+    (tmp_path / "profiled_inner.py").write_text("import time\ntime.sleep(0.05)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    profiler = StartupProfiler()
+    profiler.install()
+    try:
+        import profiled_outer  # noqa: F401
+    finally:
+        profiler.uninstall()
+    monkeypatch.delitem(sys.modules, "profiled_outer")
+    monkeypatch.delitem(sys.modules, "profiled_inner")
+
+    assert profiler.imports["profiled_inner"] >= 0.05
+    assert profiler.imports["profiled_outer"] < 0.05
+    assert profiler.slowest_imports(1)[0][0] == "profiled_inner"
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(profiler.first_update_middleware)
+    await dp.feed_raw_update(mock_bot, make_update(1, "hello"))
+    first_update = profiler.first_update
+    await dp.feed_raw_update(mock_bot, make_update(2, "hello"))
+
+    assert first_update is not None
+    assert profiler.first_update == first_update
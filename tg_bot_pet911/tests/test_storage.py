@@ -0,0 +1,142 @@
+import asyncio
+import io
+import json
+import os
+import pytest
+from types import SimpleNamespace
+
+from tg_bot_pet911.utils import catalog, log_store, photo_store, storage
+from tg_bot_pet911.app.models import PetInfo, PetLocation, PetPhoto
+
+
+class FakeDownloadBot:
+    """Bot stand-in that serves photo downloads with a delay."""
+    def __init__(self, fail_ids=(), delay=0.01):
+        self.fail_ids = set(fail_ids)
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.get_file_calls = 0
+
+    async def get_file(self, file_id):
+        self.get_file_calls += 1
+        await asyncio.sleep(self.delay)
+        if file_id in self.fail_ids:
+            raise RuntimeError(f"file {file_id} is gone")
+        return SimpleNamespace(file_path=f"photos/{file_id}.jpg")
+
+    async def download_file(self, file_path, destination=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        if destination is None:
+            return io.BytesIO(file_path.encode())
+        with open(destination, "wb") as f:
+            f.write(file_path.encode())
+
+
+def make_pet_info(photo_count: int) -> PetInfo:
+    """Create a complete PetInfo with the given number of photos."""
+    return PetInfo(
+        user_id=123456789,
+        chat_id=123456789,
+        username="test_user",
+        pet_type="dog",
+        gender="male",
+        photos=[
+            PetPhoto(file_id=f"file_{i}", file_unique_id=f"unique_{i}")
+            for i in range(photo_count)
+        ],
+        location=PetLocation(address="Москва, ул. Пушкина, д. 10"),
+        comment="test"
+    )
+
+
+@pytest.fixture
+def pets_path(tmp_path, monkeypatch):
+    """Redirect saved pet data to a temporary directory."""
+    path = tmp_path / "pets"
+    monkeypatch.setattr(storage, "PETS_DATA_PATH", str(path))
+    monkeypatch.setattr(catalog, "_catalog", catalog.PetCatalog(str(tmp_path / "catalog.sqlite3")))
+    monkeypatch.setattr(photo_store, "_photo_store", photo_store.PhotoStore(str(tmp_path / "blobs")))
+    return path
+
+
+@pytest.mark.asyncio
+async def test_save_pet_data_downloads_in_order(pets_path, monkeypatch):
+    """Photos are downloaded concurrently but keep their image_<n> order."""
+    monkeypatch.setattr(storage, "_download_semaphore", asyncio.Semaphore(2))
+    bot = FakeDownloadBot()
+
+    saved_dir, pet_data = await storage.save_pet_data(make_pet_info(5), bot)
+
+    prefix = f"dog_male_{pet_data['id']}"
+    assert pet_data["photo_files"] == [f"{prefix}_image_{i}.jpg" for i in range(1, 6)]
+    assert "photo_errors" not in pet_data
+    assert bot.max_active == 2
+    for filename in pet_data["photo_files"]:
+        assert os.path.exists(os.path.join(saved_dir, filename))
+
+    # The record is indexed in the catalog in the same step
+    record = catalog.get_catalog().get_record(pet_data["id"])
+    assert record["photo_files"] == pet_data["photo_files"]
+    assert record["pet_dir"] == saved_dir
+
+
+@pytest.mark.asyncio
+async def test_save_pet_data_keeps_successful_photos(pets_path):
+    """A failed photo is reported without dropping the others."""
+    bot = FakeDownloadBot(fail_ids={"file_1"})
+
+    saved_dir, pet_data = await storage.save_pet_data(make_pet_info(3), bot)
+
+    prefix = f"dog_male_{pet_data['id']}"
+    assert pet_data["photo_files"] == [f"{prefix}_image_1.jpg", f"{prefix}_image_3.jpg"]
+    assert pet_data["photo_errors"] == [
+        {"index": 2, "file_unique_id": "unique_1", "error": "file file_1 is gone"}
+    ]
+
+    with open(os.path.join(saved_dir, f"{prefix}_data.json"), encoding="utf-8") as f:
+        assert json.load(f)["photo_errors"][0]["index"] == 2
+
+
+@pytest.mark.asyncio
+async def test_save_pet_data_log_backend(pets_path, tmp_path, monkeypatch):
+    """The log backend appends the record instead of creating a directory."""
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "log")
+    monkeypatch.setattr(log_store, "_log_store", log_store.PetLogStore(str(tmp_path / "log")))
+
+    saved_path, pet_data = await storage.save_pet_data(make_pet_info(2), FakeDownloadBot())
+
+    assert not pets_path.exists()
+    assert saved_path.endswith(".log")
+    assert log_store.get_log_store().get(pet_data["id"]) == pet_data
+    assert catalog.get_catalog().get_record(pet_data["id"])["pet_dir"] is None
+
+
+@pytest.mark.asyncio
+async def test_save_pet_data_reuses_stored_photos(pets_path):
+    """A photo that is already stored is linked instead of downloaded again."""
+    bot = FakeDownloadBot()
+    first_dir, first = await storage.save_pet_data(make_pet_info(2), bot)
+    assert bot.get_file_calls == 2
+
+    second_dir, second = await storage.save_pet_data(make_pet_info(2), bot)
+
+    assert bot.get_file_calls == 2
+    assert second["photo_blobs"] == first["photo_blobs"]
+    first_photo = os.path.join(first_dir, first["photo_files"][0])
+    second_photo = os.path.join(second_dir, second["photo_files"][0])
+    assert os.stat(first_photo).st_ino == os.stat(second_photo).st_ino
+
+
+@pytest.mark.asyncio
+async def test_save_pet_data_without_photo_store(pets_path, monkeypatch):
+    """With the photo store disabled photos are downloaded straight to the pet directory."""
+    monkeypatch.setattr(storage, "PHOTO_STORE_ENABLED", False)
+
+    saved_dir, pet_data = await storage.save_pet_data(make_pet_info(1), FakeDownloadBot())
+
+    assert "photo_blobs" not in pet_data
+    assert os.path.exists(os.path.join(saved_dir, pet_data["photo_files"][0]))
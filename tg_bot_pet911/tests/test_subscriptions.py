@@ -0,0 +1,199 @@
+import asyncio
+import random
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from unittest.mock import MagicMock, patch
+
+from tg_bot_pet911.app.models import PetInfo, PetLocation, PetPhoto
+from tg_bot_pet911.bot.handlers.confirm import confirm_submission, process_notify_job
+from tg_bot_pet911.bot.handlers.subscribe import (
+    cmd_subscribe, process_subscription_location, process_subscription_radius, process_subscription_type
+)
+from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils import subscriptions as subscriptions_module
+from tg_bot_pet911.utils.geo_index import haversine_km
+from tg_bot_pet911.utils.memory_storage import ExpiringMemoryStorage
+from tg_bot_pet911.utils.subscriptions import Subscription, SubscriptionIndex, SubscriptionStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Use a subscription store in a temporary directory."""
+    subscription_store = SubscriptionStore(str(tmp_path / "subscriptions.sqlite3"))
+    monkeypatch.setattr(subscriptions_module, "_subscription_store", subscription_store)
+    monkeypatch.setattr(subscriptions_module, "_subscription_index", None)
+    yield subscription_store
+    subscription_store.close()
+
+
+def test_index_matches_linear_scan():
+    """Matching returns exactly the areas a full scan would."""
+    rng = random.Random(42)
+    index = SubscriptionIndex()
+    subscriptions = []
+    for i in range(5000):
+        subscription = Subscription(
+            i, i, i, rng.choice(["dog", "cat", None]),
+            55.5 + rng.random() * 0.5, 37.3 + rng.random() * 0.6, rng.choice([1, 3, 5, 10])
+        )
+        index.add(subscription)
+        subscriptions.append(subscription)
+
+    for _ in range(50):
+        lat, lon = 55.5 + rng.random() * 0.5, 37.3 + rng.random() * 0.6
+        expected = sorted(
+            s.id for s in subscriptions
+            if s.pet_type in (None, "dog") and haversine_km(lat, lon, s.latitude, s.longitude) <= s.radius_km
+        )
+        assert sorted(s.id for _distance, s in index.match(lat, lon, "dog")) == expected
+
+    for subscription in subscriptions[:2500]:
+        index.remove(subscription)
+    assert len(index) == 2500
+    assert all(s.id >= 2500 for _distance, s in index.match(55.75, 37.6, "cat"))
+
+
+def test_index_one_match_per_chat():
+    """A chat with several matching areas is notified once."""
+    index = SubscriptionIndex()
+    index.add(Subscription(1, 7, 70, None, 55.75, 37.60, 5))
+    index.add(Subscription(2, 7, 70, "dog", 55.76, 37.60, 5))
+    index.add(Subscription(3, 8, 80, "cat", 55.76, 37.60, 5))
+
+    matches = index.match(55.76, 37.60, "dog")
+
+    assert [s.id for _distance, s in matches] == [2]
+
+
+def test_subscribe_and_unsubscribe(store):
+    """Subscriptions are stored and indexed, and removed together."""
+    subscriptions_module.subscribe(1, 10, "dog", 55.75, 37.60, 3)
+    subscriptions_module.subscribe(1, 10, None, 59.93, 30.31, 1)
+
+    assert subscriptions_module.matching_chats(55.76, 37.60, "dog") == [(10, pytest.approx(1.11, abs=0.01))]
+    assert subscriptions_module.matching_chats(55.76, 37.60, "dog", exclude_chat_id=10) == []
+    assert len(store.list_user(1)) == 2
+
+    assert subscriptions_module.unsubscribe(1) == 2
+    assert subscriptions_module.matching_chats(55.76, 37.60, "dog") == []
+    assert store.list_user(1) == []
+
+
+@pytest.mark.asyncio
+async def test_subscribe_flow_saves_subscription(store, mock_callback_query, mock_state):
+    """The last step of /subscribe saves the area."""
+    mock_callback_query.data = "sub_type:any"
+    mock_state.get_data.return_value = {"subscription": {"latitude": 55.75, "longitude": 37.6, "radius_km": 5.0}}
+
+    await process_subscription_type(mock_callback_query, mock_state)
+
+    assert store.list_user(mock_callback_query.from_user.id)[0].pet_type is None
+    assert "5 км" in mock_callback_query.message.edit_text.call_args[0][0]
+    mock_state.set_state.assert_called_once_with(None)
+    mock_state.set_data.assert_called_once_with({})
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", ["sub_radius:1e6", "sub_radius:nan", "sub_radius:abc", "sub_type:whale"])
+async def test_subscribe_rejects_forged_choices(store, mock_callback_query, mock_state, data):
+    """Radii and pet types missing from the keyboards are refused without touching the state."""
+    mock_callback_query.data = data
+    mock_state.get_data.return_value = {"subscription": {"latitude": 55.75, "longitude": 37.6, "radius_km": 5.0}}
+    handler = process_subscription_radius if data.startswith("sub_radius") else process_subscription_type
+
+    await handler(mock_callback_query, mock_state)
+
+    assert mock_callback_query.answer.call_args.kwargs["show_alert"] is True
+    mock_state.update_data.assert_not_called()
+    mock_state.set_state.assert_not_called()
+    assert store.list_user(mock_callback_query.from_user.id) == []
+
+
+@pytest.mark.asyncio
+async def test_subscribe_keeps_unfinished_registration(store, mock_message, mock_callback_query):
+    """/subscribe in the middle of a registration returns to the same step with the report intact."""
+    state = FSMContext(ExpiringMemoryStorage(ttl=100, archive_path=None), StorageKey(bot_id=1, chat_id=2, user_id=3))
+    await state.set_state(PetRegistration.entering_comment)
+    await state.update_data(pet_info={"pet_type": "dog", "gender": "male"})
+
+    await cmd_subscribe(mock_message, state)
+    mock_message.location = MagicMock(latitude=55.75, longitude=37.6)
+    await process_subscription_location(mock_message, state)
+    mock_callback_query.data = "sub_radius:5"
+    await process_subscription_radius(mock_callback_query, state)
+    mock_callback_query.data = "sub_type:dog"
+    await process_subscription_type(mock_callback_query, state)
+
+    assert len(store.list_user(mock_callback_query.from_user.id)) == 1
+    assert await state.get_state() == PetRegistration.entering_comment.state
+    assert await state.get_data() == {"pet_info": {"pet_type": "dog", "gender": "male"}}
+
+
+def test_index_picks_up_subscriptions_of_other_workers(store):
+    """A refresh applies the subscriptions another worker added or deleted."""
+    subscriptions_module.subscribe(1, 10, "dog", 55.75, 37.62, 3)
+    assert subscriptions_module.refresh_subscription_index() == 0
+
+    other_worker = SubscriptionStore(store.db_path)
+    other_worker.add(2, 20, None, 55.75, 37.62, 5)
+    other_worker.remove_user(1)
+    other_worker.close()
+
+    assert subscriptions_module.refresh_subscription_index() == 2
+    assert subscriptions_module.matching_chats(55.75, 37.62, "dog") == [(20, 0.0)]
+    assert subscriptions_module.refresh_subscription_index() == 0
+
+
+@pytest.mark.asyncio
+async def test_confirm_queues_subscriber_notifications(store, mock_callback_query, mock_state, mock_bot):
+    """Confirmed reports inside a subscribed area queue a notification job."""
+    subscriptions_module.subscribe(2, 20, "dog", 55.75, 37.62, 3)
+    pet_info = PetInfo(user_id=1, chat_id=1, pet_type="dog", gender="male")
+    pet_info.location = PetLocation(latitude=55.753215, longitude=37.622504)
+    pet_info.photos = [PetPhoto(file_id="test_file_id", file_unique_id="test_file_unique_id")]
+    mock_state.get_data.return_value = {"pet_info": pet_info.model_dump()}
+
+    with patch('tg_bot_pet911.bot.handlers.confirm.get_persistence_queue') as mock_get_queue, \
+            patch('tg_bot_pet911.bot.handlers.confirm.CHANNEL_ID', None), \
+            patch('tg_bot_pet911.bot.handlers.confirm.ADMIN_IDS', []):
+        await confirm_submission(mock_callback_query, mock_state, mock_bot)
+
+    kinds = [call[0][0] for call in mock_get_queue.return_value.enqueue.call_args_list]
+    assert kinds == ["save_pet", "notify_subscribers"]
+    payload = mock_get_queue.return_value.enqueue.call_args[0][1]
+    assert [chat_id for chat_id, _distance in payload["recipients"]] == [20]
+
+
+@pytest.mark.asyncio
+async def test_notify_job_sends_concurrently(monkeypatch):
+    """Subscribers are notified concurrently and one failure does not stop the rest."""
+    from aiogram.exceptions import TelegramAPIError
+    from tg_bot_pet911.bot.handlers import confirm
+
+    monkeypatch.setattr(confirm, "SUBSCRIPTION_NOTIFY_CONCURRENCY", 10)
+    bot = MagicMock()
+    active = {"now": 0, "max": 0}
+    sent = []
+
+    async def send_message(chat_id, text):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        if chat_id == 3:
+            raise TelegramAPIError(method=MagicMock(), message="bot was blocked")
+        sent.append(chat_id)
+
+    bot.send_message = send_message
+    pet_info = PetInfo(user_id=1, chat_id=1, pet_type="dog", gender="male")
+    payload = {
+        "pet_id": "abcd1234",
+        "pet_info": pet_info.model_dump(mode="json"),
+        "recipients": [[chat_id, 1.5] for chat_id in range(50)]
+    }
+
+    await process_notify_job(bot, payload)
+
+    assert sorted(sent) == [chat_id for chat_id in range(50) if chat_id != 3]
+    assert active["max"] == 10
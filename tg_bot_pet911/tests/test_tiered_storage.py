@@ -0,0 +1,195 @@
+import asyncio
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from redis.asyncio import Redis
+
+from tg_bot_pet911.states.pet_states import PetRegistration
+from tg_bot_pet911.utils.fsm_storage import create_event_isolation, create_fsm_storage, create_redis_pool
+from tg_bot_pet911.utils.tiered_storage import TieredEventIsolation, TieredStorage
+
+
+KEY = StorageKey(bot_id=42, chat_id=100, user_id=200)
+
+
+async def create_tiered_storage(redis_server, **kwargs) -> TieredStorage:
+    storage = await create_fsm_storage("tiered", Redis(connection_pool=create_redis_pool(redis_server.url)))
+    for name, value in kwargs.items():
+        setattr(storage, name, value)
+    return storage
+
+
+def data_commands(redis_server, start: int):
+    """Commands sent after the given point, without connection setup and subscriptions."""
+    return [command for command in redis_server.commands[start:] if command not in ("CLIENT", "PING", "SUBSCRIBE")]
+
+
+async def registration_step(storage: TieredStorage, isolation, key: StorageKey, photo: str):
+    """What a photo handler does: read the data, change it and move the state on."""
+    async with isolation.lock(key):
+        state = FSMContext(storage, key)
+        data = await state.get_data()
+        await state.update_data(photos=data.get("photos", []) + [photo])
+        await state.set_state(PetRegistration.uploading_photos)
+
+
+@pytest.mark.asyncio
+async def test_step_takes_two_round_trips(redis_server):
+    """With isolation a step reads Redis when the lock is taken and writes when it is released."""
+    storage = await create_tiered_storage(redis_server)
+    isolation = create_event_isolation(storage)
+    assert isinstance(isolation, TieredEventIsolation)
+    await storage.redis.ping()
+
+    for photo in ("a", "b", "c"):
+        round_trips = redis_server.round_trips
+        await registration_step(storage, isolation, KEY, photo)
+        assert redis_server.round_trips - round_trips == 2
+
+    assert storage.metrics()["misses"] == 1
+    assert redis_server.data[b"fsm:42:100:200:state"] == PetRegistration.uploading_photos.state.encode()
+    assert redis_server.data[b"fsm:42:100:200:version"] == f"{storage.worker_id}.3".encode()
+    assert b"fsm:42:100:200:lock" not in redis_server.data
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_write_behind_coalesces(redis_server):
+    """Writes without a lock go to Redis together after the delay."""
+    storage = await create_tiered_storage(redis_server, write_delay=0.02)
+    commands = len(redis_server.commands)
+
+    for step in range(5):
+        await storage.set_data(KEY, {"step": step})
+        await storage.set_state(KEY, PetRegistration.entering_comment)
+    assert await storage.get_data(KEY) == {"step": 4}
+    assert data_commands(redis_server, commands) == ["GET", "GET", "HGETALL", "GET"]
+
+    await asyncio.sleep(0.05)
+    assert data_commands(redis_server, commands)[4:] == ["SET", "SET", "DEL", "SET", "PUBLISH"]
+    assert storage.metrics()["write_backs"] == 1
+
+    reader = await create_tiered_storage(redis_server)
+    assert await reader.get_data(KEY) == {"step": 4}
+    await reader.close()
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_workers_share_conversations(redis_server):
+    """Two workers handling the same chat never lose each other's changes."""
+    first = await create_tiered_storage(redis_server)
+    second = await create_tiered_storage(redis_server)
+    isolations = [create_event_isolation(first), create_event_isolation(second)]
+
+    # Both workers cache the chat, then take turns and race for it
+    for i in range(4):
+        storage = (first, second)[i % 2]
+        await registration_step(storage, isolations[i % 2], KEY, f"turn{i}")
+    await asyncio.gather(*(
+        registration_step((first, second)[i % 2], isolations[i % 2], KEY, f"race{i}") for i in range(6)
+    ))
+
+    for storage, isolation in ((first, isolations[0]), (second, isolations[1])):
+        async with isolation.lock(KEY):
+            photos = (await storage.get_data(KEY))["photos"]
+        assert photos[:4] == ["turn0", "turn1", "turn2", "turn3"]
+        assert sorted(photos[4:]) == [f"race{i}" for i in range(6)]
+
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_lock_is_released_after_the_write_back(redis_server):
+    """A worker taking the lock right after it is released reads the step just written."""
+    first = await create_tiered_storage(redis_server)
+    second = await create_tiered_storage(redis_server)
+    first_isolation, second_isolation = create_event_isolation(first), create_event_isolation(second)
+    await registration_step(second, second_isolation, KEY, "a")
+    seen = []
+    released = asyncio.Event()
+
+    async def take_lock_on_release(command: str):
+        # The second worker takes the lock the moment the first one's release has run
+        if command != "EVAL":
+            return
+        redis_server.after_command = None
+        lock_key = second._key(KEY, "lock")
+        await second_isolation._acquire(KEY, lock_key, "second")
+        seen.append((await second.get_data(KEY))["photos"])
+        redis_server.cmd_del(lock_key.encode())
+        released.set()
+
+    await registration_step(first, first_isolation, KEY, "b")
+    redis_server.after_command = take_lock_on_release
+    await registration_step(first, first_isolation, KEY, "c")
+    await asyncio.wait_for(released.wait(), 1)
+
+    assert seen == [["a", "b", "c"]]
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_versions_expire_with_the_conversation(redis_server):
+    """Version keys expire, and a copy cached before the conversation expired is still dropped."""
+    first = await create_tiered_storage(redis_server)
+    second = await create_tiered_storage(redis_server)
+    first_isolation, second_isolation = create_event_isolation(first), create_event_isolation(second)
+    await registration_step(second, second_isolation, KEY, "old")
+    assert 0 < redis_server.cmd_ttl(b"fsm:42:100:200:version") <= first.version_ttl
+
+    # Without the invalidation message only the version read with the lock can drop the copy
+    second._listener.cancel()
+    # The conversation expires in Redis, the user starts again on the first worker
+    redis_server.cmd_flushdb()
+    await registration_step(first, first_isolation, KEY, "new")
+
+    async with second_isolation.lock(KEY):
+        assert (await second.get_data(KEY))["photos"] == ["new"]
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_invalidation_over_pubsub(redis_server):
+    """A copy cached by one worker is dropped when another writes the conversation."""
+    first = await create_tiered_storage(redis_server)
+    second = await create_tiered_storage(redis_server)
+    await first.set_data(KEY, {"step": 1})
+    await first.flush()
+    assert await second.get_data(KEY) == {"step": 1}
+
+    await first.set_data(KEY, {"step": 2})
+    await first.flush()
+    for _ in range(100):
+        if second.metrics()["invalidations"]:
+            break
+        await asyncio.sleep(0.01)
+
+    assert second.metrics()["invalidations"] == 1
+    assert first.metrics()["invalidations"] == 0
+    assert await second.get_data(KEY) == {"step": 2}
+    await first.close()
+    await second.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded(redis_server):
+    """Least recently used conversations are dropped, unless their writes are not in Redis yet."""
+    storage = await create_tiered_storage(redis_server, max_size=2, write_delay=60)
+    keys = [StorageKey(bot_id=42, chat_id=i, user_id=i) for i in range(4)]
+
+    for key in keys[:3]:
+        await storage.get_data(key)
+    assert storage.metrics()["cached"] == 2
+    await storage.get_state(keys[0])
+    assert storage.metrics()["misses"] == 4
+
+    for key in keys:
+        await storage.set_data(key, {"chat": key.chat_id})
+    assert storage.metrics()["cached"] == 4
+
+    await storage.close()
+    assert all(redis_server.data[f"fsm:42:{i}:{i}:data".encode()] for i in range(4))
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Dispatcher, Router
+
+from tg_bot_pet911.bot.webhook import create_webhook_app
+
+
+def make_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "text": "hello"
+        }
+    }
+
+
+@pytest.mark.asyncio
+async def test_webhook_secret_and_concurrency(mock_bot):
+    """Requests without the secret are refused, accepted updates run with limited concurrency."""
+    router = Router()
+    active = {"now": 0, "max": 0}
+    handled = []
+
+    @router.message()
+    async def slow_handler(message):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.02)
+        active["now"] -= 1
+        handled.append(message.message_id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    app = create_webhook_app(dp, mock_bot, "secret", path="/webhook", max_concurrent=3)
+
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post("/webhook", json=make_update(1))
+        assert response.status == 401
+
+        responses = await asyncio.gather(*(
+            client.post("/webhook", json=make_update(i), headers={"X-Telegram-Bot-Api-Secret-Token": "secret"})
+            for i in range(10)
+        ))
+        assert all(response.status == 200 for response in responses)
+
+        for _ in range(100):
+            if len(handled) == 10:
+                break
+            await asyncio.sleep(0.02)
+
+    assert sorted(handled) == list(range(10))
+    assert active["max"] == 3
@@ -0,0 +1,319 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+
+# Catalog database lives next to the pet directories
+CATALOG_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "catalog.sqlite3")
+
+# Datetime format used for created_at in the pet JSON files
+CREATED_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pets (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    pet_type TEXT,
+    gender TEXT,
+    user_id INTEGER,
+    chat_id INTEGER,
+    username TEXT,
+    latitude REAL,
+    longitude REAL,
+    address TEXT,
+    pet_dir TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pets_created_at ON pets (created_at);
+CREATE INDEX IF NOT EXISTS idx_pets_type_created_at ON pets (pet_type, created_at);
+CREATE INDEX IF NOT EXISTS idx_pets_gender ON pets (gender);
+CREATE INDEX IF NOT EXISTS idx_pets_user_id ON pets (user_id);
+CREATE INDEX IF NOT EXISTS idx_pets_coordinates ON pets (latitude, longitude);
+"""
+
+
+def _format_time(value) -> Optional[str]:
+    """Convert a datetime or string bound to the created_at format."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(CREATED_AT_FORMAT)
+    return str(value)
+
+
+class PetCatalog:
+    """SQLite index of saved pet records.
+
+    Every record keeps the full pet JSON in the ``data`` column, so queries
+    never need to open the per-pet files on disk.
+    """
+
+    def __init__(self, db_path: str = CATALOG_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # One connection shared between threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def add_record(self, pet_data: Dict[str, Any], pet_dir: Optional[str] = None):
+        """Insert or replace a pet record."""
+        location = pet_data.get("location") or {}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pets "
+                "(id, created_at, pet_type, gender, user_id, chat_id, username, "
+                "latitude, longitude, address, pet_dir, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    pet_data["id"],
+                    _format_time(pet_data.get("created_at")),
+                    pet_data.get("pet_type"),
+                    pet_data.get("gender"),
+                    pet_data.get("user_id"),
+                    pet_data.get("chat_id"),
+                    pet_data.get("username"),
+                    location.get("latitude"),
+                    location.get("longitude"),
+                    location.get("address"),
+                    pet_dir,
+                    json.dumps(pet_data, ensure_ascii=False, default=str)
+                )
+            )
+
+    def get_record(self, pet_id: str) -> Optional[Dict[str, Any]]:
+        """Get a single record by its id."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, pet_dir FROM pets WHERE id = ?", (pet_id,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def get_pet_dir(self, pet_id: str) -> Optional[str]:
+        """Get the directory a record was saved to."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pet_dir FROM pets WHERE id = ?", (pet_id,)
+            ).fetchone()
+        return row["pet_dir"] if row else None
+
+    def set_pet_dir(self, pet_id: str, pet_dir: str):
+        """Update the directory of a record after it was moved."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE pets SET pet_dir = ? WHERE id = ?", (pet_dir, pet_id))
+
+    def find_records(
+        self,
+        pet_type: Optional[str] = None,
+        gender: Optional[str] = None,
+        user_id: Optional[int] = None,
+        since=None,
+        until=None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        limit: Optional[int] = 100,
+        newest_first: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Find records matching all of the given filters.
+
+        Args:
+            pet_type: Pet type ("dog", "cat", "other")
+            gender: Pet gender ("male", "female", "unknown")
+            user_id: Telegram id of the reporting user
+            since: Only records created at or after this datetime
+            until: Only records created before this datetime
+            bbox: (min_lat, min_lon, max_lat, max_lon) bounding box
+            limit: Maximum number of records, None for no limit
+            newest_first: Sort by created_at descending
+
+        Returns:
+            List of pet records
+        """
+        return list(self.iter_records(
+            pet_type=pet_type, gender=gender, user_id=user_id, since=since,
+            until=until, bbox=bbox, limit=limit, newest_first=newest_first
+        ))
+
+    def iter_records(
+        self,
+        pet_type: Optional[str] = None,
+        gender: Optional[str] = None,
+        user_id: Optional[int] = None,
+        since=None,
+        until=None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+        after: Optional[Tuple[str, str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate over matching records without loading them all at once.
+
+        Takes the filters of find_records, plus ``after``: a (created_at, id)
+        key to continue an oldest-first iteration after.
+        """
+        query, params = self._build_query(pet_type, gender, user_id, since, until, bbox)
+        if after is not None:
+            query += " AND " if params else " WHERE "
+            query += "(created_at > ? OR (created_at = ? AND id > ?))"
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY created_at {0}, id {0}".format("DESC" if newest_first else "ASC")
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        # Use a dedicated cursor so iteration can be interleaved with writes
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(256)
+            if not rows:
+                break
+            for row in rows:
+                yield self._row_to_record(row)
+
+    def last_rowid(self) -> int:
+        """Rowid of the last written record, 0 for an empty catalog."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM pets").fetchone()[0]
+
+    def iter_written(self, after_rowid: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Iterate over (rowid, record) of the records written after a rowid, in write order.
+
+        A replaced record gets a new rowid, so it shows up again.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT rowid, data, pet_dir FROM pets WHERE rowid > ? ORDER BY rowid", (after_rowid,)
+            )
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(256)
+            if not rows:
+                break
+            for row in rows:
+                yield row["rowid"], self._row_to_record(row)
+
+    def iter_coordinates(self) -> Iterator[Tuple[str, float, float, str]]:
+        """Iterate over (id, latitude, longitude, created_at) of all records with coordinates."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, latitude, longitude, created_at FROM pets "
+                "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+            )
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1024)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+
+    def count(self, **filters) -> int:
+        """Count records matching the filters of find_records."""
+        query, params = self._build_query(
+            filters.get("pet_type"), filters.get("gender"), filters.get("user_id"),
+            filters.get("since"), filters.get("until"), filters.get("bbox")
+        )
+        query = query.replace("SELECT data, pet_dir", "SELECT COUNT(*)", 1)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    @staticmethod
+    def _build_query(pet_type, gender, user_id, since, until, bbox) -> Tuple[str, list]:
+        """Build the SELECT statement for the given filters."""
+        conditions = []
+        params = []
+
+        if pet_type:
+            conditions.append("pet_type = ?")
+            params.append(pet_type)
+        if gender:
+            conditions.append("gender = ?")
+            params.append(gender)
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(_format_time(since))
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(_format_time(until))
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            conditions.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+
+        query = "SELECT data, pet_dir FROM pets"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return query, params
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+        """Decode a stored record."""
+        record = json.loads(row["data"])
+        record["pet_dir"] = row["pet_dir"]
+        return record
+
+
+def index_pet_directories(catalog: PetCatalog, pets_path: str) -> int:
+    """
+    Add all pet directories that already exist on disk to the catalog.
+
+    Args:
+        catalog: Catalog to fill
+        pets_path: Root directory with saved pet data
+
+    Returns:
+        Number of indexed records
+    """
+    indexed = 0
+    for root, _dirs, files in os.walk(pets_path):
+        for filename in files:
+            if not filename.endswith("_data.json"):
+                continue
+            with open(os.path.join(root, filename), encoding="utf-8") as f:
+                pet_data = json.load(f)
+            if "id" not in pet_data:
+                continue
+            catalog.add_record(pet_data, root)
+            indexed += 1
+    return indexed
+
+
+# Shared catalog instance, opened on first use
+_catalog: Optional[PetCatalog] = None
+
+
+def get_catalog() -> PetCatalog:
+    """Get the shared catalog instance."""
+    global _catalog
+    if _catalog is None:
+        _catalog = PetCatalog()
+    return _catalog
+
+
+if __name__ == "__main__":
+    # Build the catalog from the existing pet directories
+    from tg_bot_pet911.utils.storage import PETS_DATA_PATH
+
+    count = index_pet_directories(get_catalog(), PETS_DATA_PATH)
+    print(f"Indexed {count} pet records into {CATALOG_DB_PATH}")
@@ -0,0 +1,244 @@
+"""
+Reverse geocoding of coordinates to districts.
+
+District boundaries are loaded from a GeoJSON FeatureCollection of
+Polygon and MultiPolygon features. The feature property "name" is the
+district name and the optional "city" property is the city it belongs to.
+"""
+import json
+import logging
+import math
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from tg_bot_pet911.config.config import DISTRICTS_PATH, DISTRICT_CACHE_SIZE, DISTRICT_CACHE_PRECISION
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DISTRICTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "districts.geojson")
+
+# (min_x, min_y, max_x, max_y), x is longitude and y is latitude
+BBox = Tuple[float, float, float, float]
+Ring = List[Tuple[float, float]]
+
+
+class District(NamedTuple):
+    """A resolved district."""
+    name: str
+    city: Optional[str]
+
+    def label(self) -> str:
+        """Human-readable name, e.g. "Тверской район, Москва"."""
+        return f"{self.name}, {self.city}" if self.city and self.city != self.name else self.name
+
+
+class _Area(NamedTuple):
+    district: District
+    # Polygons as [outer ring, hole rings...]
+    polygons: List[List[Ring]]
+    bbox: BBox
+    area: float
+
+
+def _ring_bbox(ring: Ring) -> BBox:
+    xs = [x for x, _y in ring]
+    ys = [y for _x, y in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _ring_area(ring: Ring) -> float:
+    """Unsigned shoelace area in square degrees."""
+    return abs(sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]))) / 2
+
+
+def _point_in_ring(x: float, y: float, ring: Ring) -> bool:
+    """Ray casting: count the ring edges crossed by a ray going right from the point."""
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def _point_in_polygons(x: float, y: float, polygons: List[List[Ring]]) -> bool:
+    for outer, *holes in polygons:
+        if _point_in_ring(x, y, outer) and not any(_point_in_ring(x, y, hole) for hole in holes):
+            return True
+    return False
+
+
+def _contains(bbox: BBox, x: float, y: float) -> bool:
+    return bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]
+
+
+def _union(boxes: Sequence[BBox]) -> BBox:
+    return (
+        min(b[0] for b in boxes), min(b[1] for b in boxes),
+        max(b[2] for b in boxes), max(b[3] for b in boxes)
+    )
+
+
+class RTree:
+    """Static R-tree over bounding boxes, bulk-loaded with Sort-Tile-Recursive.
+
+    STR sorts the boxes into vertical slices by x and then by y inside each
+    slice, so every node covers a compact, barely overlapping area and a
+    point query descends into only a few nodes per level.
+    """
+
+    def __init__(self, boxes: Sequence[BBox], node_size: int = 16):
+        self.node_size = node_size
+        # Node: (bbox, children), the children of the lowest nodes are (bbox, item index)
+        level = [(box, i) for i, box in enumerate(boxes)]
+        self._root = None
+        self._levels = 0
+        if not level:
+            return
+
+        while True:
+            nodes = self._pack(level)
+            self._levels += 1
+            if len(nodes) == 1:
+                self._root = nodes[0]
+                break
+            level = nodes
+
+    def _pack(self, entries: List[Tuple[BBox, Any]]) -> List[Tuple[BBox, list]]:
+        """Group entries into nodes of up to node_size with STR."""
+        def center_x(entry):
+            return entry[0][0] + entry[0][2]
+
+        def center_y(entry):
+            return entry[0][1] + entry[0][3]
+
+        node_count = math.ceil(len(entries) / self.node_size)
+        slice_count = math.ceil(math.sqrt(node_count))
+        slice_size = slice_count * self.node_size
+
+        nodes = []
+        entries = sorted(entries, key=center_x)
+        for start in range(0, len(entries), slice_size):
+            vertical_slice = sorted(entries[start:start + slice_size], key=center_y)
+            for node_start in range(0, len(vertical_slice), self.node_size):
+                children = vertical_slice[node_start:node_start + self.node_size]
+                nodes.append((_union([child[0] for child in children]), children))
+        return nodes
+
+    def query_point(self, x: float, y: float) -> List[int]:
+        """Indexes of all boxes containing the point."""
+        if self._root is None:
+            return []
+        results = []
+        stack = [(self._root, self._levels)]
+        while stack:
+            (bbox, children), depth = stack.pop()
+            if not _contains(bbox, x, y):
+                continue
+            for child in children:
+                if depth == 1:
+                    if _contains(child[0], x, y):
+                        results.append(child[1])
+                else:
+                    stack.append((child, depth - 1))
+        return results
+
+
+class DistrictIndex:
+    """Point-in-polygon lookup of districts.
+
+    The R-tree narrows a point down to the few districts whose bounding box
+    contains it, and only those are tested exactly. Answers are cached by
+    coordinates rounded to ``precision`` decimals (4 is about 10 m), so
+    repeated submissions from the same place skip the lookup altogether.
+    """
+
+    def __init__(self, areas: List[_Area], cache_size: int = DISTRICT_CACHE_SIZE,
+                 precision: int = DISTRICT_CACHE_PRECISION):
+        self._areas = areas
+        self._tree = RTree([area.bbox for area in areas])
+        self.precision = precision
+        self._cached_lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self) -> int:
+        return len(self._areas)
+
+    @classmethod
+    def from_geojson(cls, data: Dict[str, Any], **kwargs) -> "DistrictIndex":
+        """Build the index from a parsed GeoJSON FeatureCollection."""
+        areas = []
+        for feature in data.get("features", []):
+            geometry = feature.get("geometry") or {}
+            properties = feature.get("properties") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            polygons = [[[tuple(point[:2]) for point in ring] for ring in polygon] for polygon in polygons]
+            if not polygons or not properties.get("name"):
+                continue
+
+            areas.append(_Area(
+                district=District(properties["name"], properties.get("city")),
+                polygons=polygons,
+                bbox=_union([_ring_bbox(polygon[0]) for polygon in polygons]),
+                area=sum(_ring_area(polygon[0]) for polygon in polygons)
+            ))
+        return cls(areas, **kwargs)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "DistrictIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_geojson(json.load(f), **kwargs)
+
+    def lookup(self, latitude: float, longitude: float) -> Optional[District]:
+        """
+        Find the district containing a point.
+
+        When districts are nested (a district inside a city), the smallest one wins.
+        """
+        return self._cached_lookup(round(latitude, self.precision), round(longitude, self.precision))
+
+    def cache_info(self):
+        """Hit and miss counters of the lookup cache."""
+        return self._cached_lookup.cache_info()
+
+    def _lookup(self, latitude: float, longitude: float) -> Optional[District]:
+        best = None
+        for i in self._tree.query_point(longitude, latitude):
+            area = self._areas[i]
+            if (best is None or area.area < best.area) and _point_in_polygons(longitude, latitude, area.polygons):
+                best = area
+        return best.district if best else None
+
+
+# Shared index, loaded on first use. False means there is no boundaries file.
+_district_index = None
+_district_index_lock = threading.Lock()
+
+
+def get_district_index() -> Optional[DistrictIndex]:
+    """Get the shared district index, or None if no boundaries file is available."""
+    global _district_index
+    with _district_index_lock:
+        if _district_index is None:
+            path = DISTRICTS_PATH or DEFAULT_DISTRICTS_PATH
+            if os.path.exists(path):
+                _district_index = DistrictIndex.from_file(path)
+                logger.info(f"Loaded {len(_district_index)} district boundaries from {path}")
+            else:
+                logger.info(f"No district boundaries at {path}, coordinates are not reverse geocoded")
+                _district_index = False
+        return _district_index or None
+
+
+def find_district(latitude: float, longitude: float) -> Optional[District]:
+    """Find the district of a point with the shared index."""
+    index = get_district_index()
+    return index.lookup(latitude, longitude) if index else None
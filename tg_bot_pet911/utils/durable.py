@@ -0,0 +1,224 @@
+import asyncio
+import ctypes
+import os
+import uuid
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from tg_bot_pet911.config.config import WRITE_DURABILITY, GROUP_COMMIT_WINDOW_MS, GROUP_COMMIT_MAX_BATCH
+
+
+# Durability levels, from fastest to safest
+#   none   - write the file in place, a crash can leave it truncated
+#   atomic - write a temp file and rename it, readers never see a partial file
+#   fsync  - atomic, plus fsync of the file and its directories before returning
+#   group  - like fsync, but writes within a short window are synced together
+DURABILITY_LEVELS = ("none", "atomic", "fsync", "group")
+
+
+def _sync_dirs(path: str, root: Optional[str]) -> List[str]:
+    """Directories whose entries must be synced for a new file to survive a crash.
+
+    Those are the file's directory and every parent up to ``root``, since
+    any of them may have been created just before the write.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    root = os.path.abspath(root) if root else directory
+    dirs = []
+    while True:
+        dirs.append(directory)
+        if directory == root or not directory.startswith(root + os.sep):
+            return dirs
+        directory = os.path.dirname(directory)
+
+
+def _fsync_path(path: str):
+    """fsync a file or a directory by path."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_tmp(path: str, data: bytes, fsync: bool) -> str:
+    """Write data to a temp file next to path."""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return tmp_path
+
+
+def write_file_sync(path: str, data: bytes, durability: str, root: Optional[str] = None):
+    """Write a file with one of the non-batched durability levels."""
+    if durability == "none":
+        with open(path, "wb") as f:
+            f.write(data)
+        return
+
+    tmp_path = _write_tmp(path, data, fsync=durability == "fsync")
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+    if durability == "fsync":
+        for directory in _sync_dirs(path, root):
+            _fsync_path(directory)
+
+
+# syncfs(2) writes out one filesystem in a single call, Linux only
+try:
+    _syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+except (AttributeError, OSError):
+    _syncfs = None
+
+
+def _sync_filesystems(paths: Iterable[str]):
+    """Sync the filesystems holding the given paths, once each."""
+    by_device: Dict[int, str] = {}
+    for path in paths:
+        by_device.setdefault(os.stat(path).st_dev, path)
+    for path in by_device.values():
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            if _syncfs(fd) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), path)
+        finally:
+            os.close(fd)
+
+
+def _commit_batch(batch: List[Tuple[str, str, List[str]]]):
+    """
+    Make a batch of temp files durable, rename them into place and make the renames durable.
+
+    With syncfs each step is one sync of the filesystem for the whole batch;
+    fsyncing every file one after another waits for a journal commit per file
+    and was slower than plain "fsync" writes. Elsewhere the files are fsynced
+    and every directory once.
+    """
+    if _syncfs is not None:
+        dirs = {directory for _tmp_path, _path, file_dirs in batch for directory in file_dirs}
+        _sync_filesystems(dirs)
+        for tmp_path, path, _dirs in batch:
+            os.replace(tmp_path, path)
+        _sync_filesystems(dirs)
+        return
+
+    for tmp_path, _path, _dirs in batch:
+        _fsync_path(tmp_path)
+    for tmp_path, path, _dirs in batch:
+        os.replace(tmp_path, path)
+
+    synced: Set[str] = set()
+    for _tmp_path, _path, dirs in batch:
+        for directory in dirs:
+            if directory not in synced:
+                _fsync_path(directory)
+                synced.add(directory)
+
+
+class GroupCommitter:
+    """Batches the fsyncs of atomic writes.
+
+    Writers hand over a written temp file and wait. The first write of a
+    batch starts a short timer; when it fires, or the batch is full, all
+    files are synced and renamed in one go and every directory is synced
+    once. Each writer returns only after its file is durable.
+    """
+
+    def __init__(self, window: float = GROUP_COMMIT_WINDOW_MS / 1000, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self._pending: List[Tuple[str, str, List[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+    async def commit(self, tmp_path: str, path: str, dirs: List[str]):
+        """Wait until a temp file is synced and renamed to its final path."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tmp_path, path, dirs, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._start_flush)
+        await future
+
+    async def flush(self):
+        """Commit everything pending right away and wait for it."""
+        self._start_flush()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._flush_batch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _flush_batch(self, batch: List[Tuple[str, str, List[str], asyncio.Future]]):
+        self.batches += 1
+        try:
+            await asyncio.to_thread(_commit_batch, [(tmp, path, dirs) for tmp, path, dirs, _future in batch])
+        except Exception as e:
+            for tmp_path, _path, _dirs, future in batch:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for _tmp, _path, _dirs, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+
+# Shared committer, created on first use
+_group_committer: Optional[GroupCommitter] = None
+
+
+def get_group_committer() -> GroupCommitter:
+    """Get the shared group committer."""
+    global _group_committer
+    if _group_committer is None:
+        _group_committer = GroupCommitter()
+    return _group_committer
+
+
+async def flush_pending_writes():
+    """Commit all writes waiting in the group committer."""
+    if _group_committer is not None:
+        await _group_committer.flush()
+
+
+async def write_file(
+    path: str, data: Union[bytes, str], durability: str = WRITE_DURABILITY, root: Optional[str] = None
+):
+    """
+    Write a file without blocking the event loop.
+
+    Args:
+        path: Final file path
+        data: File content, str is encoded as UTF-8
+        durability: One of DURABILITY_LEVELS
+        root: Topmost directory whose entries may need syncing, e.g. the data root
+    """
+    if durability not in DURABILITY_LEVELS:
+        raise ValueError(f"Unknown durability level '{durability}', expected one of {DURABILITY_LEVELS}")
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    if durability != "group":
+        await asyncio.to_thread(write_file_sync, path, data, durability, root)
+        return
+
+    tmp_path = await asyncio.to_thread(_write_tmp, path, data, False)
+    await get_group_committer().commit(tmp_path, path, _sync_dirs(path, root))
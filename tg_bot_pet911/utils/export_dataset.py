@@ -0,0 +1,265 @@
+import argparse
+import io
+import json
+import os
+import tarfile
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from tg_bot_pet911.utils.catalog import PetCatalog, get_catalog
+from tg_bot_pet911.utils.log_store import LOG_STORE_PATH
+from tg_bot_pet911.utils.storage import resolve_pet_dir
+
+
+MANIFEST_NAME = "manifest.jsonl"
+OPTIONS_NAME = "export.json"
+
+# A sample is its key and a list of (member name, bytes or file path)
+Sample = Tuple[str, List[Tuple[str, Any]]]
+
+# Record fields copied into the sample metadata, anything identifying the reporter
+# (user and chat ids, username, address, comment) stays out of the dataset
+METADATA_FIELDS = ("id", "pet_type", "gender", "created_at")
+
+
+def _photo_dir(record: Dict[str, Any]) -> Optional[str]:
+    """Directory holding the photos of a record in either storage backend."""
+    pet_dir = record.get("pet_dir")
+    if pet_dir and os.path.isdir(pet_dir):
+        return pet_dir
+    pet_dir = resolve_pet_dir(record["id"])
+    if pet_dir:
+        return pet_dir
+    log_photos = os.path.join(LOG_STORE_PATH, "photos")
+    return log_photos if os.path.isdir(log_photos) else None
+
+
+def _metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Allow-listed fields of a record: id, type, gender, coordinates and creation time."""
+    metadata = {field: record.get(field) for field in METADATA_FIELDS}
+    location = record.get("location") or {}
+    metadata["latitude"] = location.get("latitude")
+    metadata["longitude"] = location.get("longitude")
+    return metadata
+
+
+def iter_samples(records: Iterator[Dict[str, Any]], variant: str = "original") -> Iterator[Sample]:
+    """
+    Turn pet records into WebDataset samples.
+
+    Photos are referenced by path and only read while the shard is written,
+    so a sample holds no image data in memory. The metadata holds the
+    allow-listed record fields, plus the photo hashes and image names keyed
+    by the names of the images in the sample.
+
+    Args:
+        records: Pet records from the catalog
+        variant: "original" photos or the "medium" derivatives
+
+    Yields:
+        (key, members) per record
+    """
+    for record in records:
+        key = record["id"]
+        photo_dir = _photo_dir(record)
+        metadata = _metadata(record)
+        hashes = record.get("photo_hashes") or {}
+
+        members = []
+        photo_hashes = {}
+        for i, original in enumerate(record.get("photo_files", []), start=1):
+            filename = original
+            if variant == "medium":
+                filename = (record.get("derivatives") or {}).get(filename, {}).get("medium", filename)
+            path = os.path.join(photo_dir, filename) if photo_dir else None
+            if path and os.path.exists(path):
+                ext = os.path.splitext(filename)[1].lstrip(".").lower() or "jpg"
+                name = f"{key}.{i}.{ext}"
+                members.append((name, path))
+                if original in hashes:
+                    photo_hashes[name] = hashes[original]
+
+        metadata["photo_hashes"] = photo_hashes
+        metadata["images"] = [name for name, _path in members]
+        members.insert(0, (f"{key}.json", json.dumps(metadata, ensure_ascii=False).encode("utf-8")))
+        yield key, members
+
+
+def iter_shards(samples: Iterator[Sample], samples_per_shard: int) -> Iterator[List[Sample]]:
+    """Group samples into fixed-size shards."""
+    shard = []
+    for sample in samples:
+        shard.append(sample)
+        if len(shard) >= samples_per_shard:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def write_shard(path: str, samples: List[Sample]) -> int:
+    """
+    Write samples to a tar shard, atomically.
+
+    Returns:
+        Size of the shard in bytes
+    """
+    tmp_path = f"{path}.tmp"
+    with tarfile.open(tmp_path, "w") as tar:
+        for _key, members in samples:
+            for name, content in members:
+                if isinstance(content, bytes):
+                    info = tarfile.TarInfo(name)
+                    info.size = len(content)
+                    tar.addfile(info, io.BytesIO(content))
+                else:
+                    tar.add(content, arcname=name)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _read_manifest(out_dir: str) -> List[Dict[str, Any]]:
+    """
+    Entries of the completed shards.
+
+    A last line torn by a crash while it was appended is cut off the file,
+    its shard is written again by the resumed export.
+    """
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return []
+    entries = []
+    complete = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("line is not terminated")
+                if line.strip():
+                    entries.append(json.loads(line))
+            except ValueError:
+                if f.read():
+                    # Only the last line can be torn, anything else is a broken manifest
+                    raise
+                break
+            complete += len(line)
+    if complete < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(complete)
+            os.fsync(f.fileno())
+    return entries
+
+
+def export_dataset(
+    out_dir: str,
+    catalog: Optional[PetCatalog] = None,
+    pet_type: Optional[str] = None,
+    gender: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    samples_per_shard: int = 1000,
+    variant: str = "original"
+) -> Dict[str, int]:
+    """
+    Export pet records and photos as WebDataset tar shards.
+
+    Records are streamed from the catalog oldest first, so memory use is
+    bounded by one shard of metadata however large the archive is. Every
+    completed shard is recorded in manifest.jsonl. Running the export again
+    with the same options resumes after the last completed shard.
+
+    Args:
+        out_dir: Output directory
+        catalog: Catalog to export from, defaults to the shared one
+        pet_type: Only export this pet type
+        gender: Only export this gender
+        since: Only records created at or after this time
+        until: Only records created before this time
+        samples_per_shard: Records per tar shard
+        variant: "original" photos or the "medium" derivatives
+
+    Returns:
+        Dict with the number of shards and samples written by this run and in total
+    """
+    catalog = catalog or get_catalog()
+    os.makedirs(out_dir, exist_ok=True)
+
+    options = {
+        "pet_type": pet_type,
+        "gender": gender,
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "samples_per_shard": samples_per_shard,
+        "variant": variant
+    }
+    options_path = os.path.join(out_dir, OPTIONS_NAME)
+    if os.path.exists(options_path):
+        with open(options_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous != options:
+            raise ValueError(f"{out_dir} holds an export with different options: {previous}")
+    else:
+        with open(options_path, "w", encoding="utf-8") as f:
+            json.dump(options, f, ensure_ascii=False, indent=2)
+
+    # Resume after the last record of the last completed shard
+    manifest = _read_manifest(out_dir)
+    after = (manifest[-1]["last_created_at"], manifest[-1]["last_id"]) if manifest else None
+
+    records = catalog.iter_records(
+        pet_type=pet_type, gender=gender, since=since, until=until, after=after
+    )
+    shards = iter_shards(iter_samples(records, variant), samples_per_shard)
+
+    written_shards = 0
+    written_samples = 0
+    with open(os.path.join(out_dir, MANIFEST_NAME), "a", encoding="utf-8") as manifest_file:
+        for number, shard in enumerate(shards, start=len(manifest)):
+            name = f"shard-{number:06d}.tar"
+            size = write_shard(os.path.join(out_dir, name), shard)
+
+            last_metadata = json.loads(shard[-1][1][0][1])
+            entry = {
+                "shard": name,
+                "samples": len(shard),
+                "bytes": size,
+                "keys": [key for key, _members in shard],
+                "last_id": last_metadata["id"],
+                "last_created_at": last_metadata["created_at"]
+            }
+            manifest_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+
+            written_shards += 1
+            written_samples += len(shard)
+
+    return {
+        "shards": written_shards,
+        "samples": written_samples,
+        "total_shards": len(manifest) + written_shards,
+        "total_samples": sum(entry["samples"] for entry in manifest) + written_samples
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export pet records as WebDataset tar shards")
+    parser.add_argument("out_dir", help="Output directory, an existing export is resumed")
+    parser.add_argument("--type", dest="pet_type", choices=["dog", "cat", "other"])
+    parser.add_argument("--gender", choices=["male", "female", "unknown"])
+    parser.add_argument("--since", type=datetime.fromisoformat, help="YYYY-MM-DD[THH:MM:SS]")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="YYYY-MM-DD[THH:MM:SS]")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Records per shard")
+    parser.add_argument("--variant", choices=["original", "medium"], default="original")
+    args = parser.parse_args()
+
+    result = export_dataset(
+        args.out_dir, pet_type=args.pet_type, gender=args.gender, since=args.since,
+        until=args.until, samples_per_shard=args.shard_size, variant=args.variant
+    )
+    print(
+        f"Wrote {result['shards']} shards with {result['samples']} samples, "
+        f"{result['total_shards']} shards with {result['total_samples']} samples in total"
+    )
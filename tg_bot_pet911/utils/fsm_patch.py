@@ -0,0 +1,88 @@
+"""
+Field-level updates of FSM conversation data.
+
+Handlers used to load the whole ``pet_info`` dict, change one field and
+write the whole dict back. ``edit_data`` loads it once, lets the handler
+change it in place, and at the end writes only the fields that changed as
+one patch. A list that only grew (a photo added) is written as the items
+appended. Storages with a ``patch_data`` method apply the patch themselves
+(Redis as hash fields, see SerializingRedisStorage); for the others, and
+for test doubles of FSMContext, the whole dict is written as before.
+"""
+import copy
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, List, NamedTuple, Optional
+
+from aiogram.fsm.context import FSMContext
+
+
+class DataPatch(NamedTuple):
+    """Changes to one dict in the conversation data, e.g. ``pet_info``."""
+    name: str
+    # Field -> new value
+    fields: Dict[str, Any]
+    # List field -> items appended to it
+    appends: Dict[str, List[Any]]
+    # Old values of the changed and appended-to fields, None for new fields; whole values,
+    # including the old lists, which storages use to find the items already appended
+    base: Dict[str, Any]
+
+
+def diff_patch(name: str, before: Dict[str, Any], after: Dict[str, Any]) -> Optional[DataPatch]:
+    """
+    Patch turning ``before`` into ``after``.
+
+    Returns:
+        The patch, None if a field was removed (only a whole write can express it)
+    """
+    if any(field not in after for field in before):
+        return None
+    fields, appends, base = {}, {}, {}
+    for field, value in after.items():
+        old = before.get(field)
+        if field in before and old == value:
+            continue
+        base[field] = old
+        if isinstance(old, list) and isinstance(value, list) and len(value) > len(old) and value[:len(old)] == old:
+            appends[field] = value[len(old):]
+        else:
+            fields[field] = value
+    return DataPatch(name, fields, appends, base)
+
+
+def apply_patch(data: Dict[str, Any], patch: DataPatch) -> Dict[str, Any]:
+    """Apply a patch to conversation data in place."""
+    target = data.get(patch.name)
+    if not isinstance(target, dict):
+        target = data[patch.name] = {}
+    target.update(patch.fields)
+    for field, items in patch.appends.items():
+        target[field] = list(target.get(field) or []) + items
+    return data
+
+
+@asynccontextmanager
+async def edit_data(state: FSMContext, name: str = "pet_info") -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Load a dict of the conversation data to change in place, and write the changes back on exit.
+
+    Nothing is written if nothing changed or the handler raised.
+
+        async with edit_data(state) as pet_info_dict:
+            pet_info_dict["gender"] = gender
+    """
+    data = await state.get_data()
+    before = data.get(name)
+    before = before if isinstance(before, dict) else {}
+    # The storage may hand out its own dict (MemoryStorage copies only the top level)
+    value = copy.deepcopy(before)
+    yield value
+
+    if value == before and name in data:
+        return
+    storage = state.storage if isinstance(state, FSMContext) else None
+    patch = diff_patch(name, before, value) if name in data else None
+    if patch is not None and hasattr(storage, "patch_data"):
+        await storage.patch_data(state.key, patch)
+    else:
+        await state.update_data(**{name: value})
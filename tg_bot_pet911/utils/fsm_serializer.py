@@ -0,0 +1,190 @@
+"""
+Serializers for FSM conversation data kept in Redis.
+
+The msgpack serializer writes the report being registered (``pet_info``)
+as positional arrays following a versioned schema instead of repeating
+every field name in every write. Payloads start with the schema version,
+so the schema can change without breaking conversations already stored.
+Any serializer reads payloads of the others: JSON payloads start with
+"{", so switching FSM_SERIALIZER takes effect as conversations are rewritten.
+"""
+import json
+import logging
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, FSM data is stored as JSON without it
+    msgpack = None
+
+from tg_bot_pet911.config.config import FSM_SERIALIZER
+
+
+logger = logging.getLogger(__name__)
+
+
+class Schema(NamedTuple):
+    """Field order of the positional arrays, by model."""
+    pet_info: Tuple[str, ...]
+    photo: Tuple[str, ...]
+    location: Tuple[str, ...]
+
+
+# A released schema never changes: a changed model gets a new version. Data whose fields
+# do not match the current schema is written as a plain map, which every version reads.
+SCHEMAS = {
+    1: Schema(
+        pet_info=(
+            "user_id", "chat_id", "username", "pet_type", "gender", "photos", "location", "comment", "created_at"
+        ),
+        photo=("file_id", "file_unique_id"),
+        location=("latitude", "longitude", "address", "district"),
+    ),
+}
+CURRENT_VERSION = max(SCHEMAS)
+
+# msgpack extension types for datetimes: naive (wall clock) and timezone-aware
+EXT_NAIVE_DATETIME = 1
+EXT_AWARE_DATETIME = 2
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JsonSerializer:
+    """Plain JSON, datetimes as ISO strings (pydantic parses them back)."""
+
+    name = "json"
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+    def loads(self, payload: Union[bytes, str]) -> Dict[str, Any]:
+        if isinstance(payload, bytes) and payload[:1] != b"{":
+            return MsgpackSerializer().loads(payload)
+        return json.loads(payload)
+
+    def dumps_value(self, value: Any) -> bytes:
+        """A single field of the data, for patches."""
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+    def loads_value(self, payload: Union[bytes, str]) -> Any:
+        if isinstance(payload, bytes) and payload[0] in SCHEMAS:
+            return MsgpackSerializer().loads_value(payload)
+        return json.loads(payload)
+
+
+class MsgpackSerializer:
+    """
+    msgpack with ``pet_info`` as positional arrays of the schema.
+
+    Datetimes are stored as microseconds (8 bytes) instead of ISO strings.
+    """
+
+    name = "msgpack"
+
+    def __init__(self, version: int = CURRENT_VERSION):
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        self.version = version
+        self.schema = SCHEMAS[version]
+        self._header = bytes((version,))
+
+    def _pack_pet_info(self, pet_info: Any) -> Optional[list]:
+        """pet_info as an array, None if it does not match the schema."""
+        schema = self.schema
+        if not isinstance(pet_info, dict) or len(pet_info) != len(schema.pet_info):
+            return None
+        try:
+            location = pet_info["location"]
+            photos = pet_info["photos"]
+            if len(location) != len(schema.location) or any(len(photo) != len(schema.photo) for photo in photos):
+                return None
+            values = [pet_info[field] for field in schema.pet_info]
+            values[schema.pet_info.index("photos")] = [
+                [photo[field] for field in schema.photo] for photo in photos
+            ]
+            values[schema.pet_info.index("location")] = [location[field] for field in schema.location]
+        except (KeyError, TypeError):
+            return None
+        return values
+
+    @staticmethod
+    def _unpack_pet_info(values: list, schema: Schema) -> Dict[str, Any]:
+        pet_info = dict(zip(schema.pet_info, values))
+        pet_info["photos"] = [dict(zip(schema.photo, photo)) for photo in pet_info["photos"]]
+        pet_info["location"] = dict(zip(schema.location, pet_info["location"]))
+        return pet_info
+
+    @staticmethod
+    def _encode_ext(value: Any) -> Any:
+        if isinstance(value, datetime):
+            if value.tzinfo is None:
+                micros = (value - _EPOCH) // timedelta(microseconds=1)
+                return msgpack.ExtType(EXT_NAIVE_DATETIME, struct.pack(">q", micros))
+            offset = int(value.utcoffset().total_seconds())
+            micros = (value.replace(tzinfo=None) - value.utcoffset() - _EPOCH) // timedelta(microseconds=1)
+            return msgpack.ExtType(EXT_AWARE_DATETIME, struct.pack(">qi", micros, offset))
+        raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+    @staticmethod
+    def _decode_ext(code: int, data: bytes) -> Any:
+        if code == EXT_NAIVE_DATETIME:
+            return _EPOCH + timedelta(microseconds=struct.unpack(">q", data)[0])
+        if code == EXT_AWARE_DATETIME:
+            micros, offset = struct.unpack(">qi", data)
+            utc = (_EPOCH + timedelta(microseconds=micros)).replace(tzinfo=timezone.utc)
+            return utc.astimezone(timezone(timedelta(seconds=offset)))
+        return msgpack.ExtType(code, data)
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        packed = self._pack_pet_info(data.get("pet_info"))
+        if packed is not None:
+            data = {**data, "pet_info": packed}
+        return self._header + msgpack.packb(data, default=self._encode_ext, use_bin_type=True)
+
+    def loads(self, payload: Union[bytes, str]) -> Dict[str, Any]:
+        if isinstance(payload, str) or payload[:1] == b"{":
+            # Written by the JSON serializer
+            return json.loads(payload)
+        schema = SCHEMAS.get(payload[0])
+        if schema is None:
+            raise ValueError(f"Unknown FSM data format version {payload[0]}")
+        data = msgpack.unpackb(payload[1:], ext_hook=self._decode_ext, raw=False)
+        # pet_info is always a map in the handlers, an array means the packed form
+        if isinstance(data.get("pet_info"), list):
+            data["pet_info"] = self._unpack_pet_info(data["pet_info"], schema)
+        return data
+
+    def dumps_value(self, value: Any) -> bytes:
+        """A single field of the data, for patches. Written as is, with the version header."""
+        return self._header + msgpack.packb(value, default=self._encode_ext, use_bin_type=True)
+
+    def loads_value(self, payload: Union[bytes, str]) -> Any:
+        # A version byte is never the first byte of JSON
+        if isinstance(payload, str) or payload[0] not in SCHEMAS:
+            return json.loads(payload)
+        return msgpack.unpackb(payload[1:], ext_hook=self._decode_ext, raw=False)
+
+
+def create_serializer(name: str = FSM_SERIALIZER):
+    """
+    Serializer by name: "msgpack" or "json".
+
+    msgpack falls back to JSON with a warning when it is not installed.
+    """
+    if name == "msgpack":
+        if msgpack is not None:
+            return MsgpackSerializer()
+        logger.warning("msgpack is not installed, storing FSM data as JSON.")
+        return JsonSerializer()
+    if name == "json":
+        return JsonSerializer()
+    raise ValueError(f"Unknown FSM serializer '{name}', expected 'msgpack' or 'json'")
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncGenerator, Dict, Optional, Tuple
+
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import DisabledEventIsolation, MemoryStorage
+
+if TYPE_CHECKING:
+    # Imported when Redis is used, the memory backend starts without loading redis
+    from aiogram.fsm.storage.redis import RedisStorage
+    from redis.asyncio import ConnectionPool, Redis
+
+from tg_bot_pet911.config.config import (
+    FSM_STORAGE, FSM_EVENT_ISOLATION, FSM_SERIALIZER, FSM_TTL_SECONDS, REDIS_DSN, REDIS_KEY_PREFIX,
+    REDIS_MAX_CONNECTIONS, REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL, REDIS_POOL_TIMEOUT
+)
+from tg_bot_pet911.utils.fsm_serializer import create_serializer
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_redis_pool(dsn: str = REDIS_DSN) -> "ConnectionPool":
+    """
+    Create the Redis connection pool shared by everything in the process.
+
+    Connections are capped: when all are busy, callers wait up to
+    REDIS_POOL_TIMEOUT for a free one instead of failing. Commands time out
+    instead of hanging a handler, and idle connections are checked before
+    reuse, so a Redis restart only fails the commands that were in flight.
+    """
+    from redis.asyncio import BlockingConnectionPool
+
+    return BlockingConnectionPool.from_url(
+        dsn,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        retry_on_timeout=True
+    )
+
+
+def create_redis_storage(
+    redis: "Redis", prefix: str = REDIS_KEY_PREFIX, serializer: str = FSM_SERIALIZER
+) -> "RedisStorage":
+    """
+    FSM storage in Redis.
+
+    Keys look like ``<prefix>:<bot id>:<chat id>:<user id>:<state|data>``,
+    so several bots can share one Redis database. Conversation data is
+    written with the serializer named in FSM_SERIALIZER.
+    """
+    from tg_bot_pet911.utils.redis_storage import SerializingRedisStorage
+
+    ttl = FSM_TTL_SECONDS or None
+    return SerializingRedisStorage(
+        redis,
+        key_builder=DefaultKeyBuilder(prefix=prefix, with_bot_id=True),
+        state_ttl=ttl,
+        data_ttl=ttl,
+        serializer=create_serializer(serializer)
+    )
+
+
+async def create_fsm_storage(backend: str = FSM_STORAGE, redis: Optional["Redis"] = None) -> BaseStorage:
+    """
+    Create the FSM storage chosen in the config.
+
+    Args:
+        backend: "memory", "redis" or "tiered" (Redis behind a per-worker cache)
+        redis: Redis client to use, defaults to one on a new pool from REDIS_DSN
+
+    Raises:
+        ValueError: Unknown backend
+        redis.exceptions.ConnectionError: Redis is not reachable. There is no
+            fallback to memory: a worker with private state would silently
+            split conversations between workers.
+    """
+    if backend == "memory":
+        from tg_bot_pet911.utils.memory_storage import ExpiringMemoryStorage
+
+        storage = ExpiringMemoryStorage()
+        storage.start()
+        logger.info(f"Using in-memory storage for FSM, idle conversations expire after {storage.ttl} s.")
+        return storage
+    if backend not in ("redis", "tiered"):
+        raise ValueError(f"Unknown FSM storage '{backend}', expected 'memory', 'redis' or 'tiered'")
+
+    if redis is None:
+        from redis.asyncio import Redis
+
+        redis = Redis(connection_pool=create_redis_pool())
+    await redis.ping()
+    if backend == "tiered":
+        from tg_bot_pet911.utils.tiered_storage import TieredStorage
+
+        storage = TieredStorage(create_redis_storage(redis))
+        await storage.start()
+        logger.info(
+            f"Using tiered storage for FSM: up to {storage.max_size} conversations cached, "
+            f"Redis key prefix '{REDIS_KEY_PREFIX}'."
+        )
+        return storage
+    logger.info(f"Using Redis storage for FSM with key prefix '{REDIS_KEY_PREFIX}'.")
+    return create_redis_storage(redis)
+
+
+class KeyedEventIsolation(BaseEventIsolation):
+    """
+    Process updates of one chat one at a time, updates of different chats in parallel.
+
+    Every chat with an update in flight has a lock; waiters acquire it in the
+    order they arrived, so the updates of a chat run in the order they were
+    received. A lock is dropped as soon as nobody holds or waits for it, so
+    only chats with updates in flight take memory.
+    """
+
+    def __init__(self):
+        # Chat key -> (lock, number of updates holding or waiting for it)
+        self._locks: Dict[Tuple[int, int, Optional[int]], Tuple[asyncio.Lock, int]] = {}
+
+    @property
+    def active_chats(self) -> int:
+        """Chats with updates in flight (a length would make an idle isolation falsy to aiogram)."""
+        return len(self._locks)
+
+    @staticmethod
+    def _chat_key(key: StorageKey) -> Tuple[int, int, Optional[int]]:
+        return key.bot_id, key.chat_id, key.thread_id
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        chat_key = self._chat_key(key)
+        lock, users = self._locks.get(chat_key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[chat_key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[chat_key]
+            if users == 1:
+                del self._locks[chat_key]
+            else:
+                self._locks[chat_key] = (lock, users - 1)
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+
+def create_event_isolation(storage: BaseStorage) -> BaseEventIsolation:
+    """
+    Event isolation matching the storage.
+
+    Handlers read the conversation data, change it and write it back, so two
+    updates of one chat handled at once (an album of photos, a double-tapped
+    button) would overwrite each other's changes. With Redis, updates of the
+    same chat are serialized across all workers by a Redis lock, in memory by
+    a per-chat lock of this process. Different chats are always handled in
+    parallel.
+    """
+    if not FSM_EVENT_ISOLATION:
+        return DisabledEventIsolation()
+    # Storages shared between workers (Redis) isolate events across all of them
+    if hasattr(storage, "create_isolation"):
+        return storage.create_isolation()
+    return KeyedEventIsolation()
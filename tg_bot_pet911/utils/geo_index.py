@@ -0,0 +1,187 @@
+import heapq
+import math
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from tg_bot_pet911.utils.catalog import get_catalog
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class GeoPoint(NamedTuple):
+    """A saved report with coordinates."""
+    pet_id: str
+    latitude: float
+    longitude: float
+    created_at: str
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometers."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """In-memory grid index of report coordinates.
+
+    Points are bucketed into cells of ``cell_size`` degrees. A nearest
+    neighbour query visits rings of cells around the query point and stops
+    as soon as no point in an unvisited ring can be closer than the k-th
+    point found so far, so it only looks at the reports near the query.
+    """
+
+    def __init__(self, cell_size: float = 0.01):
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], Dict[str, GeoPoint]] = {}
+        self._points: Dict[str, GeoPoint] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def add(self, pet_id: str, latitude: float, longitude: float, created_at: str):
+        """Add a report, replacing an earlier entry with the same id."""
+        point = GeoPoint(pet_id, latitude, longitude, str(created_at))
+        with self._lock:
+            old = self._points.get(pet_id)
+            if old is not None:
+                self._cells[self._cell(old.latitude, old.longitude)].pop(pet_id, None)
+            self._points[pet_id] = point
+            self._cells.setdefault(self._cell(latitude, longitude), {})[pet_id] = point
+
+    def add_record(self, pet_data: Dict[str, Any]):
+        """Add a saved pet record if it has coordinates."""
+        location = pet_data.get("location") or {}
+        latitude, longitude = location.get("latitude"), location.get("longitude")
+        if latitude is not None and longitude is not None:
+            self.add(pet_data["id"], latitude, longitude, pet_data.get("created_at", ""))
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 5,
+        max_distance_km: Optional[float] = None,
+        since: Optional[str] = None
+    ) -> List[Tuple[float, GeoPoint]]:
+        """
+        Find the k reports closest to a point.
+
+        Args:
+            latitude: Query latitude
+            longitude: Query longitude
+            k: Maximum number of reports
+            max_distance_km: Only reports within this distance
+            since: Only reports created at or after this created_at string
+
+        Returns:
+            List of (distance in km, point), closest first
+        """
+        center_lat, center_lon = self._cell(latitude, longitude)
+        # Max-heap of the best k as (-distance, pet_id, point)
+        best: List[Tuple[float, str, GeoPoint]] = []
+        seen = 0
+
+        with self._lock:
+            total = len(self._points)
+            ring = 0
+            while seen < total:
+                for cell in self._ring_cells(center_lat, center_lon, ring):
+                    for point in self._cells.get(cell, {}).values():
+                        seen += 1
+                        if since is not None and point.created_at < since:
+                            continue
+                        distance = haversine_km(latitude, longitude, point.latitude, point.longitude)
+                        if max_distance_km is not None and distance > max_distance_km:
+                            continue
+                        item = (-distance, point.pet_id, point)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, item)
+
+                # Every point outside rings 0..ring is at least this far away
+                bound = self._ring_bound_km(latitude, ring)
+                if max_distance_km is not None and bound > max_distance_km:
+                    break
+                if len(best) == k and -best[0][0] <= bound:
+                    break
+                if ring * self.cell_size > 360:
+                    break
+                ring += 1
+
+        return sorted(((-neg_distance, point) for neg_distance, _id, point in best), key=lambda item: item[0])
+
+    @staticmethod
+    def _ring_cells(center_lat: int, center_lon: int, ring: int):
+        """Cells at Chebyshev distance ``ring`` from the center cell."""
+        if ring == 0:
+            yield center_lat, center_lon
+            return
+        for d in range(-ring, ring + 1):
+            yield center_lat - ring, center_lon + d
+            yield center_lat + ring, center_lon + d
+        for d in range(-ring + 1, ring):
+            yield center_lat + d, center_lon - ring
+            yield center_lat + d, center_lon + ring
+
+    def _ring_bound_km(self, latitude: float, ring: int) -> float:
+        """Lower bound of the distance to any cell beyond ``ring``."""
+        # Longitude degrees shrink towards the poles, use the widest latitude the rings reach
+        widest = min(90.0, abs(latitude) + (ring + 1) * self.cell_size)
+        degree_km = KM_PER_DEGREE * min(1.0, math.cos(math.radians(widest)))
+        return ring * self.cell_size * degree_km
+
+
+# Shared index, built from the catalog on first use
+_geo_index: Optional[GeoIndex] = None
+_geo_index_lock = threading.Lock()
+# Last catalog rowid the shared index has seen
+_geo_index_rowid = 0
+
+
+def get_geo_index() -> GeoIndex:
+    """Get the shared geo index, loading all saved coordinates the first time."""
+    global _geo_index, _geo_index_rowid
+    with _geo_index_lock:
+        if _geo_index is None:
+            catalog = get_catalog()
+            # Taken first, records written during the load are added again by a refresh
+            _geo_index_rowid = catalog.last_rowid()
+            index = GeoIndex()
+            for pet_id, latitude, longitude, created_at in catalog.iter_coordinates():
+                index.add(pet_id, latitude, longitude, created_at)
+            _geo_index = index
+        return _geo_index
+
+
+def refresh_geo_index() -> int:
+    """
+    Add the records other workers wrote to the catalog since the last refresh.
+
+    Returns:
+        Number of records read
+    """
+    global _geo_index_rowid
+    with _geo_index_lock:
+        if _geo_index is None:
+            return 0
+        count = 0
+        for rowid, record in get_catalog().iter_written(_geo_index_rowid):
+            _geo_index.add_record(record)
+            _geo_index_rowid = rowid
+            count += 1
+        return count
+
+
+def add_to_geo_index(pet_data: Dict[str, Any]):
+    """Add a newly saved record to the shared index, if it has been built."""
+    if _geo_index is not None:
+        _geo_index.add_record(pet_data)
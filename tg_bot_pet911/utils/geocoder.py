@@ -0,0 +1,293 @@
+"""
+Offline geocoding of manually entered addresses.
+
+Addresses are resolved against a local gazetteer CSV with the columns
+
+    city,street,house_from,house_to,latitude,longitude
+
+A row without a street is the center of a city, a row without house
+numbers is the center of a street, and a row with a house range is the
+position of the houses from house_from to house_to.
+"""
+import csv
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from tg_bot_pet911.config.config import GAZETTEER_PATH, GEOCODER_CACHE_SIZE, GEOCODER_MAX_TYPOS
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "gazetteer.csv")
+
+# Street type spellings and their canonical form
+STREET_TYPES = {
+    "ул": "улица", "улица": "улица",
+    "пр": "проспект", "пр-т": "проспект", "просп": "проспект", "проспект": "проспект",
+    "пер": "переулок", "переулок": "переулок",
+    "б-р": "бульвар", "бул": "бульвар", "бульвар": "бульвар",
+    "ш": "шоссе", "шоссе": "шоссе",
+    "пл": "площадь", "площадь": "площадь",
+    "наб": "набережная", "набережная": "набережная",
+    "пр-д": "проезд", "проезд": "проезд",
+    "туп": "тупик", "тупик": "тупик",
+}
+
+# Words that carry no information for the lookup
+FILLER_WORDS = {"г", "город", "д", "дом", "россия", "рф"}
+
+_HOUSE_RE = re.compile(r"^(\d+)")
+_TOKEN_RE = re.compile(r"[a-zа-я0-9]+(?:-[a-zа-я0-9]+)*")
+
+
+class GeocodeResult(NamedTuple):
+    """A resolved address."""
+    latitude: float
+    longitude: float
+    # "house", "street" or "city"
+    precision: str
+    matched: str
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase an address and split it into words."""
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def normalize_street(text: str) -> str:
+    """Canonical street key: the name words followed by the street type, if any."""
+    words = []
+    street_type = None
+    for token in tokenize(text):
+        if token in STREET_TYPES:
+            street_type = STREET_TYPES[token]
+        elif token not in FILLER_WORDS:
+            words.append(token)
+    if street_type:
+        words.append(street_type)
+    return " ".join(words)
+
+
+class Trie:
+    """Prefix tree with Levenshtein-bounded lookup.
+
+    The search walks the tree once, keeping one edit-distance row per node,
+    and prunes every branch whose row already exceeds the allowed number
+    of typos, so only a small part of the keys is ever compared.
+    """
+
+    def __init__(self):
+        # Node: [children, values]
+        self._root: list = [{}, None]
+
+    def add(self, key: str, value):
+        node = self._root
+        for char in key:
+            node = node[0].setdefault(char, [{}, None])
+        if node[1] is None:
+            node[1] = []
+        node[1].append(value)
+
+    def search(self, query: str, max_distance: int) -> List[Tuple[int, bool, str, object]]:
+        """
+        Find keys within max_distance edits of the query or starting with a close match of it.
+
+        Returns:
+            List of (distance, is_prefix_match, key, value), best first
+        """
+        results = []
+        first_row = list(range(len(query) + 1))
+        stack = [(self._root, "", first_row, None)]
+        while stack:
+            node, key, row, prefix_distance = stack.pop()
+            if row[-1] <= max_distance:
+                prefix_distance = row[-1] if prefix_distance is None else min(prefix_distance, row[-1])
+            if node[1] is not None:
+                if row[-1] <= max_distance:
+                    results.extend((row[-1], False, key, value) for value in node[1])
+                elif prefix_distance is not None:
+                    results.extend((prefix_distance, True, key, value) for value in node[1])
+
+            for char, child in node[0].items():
+                new_row = [row[0] + 1]
+                for i in range(1, len(query) + 1):
+                    new_row.append(min(
+                        new_row[i - 1] + 1,
+                        row[i] + 1,
+                        row[i - 1] + (query[i - 1] != char)
+                    ))
+                if min(new_row) <= max_distance or prefix_distance is not None:
+                    stack.append((child, key + char, new_row, prefix_distance))
+
+        results.sort(key=lambda item: (item[0], item[1], len(item[2])))
+        return results
+
+
+class _Street(NamedTuple):
+    city: str
+    name: str
+    center: Optional[Tuple[float, float]]
+    # (house_from, house_to, latitude, longitude)
+    ranges: List[Tuple[int, int, float, float]]
+
+
+class Geocoder:
+    """Resolves free-text addresses against a gazetteer.
+
+    Lookups are cached by normalized address, so repeated popular addresses
+    are answered without touching the tries.
+    """
+
+    def __init__(self, cache_size: int = GEOCODER_CACHE_SIZE, max_typos: int = GEOCODER_MAX_TYPOS):
+        self.max_typos = max_typos
+        self._cities: Dict[str, Tuple[str, Optional[Tuple[float, float]]]] = {}
+        self._streets: Dict[Tuple[str, str], _Street] = {}
+        self._street_trie = Trie()
+        self._city_trie = Trie()
+        self._cached_lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> "Geocoder":
+        """Load a gazetteer CSV."""
+        geocoder = cls(**kwargs)
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                geocoder.add(
+                    row["city"], row.get("street") or None,
+                    int(row["house_from"]) if row.get("house_from") else None,
+                    int(row["house_to"]) if row.get("house_to") else None,
+                    float(row["latitude"]), float(row["longitude"])
+                )
+        geocoder.finish()
+        return geocoder
+
+    def add(
+        self, city: str, street: Optional[str], house_from: Optional[int], house_to: Optional[int],
+        latitude: float, longitude: float
+    ):
+        """Add one gazetteer entry. Call finish() after the last one."""
+        city_key = " ".join(tokenize(city))
+        if city_key not in self._cities:
+            self._cities[city_key] = (city, None)
+            self._city_trie.add(city_key, city_key)
+        if not street:
+            self._cities[city_key] = (city, (latitude, longitude))
+            return
+
+        street_key = normalize_street(street)
+        entry = self._streets.get((city_key, street_key))
+        if entry is None:
+            entry = _Street(city_key, street, None, [])
+            self._streets[(city_key, street_key)] = entry
+            self._street_trie.add(street_key, city_key)
+        if house_from is None:
+            self._streets[(city_key, street_key)] = entry._replace(center=(latitude, longitude))
+        else:
+            entry.ranges.append((house_from, house_to if house_to is not None else house_from, latitude, longitude))
+
+    def finish(self):
+        """Fill in the centers of streets that only have house ranges."""
+        for key, entry in self._streets.items():
+            if entry.center is None and entry.ranges:
+                center = (
+                    sum(r[2] for r in entry.ranges) / len(entry.ranges),
+                    sum(r[3] for r in entry.ranges) / len(entry.ranges)
+                )
+                self._streets[key] = entry._replace(center=center)
+        self._cached_lookup.cache_clear()
+
+    def geocode(self, address: str) -> Optional[GeocodeResult]:
+        """
+        Resolve a free-text address like "Москва, ул. Пушкина, д. 10".
+
+        Returns:
+            The most precise match, or None if nothing matched
+        """
+        tokens = tokenize(address)
+        return self._cached_lookup(" ".join(tokens)) if tokens else None
+
+    def cache_info(self):
+        """Hit and miss counters of the lookup cache."""
+        return self._cached_lookup.cache_info()
+
+    def _split_city(self, tokens: List[str]) -> Tuple[Optional[str], List[str]]:
+        """Find a known city in the tokens and return it with the remaining tokens."""
+        for size in (3, 2, 1):
+            for start in range(len(tokens) - size + 1):
+                candidate = " ".join(tokens[start:start + size])
+                if candidate in self._cities:
+                    return candidate, tokens[:start] + tokens[start + size:]
+        # Allow a typo in the city only when it is written first
+        if tokens and len(tokens[0]) > 4:
+            matches = self._city_trie.search(tokens[0], 1)
+            if matches and not matches[0][1]:
+                return matches[0][3], tokens[1:]
+        return None, tokens
+
+    def _lookup(self, normalized: str) -> Optional[GeocodeResult]:
+        city, tokens = self._split_city(normalized.split())
+
+        # The house number is the first number after the street, anything after it is ignored
+        house = None
+        rest = []
+        for token in tokens:
+            match = _HOUSE_RE.match(token)
+            if match and rest:
+                house = int(match.group(1))
+                break
+            rest.append(token)
+
+        street_key = normalize_street(" ".join(rest))
+        if street_key:
+            # Short names get fewer typos, or every short street would match
+            max_typos = min(self.max_typos, len(street_key.split(" ")[0]) // 4)
+            for _distance, _prefix, key, street_city in self._street_trie.search(street_key, max_typos):
+                if city is not None and street_city != city:
+                    continue
+                entry = self._streets[(street_city, key)]
+                return self._resolve_house(entry, house)
+
+        if city is not None and self._cities[city][1] is not None:
+            latitude, longitude = self._cities[city][1]
+            return GeocodeResult(latitude, longitude, "city", self._cities[city][0])
+        return None
+
+    def _resolve_house(self, entry: _Street, house: Optional[int]) -> Optional[GeocodeResult]:
+        matched = f"{self._cities[entry.city][0]}, {entry.name}"
+        if house is not None:
+            for house_from, house_to, latitude, longitude in entry.ranges:
+                if house_from <= house <= house_to:
+                    return GeocodeResult(latitude, longitude, "house", f"{matched}, {house}")
+        if entry.center is None:
+            return None
+        return GeocodeResult(entry.center[0], entry.center[1], "street", matched)
+
+
+# Shared geocoder, loaded on first use. False means there is no gazetteer.
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder() -> Optional[Geocoder]:
+    """Get the shared geocoder, or None if no gazetteer file is available."""
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            path = GAZETTEER_PATH or DEFAULT_GAZETTEER_PATH
+            if os.path.exists(path):
+                _geocoder = Geocoder.from_csv(path)
+                logger.info(f"Loaded gazetteer {path}")
+            else:
+                logger.info(f"No gazetteer at {path}, manual addresses are not geocoded")
+                _geocoder = False
+        return _geocoder or None
+
+
+def geocode(address: str) -> Optional[GeocodeResult]:
+    """Resolve an address with the shared geocoder."""
+    geocoder = get_geocoder()
+    return geocoder.geocode(address) if geocoder else None
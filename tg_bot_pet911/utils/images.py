@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, derivatives are skipped without it
+    Image = None
+    ImageOps = None
+
+from tg_bot_pet911.config.config import IMAGE_WORKERS, THUMBNAIL_SIZES, MEDIUM_SIZE, MEDIUM_QUALITY
+from tg_bot_pet911.utils.phash import dhash
+
+
+logger = logging.getLogger(__name__)
+
+# Process pool for image decoding, created on first use
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def process_photo(path: str) -> Dict[str, Any]:
+    """
+    Decode a photo once and create everything derived from it.
+
+    Runs in a worker process, so it must only use its arguments and the config.
+
+    Args:
+        path: Path to the original photo
+
+    Returns:
+        Dict with "derivatives" (derivative name to filename) and "dhash" (hex perceptual hash)
+    """
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    return {
+        "derivatives": make_derivatives(image, os.path.splitext(path)[0]),
+        "dhash": f"{dhash(image):016x}"
+    }
+
+
+def make_derivatives(image, base: str) -> Dict[str, str]:
+    """
+    Create thumbnails and a medium JPEG next to an original photo.
+
+    Args:
+        image: Decoded original photo
+        base: Original photo path without extension
+
+    Returns:
+        Dict mapping derivative name ("thumb_<size>", "medium") to its filename
+    """
+    derivatives = {}
+
+    # Medium: longest side limited, aspect ratio kept
+    medium = image.copy()
+    medium.thumbnail((MEDIUM_SIZE, MEDIUM_SIZE), Image.LANCZOS)
+    medium_path = f"{base}_medium.jpg"
+    medium.save(medium_path, "JPEG", quality=MEDIUM_QUALITY, optimize=True, progressive=True)
+    derivatives["medium"] = os.path.basename(medium_path)
+
+    # Thumbnails: fixed square size, center-cropped. Downscale from the
+    # medium version, it is much cheaper than the original.
+    for size in THUMBNAIL_SIZES:
+        thumb = ImageOps.fit(medium if size <= MEDIUM_SIZE else image, (size, size), Image.LANCZOS)
+        thumb_path = f"{base}_thumb_{size}.jpg"
+        thumb.save(thumb_path, "JPEG", quality=MEDIUM_QUALITY, optimize=True)
+        derivatives[f"thumb_{size}"] = os.path.basename(thumb_path)
+
+    return derivatives
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """Get the shared image processing pool."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def shutdown_image_executor():
+    """Stop the image processing pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+async def process_photos(photo_dir: str, photo_files: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Create derivatives and perceptual hashes for saved photos without blocking the event loop.
+
+    Args:
+        photo_dir: Directory with the original photos
+        photo_files: Filenames of the original photos
+
+    Returns:
+        Dict mapping each original filename to the result of process_photo.
+        Photos that could not be processed are left out.
+    """
+    if Image is None or not photo_files:
+        return {}
+
+    loop = asyncio.get_running_loop()
+    executor = get_image_executor()
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, process_photo, os.path.join(photo_dir, filename))
+            for filename in photo_files
+        ),
+        return_exceptions=True
+    )
+
+    processed = {}
+    for filename, result in zip(photo_files, results):
+        if isinstance(result, BaseException):
+            logger.warning("Failed to process photo %s: %s", filename, result)
+        else:
+            processed[filename] = result
+    return processed
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from aiogram import Bot
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from tg_bot_pet911.config.config import PERSISTENCE_WORKERS, PERSISTENCE_MAX_ATTEMPTS, PERSISTENCE_LEASE_SECONDS
+
+
+# Queue database lives next to the pet directories
+JOB_QUEUE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "jobs.sqlite3")
+
+# How often idle workers look for jobs enqueued by another process or due for retry
+POLL_INTERVAL = 1.0
+
+# Jobs a queue may lease: due pending jobs and jobs whose lease ran out (takes "now" twice)
+CLAIMABLE = (
+    "(status = 'pending' AND available_at <= ?) "
+    "OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at <= ?))"
+)
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Bot, Dict[str, Any]], Awaitable[None]]
+
+# Job handlers by job kind
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help, the job is given up at once."""
+
+
+def register_job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Register a coroutine that processes jobs of the given kind."""
+    def decorator(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+class PersistenceQueue:
+    """Durable job queue backed by SQLite.
+
+    A job is committed to disk before ``enqueue`` returns, so it survives a
+    ``kill -9``. A claimed job is leased to the queue that claimed it, which
+    renews the lease while the job runs. Several processes can share the
+    database: a job whose lease ran out (its process died) is taken over by
+    whichever queue claims next, so handlers must be safe to run twice.
+    """
+
+    def __init__(
+        self,
+        db_path: str = JOB_QUEUE_DB_PATH,
+        max_attempts: int = PERSISTENCE_MAX_ATTEMPTS,
+        lease_seconds: float = PERSISTENCE_LEASE_SECONDS
+    ):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        # Marks the jobs leased by this queue
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "kind TEXT NOT NULL, "
+            "payload TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "last_error TEXT, "
+            "created_at REAL NOT NULL, "
+            "available_at REAL NOT NULL, "
+            "owner TEXT, "
+            "lease_expires_at REAL)"
+        )
+        # Databases created before leases
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at)")
+        self._conn.commit()
+
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._draining = False
+        # Ids of the jobs being processed
+        self._running: Set[int] = set()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> int:
+        """
+        Durably add a job to the queue.
+
+        Args:
+            kind: Job kind, must have a registered handler
+            payload: JSON-serializable job data
+
+        Returns:
+            Job id
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, created_at, available_at) VALUES (?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False, default=str), now, now)
+            )
+        self._notify()
+        return cursor.lastrowid
+
+    def pending_count(self) -> int:
+        """Number of jobs waiting or running."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()[0]
+
+    def failed_jobs(self) -> List[Dict[str, Any]]:
+        """Jobs that ran out of attempts."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, payload, attempts, last_error FROM jobs WHERE status = 'failed' ORDER BY id"
+            ).fetchall()
+        return [
+            {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3], "error": row[4]}
+            for row in rows
+        ]
+
+    async def start(self, bot: Bot, workers: int = PERSISTENCE_WORKERS):
+        """Recover interrupted jobs and start the worker pool."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._draining = False
+
+        # Jobs of a killed process go back to the queue once their lease ran out,
+        # jobs of a live process sharing the database keep running there
+        with self._lock, self._conn:
+            recovered = self._conn.execute(
+                "UPDATE jobs SET status = 'pending', owner = NULL, lease_expires_at = NULL "
+                "WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at <= ?)",
+                (time.time(),)
+            ).rowcount
+        if recovered:
+            logger.info("Recovered %s interrupted jobs", recovered)
+
+        self._workers = [
+            asyncio.create_task(self._worker(bot), name=f"persistence-worker-{i}")
+            for i in range(workers)
+        ]
+        if workers:
+            self._heartbeat = asyncio.create_task(self._renew_loop(), name="persistence-heartbeat")
+        logger.info("Started %s persistence workers", workers)
+
+    async def stop(self):
+        """Stop the workers. Jobs being processed are released to be retried by any queue."""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        await asyncio.to_thread(self._release)
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Let the workers finish the jobs they are running, then stop them.
+
+        Workers take no new jobs. Jobs still running after ``timeout`` are
+        cancelled and released to the queue for a retry.
+
+        Returns:
+            Number of interrupted jobs
+        """
+        self._draining = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._workers:
+            await asyncio.wait(self._workers, timeout=timeout)
+        interrupted = len(self._running)
+        await self.stop()
+        return interrupted
+
+    async def run_pending(self, bot: Bot):
+        """Process all jobs that are due right now, then return."""
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                return
+            await self._process(bot, job)
+
+    def _notify(self):
+        """Wake up idle workers, safe to call from any thread."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """Lease the oldest due job, or one whose lease ran out, and return it."""
+        while True:
+            now = time.time()
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    f"SELECT id, kind, payload, attempts FROM jobs WHERE {CLAIMABLE} ORDER BY id LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                # The select runs outside the write transaction, another process may have leased the job since
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_expires_at = ? "
+                    f"WHERE id = ? AND ({CLAIMABLE})",
+                    (self.owner, now + self.lease_seconds, row[0], now, now)
+                ).rowcount
+            if claimed == 1:
+                return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3]}
+
+    def _renew(self) -> int:
+        """Extend the leases of the jobs this queue is running."""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, self.owner)
+            ).rowcount
+
+    def _release(self):
+        """Put the jobs this queue was running back in the queue."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending', owner = NULL, lease_expires_at = NULL "
+                "WHERE owner = ? AND status = 'running'",
+                (self.owner,)
+            )
+
+    async def _renew_loop(self):
+        # Renewing three times per lease survives a missed heartbeat
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self._renew)
+            except sqlite3.Error as e:
+                logger.error("Failed to renew job leases: %s", e)
+
+    def _finish(self, job_id: int):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def _fail(self, job: Dict[str, Any], error: str, permanent: bool = False):
+        """Schedule a retry with exponential backoff, or give up."""
+        attempts = job["attempts"] + 1
+        status = "failed" if permanent or attempts >= self.max_attempts else "pending"
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, last_error = ?, available_at = ?, "
+                "owner = NULL, lease_expires_at = NULL WHERE id = ? AND owner = ?",
+                (status, attempts, error, time.time() + 2 ** attempts, job["id"], self.owner)
+            )
+
+    async def _process(self, bot: Bot, job: Dict[str, Any]):
+        handler = JOB_HANDLERS.get(job["kind"])
+        self._running.add(job["id"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind '{job['kind']}'")
+            await handler(bot, job["payload"])
+        except Exception as e:
+            logger.exception("Job %s (%s) failed", job["id"], job["kind"])
+            await asyncio.to_thread(
+                self._fail, job, f"{type(e).__name__}: {e}", isinstance(e, PermanentJobError)
+            )
+        else:
+            await asyncio.to_thread(self._finish, job["id"])
+        finally:
+            self._running.discard(job["id"])
+
+    async def _worker(self, bot: Bot):
+        while not self._draining:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                if self._draining:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(bot, job)
+
+
+# Shared queue instance, opened on first use
+_persistence_queue: Optional[PersistenceQueue] = None
+
+
+def get_persistence_queue() -> PersistenceQueue:
+    """Get the shared persistence queue."""
+    global _persistence_queue
+    if _persistence_queue is None:
+        _persistence_queue = PersistenceQueue()
+    return _persistence_queue
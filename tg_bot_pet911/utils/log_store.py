@@ -0,0 +1,328 @@
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional
+
+from tg_bot_pet911.config.config import LOG_SEGMENT_MAX_BYTES, LOG_COMPACT_SEGMENTS
+
+
+# Log store lives next to the pet directories
+LOG_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "log")
+
+SEGMENT_PREFIX = "segment_"
+SEGMENT_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+
+
+class IndexEntry(NamedTuple):
+    """Location of the latest version of a record."""
+    segment: int
+    offset: int
+    length: int
+    seq: int
+    deleted: bool
+
+
+def _segment_name(number: int) -> str:
+    """Segment filename for a segment number."""
+    return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+
+class PetLogStore:
+    """Append-only store for pet records.
+
+    Records are appended as compact JSON lines to segment files that are
+    rotated by size. Every segment has a ``.idx`` file with the offset of
+    each record, so lookups are a single seek. Older segments are
+    periodically compacted into one, dropping superseded versions.
+
+    Every record carries a sequence number, the highest one wins. This keeps
+    the index correct even if a compaction is interrupted halfway.
+    """
+
+    def __init__(
+        self,
+        root: str = LOG_STORE_PATH,
+        segment_max_bytes: int = LOG_SEGMENT_MAX_BYTES,
+        compact_segments: int = LOG_COMPACT_SEGMENTS
+    ):
+        self.root = root
+        self.photos_path = os.path.join(root, "photos")
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_segments = compact_segments
+
+        os.makedirs(self.photos_path, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._index: Dict[str, IndexEntry] = {}
+        self._seq = 0
+        self._segments: List[int] = []
+        self._load()
+
+    # Public API
+
+    def append(self, pet_data: Dict[str, Any], dir_name: Optional[str] = None) -> str:
+        """
+        Append a pet record.
+
+        Args:
+            pet_data: Record payload, the same dict that is written to the JSON file
+            dir_name: Legacy directory name used when materializing the record
+
+        Returns:
+            Path of the segment the record was written to
+        """
+        with self._lock:
+            envelope = {"id": pet_data["id"], "dir": dir_name, "record": pet_data}
+            number = self._write(envelope)
+            self._maybe_compact()
+            return os.path.join(self.root, _segment_name(number))
+
+    def delete(self, pet_id: str):
+        """Append a tombstone for a record."""
+        with self._lock:
+            if pet_id in self._index and not self._index[pet_id].deleted:
+                self._write({"id": pet_id, "deleted": True})
+
+    def get(self, pet_id: str) -> Optional[Dict[str, Any]]:
+        """Get the latest version of a record."""
+        with self._lock:
+            entry = self._index.get(pet_id)
+            if entry is None or entry.deleted:
+                return None
+            return self._read(entry)["record"]
+
+    def __contains__(self, pet_id: str) -> bool:
+        entry = self._index.get(pet_id)
+        return entry is not None and not entry.deleted
+
+    def __len__(self) -> int:
+        return sum(1 for entry in self._index.values() if not entry.deleted)
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the latest version of every live record."""
+        with self._lock:
+            entries = sorted(
+                (entry for entry in self._index.values() if not entry.deleted),
+                key=lambda entry: entry.seq
+            )
+        for entry in entries:
+            with self._lock:
+                yield self._read(entry)["record"]
+
+    def materialize(self, pet_id: str, dest_root: str) -> Optional[str]:
+        """
+        Write a record in the legacy per-pet directory layout.
+
+        Args:
+            pet_id: Record id
+            dest_root: Directory to create the pet directory in
+
+        Returns:
+            Path to the created pet directory, None if the record does not exist
+        """
+        with self._lock:
+            entry = self._index.get(pet_id)
+            if entry is None or entry.deleted:
+                return None
+            envelope = self._read(entry)
+
+        pet_data = envelope["record"]
+        prefix = f"{pet_data.get('pet_type') or 'unknown'}_{pet_data.get('gender') or 'unknown'}_{pet_id}"
+        pet_dir = os.path.join(dest_root, envelope.get("dir") or prefix)
+        os.makedirs(pet_dir, exist_ok=True)
+
+        for filename in pet_data.get("photo_files", []):
+            source = os.path.join(self.photos_path, filename)
+            if os.path.exists(source):
+                shutil.copy2(source, os.path.join(pet_dir, filename))
+
+        with open(os.path.join(pet_dir, f"{prefix}_data.json"), "w", encoding="utf-8") as f:
+            f.write(json.dumps(pet_data, ensure_ascii=False, indent=2))
+        return pet_dir
+
+    def compact(self):
+        """Merge all sealed segments into one, keeping only live versions."""
+        with self._lock:
+            sealed = self._segments[:-1]
+            if len(sealed) < 2:
+                return
+
+            target = sealed[0]
+            tmp_segment = os.path.join(self.root, _segment_name(target) + ".compact")
+            tmp_index = tmp_segment + INDEX_SUFFIX
+            new_entries = {}
+
+            with open(tmp_segment, "wb") as seg_file, open(tmp_index, "w", encoding="utf-8") as idx_file:
+                offset = 0
+                for pet_id, entry in sorted(self._index.items(), key=lambda item: item[1].seq):
+                    if entry.segment not in sealed:
+                        continue
+                    line = self._read_raw(entry)
+                    seg_file.write(line)
+                    idx_file.write(self._index_line(pet_id, offset, len(line), entry.seq, entry.deleted))
+                    new_entries[pet_id] = entry._replace(segment=target, offset=offset, length=len(line))
+                    offset += len(line)
+                seg_file.flush()
+                os.fsync(seg_file.fileno())
+
+            # Swap the compacted segment in, then drop the merged ones. The old
+            # index goes first: a missing index is rebuilt by scanning on load.
+            if os.path.exists(self._index_path(target)):
+                os.remove(self._index_path(target))
+            os.replace(tmp_segment, self._segment_path(target))
+            os.replace(tmp_index, self._index_path(target))
+            for number in sealed[1:]:
+                os.remove(self._segment_path(number))
+                if os.path.exists(self._index_path(number)):
+                    os.remove(self._index_path(number))
+
+            self._index.update(new_entries)
+            self._segments = [target] + self._segments[len(sealed):]
+
+    # Internals
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.root, _segment_name(number))
+
+    def _index_path(self, number: int) -> str:
+        return self._segment_path(number) + INDEX_SUFFIX
+
+    @staticmethod
+    def _index_line(pet_id: str, offset: int, length: int, seq: int, deleted: bool) -> str:
+        return f"{pet_id}\t{offset}\t{length}\t{seq}\t{'D' if deleted else 'P'}\n"
+
+    def _write(self, envelope: Dict[str, Any]) -> int:
+        """Append an envelope to the active segment and index it."""
+        self._seq += 1
+        envelope["seq"] = self._seq
+        line = (json.dumps(envelope, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+        number = self._segments[-1]
+        if os.path.getsize(self._segment_path(number)) + len(line) > self.segment_max_bytes \
+                and os.path.getsize(self._segment_path(number)) > 0:
+            number = self._new_segment()
+
+        with open(self._segment_path(number), "ab") as seg_file:
+            offset = seg_file.tell()
+            seg_file.write(line)
+        deleted = bool(envelope.get("deleted"))
+        with open(self._index_path(number), "a", encoding="utf-8") as idx_file:
+            idx_file.write(self._index_line(envelope["id"], offset, len(line), self._seq, deleted))
+
+        self._apply(envelope["id"], IndexEntry(number, offset, len(line), self._seq, deleted))
+        return number
+
+    def _new_segment(self) -> int:
+        """Start a new active segment."""
+        number = (self._segments[-1] + 1) if self._segments else 1
+        open(self._segment_path(number), "ab").close()
+        self._segments.append(number)
+        return number
+
+    def _maybe_compact(self):
+        """Compact once enough sealed segments have piled up."""
+        if self.compact_segments and len(self._segments) - 1 >= self.compact_segments:
+            self.compact()
+
+    def _read_raw(self, entry: IndexEntry) -> bytes:
+        with open(self._segment_path(entry.segment), "rb") as seg_file:
+            seg_file.seek(entry.offset)
+            return seg_file.read(entry.length)
+
+    def _read(self, entry: IndexEntry) -> Dict[str, Any]:
+        return json.loads(self._read_raw(entry))
+
+    def _apply(self, pet_id: str, entry: IndexEntry):
+        """Update the index if the entry is newer than the known one."""
+        current = self._index.get(pet_id)
+        if current is None or entry.seq > current.seq:
+            self._index[pet_id] = entry
+        self._seq = max(self._seq, entry.seq)
+
+    def _load(self):
+        """Load segment indexes, rebuilding any that are behind their segment."""
+        numbers = sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.root)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        self._segments = numbers
+        for number in numbers:
+            indexed_end = 0
+            if os.path.exists(self._index_path(number)):
+                with open(self._index_path(number), encoding="utf-8") as idx_file:
+                    for line in idx_file:
+                        parts = line.rstrip("\n").split("\t")
+                        if len(parts) != 5:
+                            continue
+                        pet_id, offset, length, seq, flag = parts
+                        entry = IndexEntry(number, int(offset), int(length), int(seq), flag == "D")
+                        indexed_end = max(indexed_end, entry.offset + entry.length)
+                        self._apply(pet_id, entry)
+            self._scan_tail(number, indexed_end)
+
+        if not self._segments:
+            self._new_segment()
+
+    def _scan_tail(self, number: int, start: int):
+        """Index records written after the last index line, e.g. after a crash."""
+        path = self._segment_path(number)
+        size = os.path.getsize(path)
+        if size <= start:
+            return
+
+        with open(path, "rb") as seg_file:
+            seg_file.seek(start)
+            data = seg_file.read()
+
+        offset = start
+        with open(self._index_path(number), "a", encoding="utf-8") as idx_file:
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    # Partially written record, cut it off
+                    with open(path, "r+b") as seg_file:
+                        seg_file.truncate(offset)
+                    break
+                envelope = json.loads(line)
+                deleted = bool(envelope.get("deleted"))
+                idx_file.write(self._index_line(envelope["id"], offset, len(line), envelope["seq"], deleted))
+                self._apply(envelope["id"], IndexEntry(number, offset, len(line), envelope["seq"], deleted))
+                offset += len(line)
+
+
+# Shared log store instance, opened on first use
+_log_store: Optional[PetLogStore] = None
+
+
+def get_log_store() -> PetLogStore:
+    """Get the shared log store instance."""
+    global _log_store
+    if _log_store is None:
+        _log_store = PetLogStore()
+    return _log_store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from tg_bot_pet911.utils.storage import PETS_DATA_PATH
+
+    parser = argparse.ArgumentParser(description="Maintain the append-only pet log store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    materialize_parser = subparsers.add_parser("materialize", help="Write records as legacy pet directories")
+    materialize_parser.add_argument("ids", nargs="*", help="Record ids, all records if omitted")
+    materialize_parser.add_argument("--dest", default=PETS_DATA_PATH, help="Destination directory")
+    subparsers.add_parser("compact", help="Compact sealed segments")
+    args = parser.parse_args()
+
+    store = get_log_store()
+    if args.command == "compact":
+        store.compact()
+        print(f"Compacted log store in {store.root}")
+    else:
+        ids = args.ids or [record["id"] for record in store.iter_records()]
+        for pet_id in ids:
+            pet_dir = store.materialize(pet_id, args.dest)
+            print(pet_dir or f"Record {pet_id} not found")
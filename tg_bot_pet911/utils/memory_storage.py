@@ -0,0 +1,237 @@
+import asyncio
+import copy
+import heapq
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from tg_bot_pet911.config.config import FSM_TTL_SECONDS, FSM_ARCHIVE_ABANDONED
+from tg_bot_pet911.utils.fsm_patch import DataPatch, apply_patch
+from tg_bot_pet911.utils.fsm_serializer import JsonSerializer
+
+
+# Abandoned drafts are appended here as JSON lines, next to the pet directories
+ABANDONED_DRAFTS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "abandoned_drafts.jsonl")
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiringMemoryStorage(MemoryStorage):
+    """
+    In-memory FSM storage dropping conversations idle for longer than a TTL.
+
+    Every read or write of a conversation moves its deadline. Deadlines are
+    kept in a heap with one entry per conversation, so finding the expired
+    ones never scans all of them: an entry whose conversation was used since
+    it was pushed is pushed again with the new deadline when it comes up.
+    A finished conversation (no state, no data) is dropped right away.
+
+    Plain MemoryStorage also creates a record for every user it is asked
+    about; here reads of unknown conversations create nothing.
+    """
+
+    def __init__(
+        self,
+        ttl: float = FSM_TTL_SECONDS,
+        archive_path: Optional[str] = ABANDONED_DRAFTS_PATH if FSM_ARCHIVE_ABANDONED else None,
+        resolution: float = 1.0
+    ):
+        super().__init__()
+        self.ttl = ttl
+        self.archive_path = archive_path
+        self.resolution = resolution
+        self._deadlines: Dict[StorageKey, float] = {}
+        # (deadline, push order, key), the deadline may be older than the one in _deadlines
+        self._heap: List[Tuple[float, int, StorageKey]] = []
+        self._in_heap: Set[StorageKey] = set()
+        self._pushes = 0
+        self._sizes: Dict[StorageKey, int] = {}
+        self._bytes = 0
+        self._serializer = JsonSerializer()
+        self._wakeup = asyncio.Event()
+        self._expirer: Optional[asyncio.Task] = None
+        self.expired = 0
+        self.archived = 0
+
+    # Deadlines
+
+    def _touch(self, key: StorageKey):
+        if not self.ttl:
+            return
+        deadline = time.monotonic() + self.ttl
+        self._deadlines[key] = deadline
+        if key not in self._in_heap:
+            self._push(deadline, key)
+
+    def _push(self, deadline: float, key: StorageKey):
+        self._pushes += 1
+        heapq.heappush(self._heap, (deadline, self._pushes, key))
+        self._in_heap.add(key)
+        self._wakeup.set()
+
+    def _drop(self, key: StorageKey):
+        """Forget a conversation; its heap entry is skipped when it comes up."""
+        self.storage.pop(key, None)
+        self._deadlines.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+
+    def _finished(self, key: StorageKey) -> bool:
+        record = self.storage.get(key)
+        return record is not None and record.state is None and not record.data
+
+    # BaseStorage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self.storage[key].state = state.state if isinstance(state, State) else state
+        if self._finished(key):
+            self._drop(key)
+        else:
+            self._touch(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self.storage.get(key)
+        if record is None:
+            return None
+        self._touch(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        self.storage[key].data = data.copy()
+        if self._finished(key):
+            self._drop(key)
+            return
+        size = len(self._serializer.dumps(data)) if data else 0
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._touch(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self.storage.get(key)
+        if record is None:
+            return {}
+        self._touch(key)
+        return record.data.copy()
+
+    async def patch_data(self, key: StorageKey, patch: DataPatch) -> None:
+        """Apply a patch in place; bytes held change by the size of the patched values."""
+        record = self.storage[key]
+        apply_patch(record.data, copy.deepcopy(patch))
+        dumps = self._serializer.dumps_value
+        size = self._sizes.get(key, 0) + sum(
+            len(dumps(value)) - len(dumps(patch.base.get(field))) for field, value in patch.fields.items()
+        ) + sum(len(dumps(item)) for items in patch.appends.values() for item in items)
+        self._bytes += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+        self._touch(key)
+
+    async def get_value(self, storage_key: StorageKey, dict_key: str, default: Optional[Any] = None) -> Optional[Any]:
+        if storage_key not in self.storage:
+            return default
+        return await super().get_value(storage_key, dict_key, default)
+
+    async def close(self) -> None:
+        if self._expirer is not None:
+            self._expirer.cancel()
+            await asyncio.gather(self._expirer, return_exceptions=True)
+            self._expirer = None
+
+    # Expiry
+
+    def start(self):
+        """Start expiring idle conversations in the background."""
+        if self.ttl and self._expirer is None:
+            self._expirer = asyncio.create_task(self._expire_loop(), name="fsm-expiry")
+
+    async def _expire_loop(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Wake up at most once per resolution, expiring everything due by then
+            await asyncio.sleep(max(self._heap[0][0] - time.monotonic(), self.resolution))
+            try:
+                await self.expire()
+            except Exception as e:
+                logger.error(f"Failed to expire FSM conversations: {e}")
+
+    async def expire(self, now: Optional[float] = None) -> int:
+        """
+        Drop conversations whose deadline has passed, archiving drafts if enabled.
+
+        Returns:
+            Number of expired conversations
+        """
+        now = time.monotonic() if now is None else now
+        drafts = []
+        count = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            self._in_heap.discard(key)
+            deadline = self._deadlines.get(key)
+            if deadline is None:
+                continue
+            if deadline > now:
+                # Used since the entry was pushed
+                self._push(deadline, key)
+                continue
+            record = self.storage.get(key)
+            if record is not None and record.data and self.archive_path:
+                drafts.append(self._archive_entry(key, record.state, record.data))
+            self._drop(key)
+            count += 1
+
+        if drafts:
+            await asyncio.to_thread(self._append_archive, drafts)
+            self.archived += len(drafts)
+        self.expired += count
+        if count:
+            logger.info(
+                f"Expired {count} abandoned conversations ({len(drafts)} archived), "
+                f"{self.live_conversations} live holding {self.bytes_held} bytes"
+            )
+        return count
+
+    def _archive_entry(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> bytes:
+        return self._serializer.dumps({
+            "expired_at": datetime.now().isoformat(),
+            "bot_id": key.bot_id,
+            "chat_id": key.chat_id,
+            "user_id": key.user_id,
+            "state": state,
+            "data": data
+        })
+
+    def _append_archive(self, drafts: List[bytes]):
+        os.makedirs(os.path.dirname(self.archive_path), exist_ok=True)
+        with open(self.archive_path, "ab") as f:
+            f.write(b"".join(draft + b"\n" for draft in drafts))
+
+    # Metrics
+
+    @property
+    def live_conversations(self) -> int:
+        return len(self.storage)
+
+    @property
+    def bytes_held(self) -> int:
+        """Size of the conversations' data as JSON, an estimate of the memory they take."""
+        return self._bytes
+
+    def metrics(self) -> Dict[str, int]:
+        """Live conversations, bytes held, and conversations expired and archived so far."""
+        return {
+            "live_conversations": self.live_conversations,
+            "bytes_held": self.bytes_held,
+            "expired": self.expired,
+            "archived": self.archived
+        }
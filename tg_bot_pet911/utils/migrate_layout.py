@@ -0,0 +1,98 @@
+"""Move pet directories from the flat layout into the sharded one.
+
+Run offline, with the bot stopped:
+
+    python -m tg_bot_pet911.utils.migrate_layout [--workers 8] [--dry-run]
+"""
+import argparse
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from tg_bot_pet911.utils import storage
+from tg_bot_pet911.utils.catalog import get_catalog
+
+
+# <YYYYMMDD>_<HHMMSS>_<type>_<gender>_<id>
+PET_DIR_PATTERN = re.compile(r"^(\d{8}_\d{6})_.+_([0-9a-f]+)$")
+
+
+def plan_moves(pets_path: str) -> List[Tuple[str, str, str]]:
+    """
+    Find flat pet directories and where they belong in the sharded layout.
+
+    Args:
+        pets_path: Root directory with saved pet data
+
+    Returns:
+        List of (pet id, current path, sharded path)
+    """
+    moves = []
+    for name in sorted(os.listdir(pets_path)):
+        match = PET_DIR_PATTERN.match(name)
+        source = os.path.join(pets_path, name)
+        if not match or not os.path.isdir(source):
+            continue
+        created = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+        pet_id = match.group(2)
+        moves.append((pet_id, source, storage.pet_dir_path(name, pet_id, created, layout="sharded")))
+    return moves
+
+
+def move_pet_dir(pet_id: str, source: str, target: str) -> Optional[str]:
+    """Move one pet directory and point the catalog at its new path."""
+    if os.path.exists(target):
+        return f"{source}: target {target} already exists"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.rename(source, target)
+    get_catalog().set_pet_dir(pet_id, target)
+    return None
+
+
+def migrate(pets_path: str, workers: int = 8, dry_run: bool = False) -> Tuple[int, List[str]]:
+    """
+    Move all flat pet directories into the sharded layout in parallel.
+
+    Args:
+        pets_path: Root directory with saved pet data
+        workers: Number of parallel moves
+        dry_run: Only report what would be moved
+
+    Returns:
+        Tuple containing (number of moved directories, list of errors)
+    """
+    moves = plan_moves(pets_path)
+    if dry_run:
+        for _pet_id, source, target in moves:
+            print(f"{source} -> {target}")
+        return 0, []
+
+    errors = []
+    moved = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(move_pet_dir, *move) for move in moves]
+        for (_pet_id, source, _target), future in zip(moves, futures):
+            try:
+                error = future.result()
+            except OSError as e:
+                error = f"{source}: {e}"
+            if error:
+                errors.append(error)
+            else:
+                moved += 1
+    return moved, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move pet directories into the sharded layout")
+    parser.add_argument("--workers", type=int, default=8, help="Number of parallel moves")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned moves")
+    args = parser.parse_args()
+
+    moved, errors = migrate(storage.PETS_DATA_PATH, workers=args.workers, dry_run=args.dry_run)
+    for error in errors:
+        print(f"⚠️ {error}")
+    if not args.dry_run:
+        print(f"Moved {moved} pet directories, {len(errors)} errors")
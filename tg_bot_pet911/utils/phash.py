@@ -0,0 +1,184 @@
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, photos are not hashed without it
+    Image = None
+
+from tg_bot_pet911.config.config import DUPLICATE_HASH_RADIUS
+from tg_bot_pet911.utils.catalog import get_catalog
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """
+    Compute the difference hash of a PIL image.
+
+    The image is shrunk to (hash_size + 1) x hash_size grayscale pixels and
+    every bit tells whether a pixel is brighter than its right neighbour.
+    Resized, recompressed or slightly edited copies get hashes that differ
+    in only a few bits.
+
+    Args:
+        image: PIL image
+        hash_size: Hash side, the hash has hash_size ** 2 bits
+
+    Returns:
+        Hash as an integer
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance.
+
+    Answers "all hashes within distance r" by visiting only the subtrees
+    whose distance to the query can be within r (triangle inequality),
+    instead of comparing against every stored hash.
+    """
+
+    def __init__(self):
+        # Node: [hash, values, {distance: child node}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value_hash: int, value: Any):
+        """Add a hash with an attached value."""
+        self._size += 1
+        if self._root is None:
+            self._root = [value_hash, [value], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming(value_hash, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, query: int, radius: int) -> List[Tuple[int, Any]]:
+        """
+        Find all values whose hash is within radius of the query.
+
+        Returns:
+            List of (distance, value), closest first
+        """
+        if self._root is None:
+            return []
+
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(query, node[0])
+            if distance <= radius:
+                results.extend((distance, value) for value in node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class DuplicateIndex:
+    """Index of photo hashes of all saved pet records."""
+
+    def __init__(self, radius: int = DUPLICATE_HASH_RADIUS):
+        self.radius = radius
+        self._tree = BKTree()
+        self._indexed: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def add_record(self, pet_data: Dict[str, Any]):
+        """Add the photo hashes of a saved record, once per record."""
+        with self._lock:
+            pet_id = pet_data["id"]
+            if pet_id in self._indexed:
+                return
+            self._indexed.add(pet_id)
+            for filename, value_hash in (pet_data.get("photo_hashes") or {}).items():
+                self._tree.add(int(value_hash, 16), (pet_id, filename))
+
+    def find_duplicates(
+        self, hashes: Iterable[str], exclude_id: Optional[str] = None, radius: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Find records with photos similar to the given hashes.
+
+        Args:
+            hashes: Hex photo hashes of a record
+            exclude_id: Record id to leave out, usually the record itself
+            radius: Maximum Hamming distance, defaults to the index radius
+
+        Returns:
+            One entry per similar record with its closest photo, closest first
+        """
+        radius = self.radius if radius is None else radius
+        best: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for value_hash in hashes:
+                for distance, (pet_id, filename) in self._tree.search(int(value_hash, 16), radius):
+                    if pet_id == exclude_id:
+                        continue
+                    if pet_id not in best or distance < best[pet_id]["distance"]:
+                        best[pet_id] = {"id": pet_id, "photo": filename, "distance": distance}
+        return sorted(best.values(), key=lambda item: item["distance"])
+
+
+# Shared index, built from the catalog on first use
+_duplicate_index: Optional[DuplicateIndex] = None
+_duplicate_index_lock = threading.Lock()
+# Last catalog rowid the shared index has seen
+_duplicate_index_rowid = 0
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """Get the shared duplicate index, loading all saved hashes the first time."""
+    global _duplicate_index, _duplicate_index_rowid
+    with _duplicate_index_lock:
+        if _duplicate_index is None:
+            index = DuplicateIndex()
+            for rowid, record in get_catalog().iter_written(0):
+                index.add_record(record)
+                _duplicate_index_rowid = rowid
+            _duplicate_index = index
+        return _duplicate_index
+
+
+def refresh_duplicate_index() -> int:
+    """
+    Add the records other workers wrote to the catalog since the last refresh.
+
+    Returns:
+        Number of records read
+    """
+    global _duplicate_index_rowid
+    with _duplicate_index_lock:
+        if _duplicate_index is None:
+            return 0
+        count = 0
+        for rowid, record in get_catalog().iter_written(_duplicate_index_rowid):
+            _duplicate_index.add_record(record)
+            _duplicate_index_rowid = rowid
+            count += 1
+        return count
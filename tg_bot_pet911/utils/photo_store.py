@@ -0,0 +1,135 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from typing import NamedTuple, Optional
+
+
+# Photo blobs live next to the pet directories
+PHOTO_STORE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "blobs")
+
+
+class PhotoBlob(NamedTuple):
+    """A stored photo."""
+    sha256: str
+    path: str
+    size: int
+
+
+class PhotoStore:
+    """Content-addressed photo storage.
+
+    Photos are stored once under their SHA-256 and looked up by Telegram's
+    ``file_unique_id``, so a photo we already hold is never downloaded or
+    written again. Pet directories only hold hard links to the blobs.
+    """
+
+    def __init__(self, root: str = PHOTO_STORE_PATH):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS photos ("
+            "file_unique_id TEXT PRIMARY KEY, sha256 TEXT NOT NULL, ext TEXT NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_photos_sha256 ON photos (sha256)")
+        self._conn.commit()
+
+    def close(self):
+        """Close the index database."""
+        with self._lock:
+            self._conn.close()
+
+    def blob_path(self, sha256: str, ext: str) -> str:
+        """Path of a blob, sharded by the first hash bytes."""
+        return os.path.join(self.root, sha256[:2], sha256[2:4], f"{sha256}{ext}")
+
+    def lookup(self, file_unique_id: str) -> Optional[PhotoBlob]:
+        """Find the blob for a Telegram photo, if it is stored and intact."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, ext, size FROM photos WHERE file_unique_id = ?", (file_unique_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        sha256, ext, size = row
+        path = self.blob_path(sha256, ext)
+        try:
+            if os.path.getsize(path) != size:
+                return None
+        except OSError:
+            return None
+        return PhotoBlob(sha256, path, size)
+
+    def put(self, file_unique_id: str, data: bytes, ext: str = ".jpg") -> PhotoBlob:
+        """
+        Store photo content, writing it only if the content is new.
+
+        Args:
+            file_unique_id: Telegram file_unique_id of the photo
+            data: Photo content
+            ext: File extension for the blob
+
+        Returns:
+            The stored blob
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha256, ext)
+
+        if not (os.path.exists(path) and self._hash_file(path) == sha256):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO photos (file_unique_id, sha256, ext, size) VALUES (?, ?, ?, ?)",
+                (file_unique_id, sha256, ext, len(data))
+            )
+        return PhotoBlob(sha256, path, len(data))
+
+    def verify(self, blob: PhotoBlob) -> bool:
+        """Check that a blob's content still matches its hash."""
+        try:
+            return self._hash_file(blob.path) == blob.sha256
+        except OSError:
+            return False
+
+    @staticmethod
+    def link(blob: PhotoBlob, destination: str):
+        """Reference a blob from a pet directory without duplicating it."""
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(blob.path, destination)
+        except OSError:
+            # Hard links are not possible across filesystems
+            shutil.copy2(blob.path, destination)
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+# Shared photo store instance, opened on first use
+_photo_store: Optional[PhotoStore] = None
+
+
+def get_photo_store() -> PhotoStore:
+    """Get the shared photo store instance."""
+    global _photo_store
+    if _photo_store is None:
+        _photo_store = PhotoStore()
+    return _photo_store
@@ -0,0 +1,95 @@
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from tg_bot_pet911.utils.fsm_patch import DataPatch
+from tg_bot_pet911.utils.fsm_serializer import JsonSerializer
+
+
+class SerializingRedisStorage(RedisStorage):
+    """
+    Redis FSM storage writing conversation data with a pluggable serializer.
+
+    aiogram's RedisStorage only takes str JSON functions and decodes what it
+    reads as UTF-8, which rules out binary formats.
+
+    Patches (see fsm_patch) go to a hash next to the data, one hash field
+    per changed field (``pet_info.gender``) or appended list item
+    (``pet_info.photos+2``), so a step writes only what it changed. Reads
+    merge the hash over the data; a whole write replaces both.
+    """
+
+    def __init__(self, *args: Any, serializer: Optional[Any] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.serializer = serializer or JsonSerializer()
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+
+        redis_key = self.key_builder.build(key, "data")
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if data:
+                pipe.set(redis_key, self.serializer.dumps(data), ex=self.data_ttl)
+            else:
+                pipe.delete(redis_key)
+            pipe.delete(self.key_builder.build(key, "fields"))
+            await pipe.execute()
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self.key_builder.build(key, "data"))
+            pipe.hgetall(self.key_builder.build(key, "fields"))
+            value, fields = await pipe.execute()
+        return self.decode_data(value, fields)
+
+    def decode_data(self, value: Optional[bytes], fields: Optional[Mapping[bytes, bytes]]) -> Dict[str, Any]:
+        """Conversation data from the stored data and the patched fields over it."""
+        data = self.serializer.loads(value) if value else {}
+        patched = []
+        for path, payload in (fields or {}).items():
+            name, _, field = (path.decode() if isinstance(path, bytes) else path).partition(".")
+            field, _, index = field.partition("+")
+            patched.append((bool(index), int(index or 0), name, field, payload))
+        # Whole fields first, then appended items in order
+        for appended, index, name, field, payload in sorted(patched, key=lambda item: item[:2]):
+            target = data.get(name)
+            if not isinstance(target, dict):
+                target = data[name] = {}
+            value = self.serializer.loads_value(payload)
+            if not appended:
+                target[field] = value
+                continue
+            items = target.setdefault(field, [])
+            if index < len(items):
+                items[index] = value
+            else:
+                items.append(value)
+        return data
+
+    async def patch_data(self, key: StorageKey, patch: DataPatch) -> None:
+        """Write the changed fields of a patch to the hash, in one round trip."""
+        fields_key = self.key_builder.build(key, "fields")
+        mapping: Dict[str, bytes] = {}
+        stale = []
+        for field, value in patch.fields.items():
+            mapping[f"{patch.name}.{field}"] = self.serializer.dumps_value(value)
+            # Items appended to the old list are replaced with it
+            if isinstance(patch.base.get(field), list):
+                stale.extend(f"{patch.name}.{field}+{i}" for i in range(len(patch.base[field])))
+        for field, items in patch.appends.items():
+            start = len(patch.base[field])
+            for i, item in enumerate(items, start):
+                mapping[f"{patch.name}.{field}+{i}"] = self.serializer.dumps_value(item)
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if stale:
+                pipe.hdel(fields_key, *stale)
+            if mapping:
+                pipe.hset(fields_key, mapping=mapping)
+            if self.data_ttl:
+                pipe.expire(fields_key, self.data_ttl)
+                pipe.expire(self.key_builder.build(key, "data"), self.data_ttl)
+            await pipe.execute()
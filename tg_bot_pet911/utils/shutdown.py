@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from tg_bot_pet911.config.config import SHUTDOWN_TIMEOUT
+from tg_bot_pet911.utils.durable import flush_pending_writes
+
+
+logger = logging.getLogger(__name__)
+
+
+class GracefulShutdown:
+    """
+    Drains the bot before it stops.
+
+    Updates stop arriving first (polling stops, the webhook server closes
+    its socket), then within one deadline: handlers still running finish,
+    the persistence workers finish the jobs they are running, and writes
+    waiting for a group commit are flushed. Whatever does not finish in
+    time is cancelled and reported. Queued jobs are on disk and run on the
+    next start.
+    """
+
+    def __init__(self, timeout: float = SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self._in_flight: Set[asyncio.Task] = set()
+        self._deadline: Optional[float] = None
+        self.report: Dict[str, Any] = {}
+
+    def track_current_task(self):
+        """Make the shutdown wait for the running task, e.g. an update being handled."""
+        task = asyncio.current_task()
+        if task is not None and task not in self._in_flight:
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def update_middleware(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Outer update middleware tracking the updates being handled."""
+        self.track_current_task()
+        return await handler(event, data)
+
+    def remaining(self) -> float:
+        """Seconds left until the deadline, which starts with the first call."""
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.timeout
+        return max(0.0, self._deadline - time.monotonic())
+
+    async def drain_updates(self) -> int:
+        """
+        Wait for the updates being handled until the deadline, then cancel them.
+
+        Returns:
+            Number of cancelled updates
+        """
+        current = asyncio.current_task()
+        while True:
+            tasks = self._in_flight - {current}
+            if not tasks:
+                return 0
+            timeout = self.remaining()
+            if timeout > 0:
+                await asyncio.wait(tasks, timeout=timeout)
+                # Updates that were waiting for a free slot may have started meanwhile
+                continue
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return len(tasks)
+
+    async def run(self, persistence_queue, outbound_scheduler=None):
+        """
+        Drain updates and jobs, flush pending writes and log what was left behind.
+
+        Args:
+            persistence_queue: Queue whose workers finish their current jobs
+            outbound_scheduler: Scheduler whose unsent messages are reported
+        """
+        started = time.monotonic()
+        logger.info(f"Shutting down, waiting up to {self.timeout:.0f} s for {self.in_flight} updates and running jobs")
+
+        abandoned_updates = await self.drain_updates()
+        interrupted_jobs = await persistence_queue.drain(self.remaining())
+        await flush_pending_writes()
+        queued_jobs = await asyncio.to_thread(persistence_queue.pending_count)
+        unsent_messages = sum(outbound_scheduler.queue_depth().values()) if outbound_scheduler else 0
+
+        self.report = {
+            "seconds": time.monotonic() - started,
+            "abandoned_updates": abandoned_updates,
+            "interrupted_jobs": interrupted_jobs,
+            "queued_jobs": queued_jobs,
+            "unsent_messages": unsent_messages
+        }
+        message = (
+            f"Shutdown drained in {self.report['seconds']:.1f} s: "
+            f"{abandoned_updates} updates abandoned, {interrupted_jobs} jobs interrupted, "
+            f"{queued_jobs} jobs left for the next start, {unsent_messages} messages unsent"
+        )
+        if abandoned_updates or interrupted_jobs or unsent_messages:
+            logger.warning(message)
+        else:
+            logger.info(message)
+
+
+# Shared instance: the update middleware, the webhook handler and main use the same one
+_graceful_shutdown: Optional[GracefulShutdown] = None
+
+
+def get_graceful_shutdown() -> GracefulShutdown:
+    """Get the shared shutdown coordinator."""
+    global _graceful_shutdown
+    if _graceful_shutdown is None:
+        _graceful_shutdown = GracefulShutdown()
+    return _graceful_shutdown
@@ -0,0 +1,127 @@
+"""
+Startup profiling: how long each module takes to import and how long the
+bot takes from start to its first handled update.
+
+Enabled with STARTUP_PROFILE=1. Only the standard library is imported here,
+so the profiler can be installed before the bot's own imports.
+"""
+import importlib.abc
+import logging
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Loader wrapper that times ``exec_module`` of the wrapped loader."""
+
+    def __init__(self, profiler: "StartupProfiler", loader: importlib.abc.Loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._leave(module.__name__)
+
+    def __getattr__(self, name: str) -> Any:
+        # get_resource_reader, get_source, ... of the wrapped loader
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Meta path finder that wraps the loaders found by the other finders."""
+
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(self._profiler, spec.loader)
+                return spec
+        return None
+
+
+class StartupProfiler:
+    """
+    Records import times and the time to the first handled update.
+
+    Import times are "self" times: a module's time without the modules it
+    imports, so the report points at the module that is actually slow.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.first_update: Optional[float] = None
+        self._finder: Optional[_TimingFinder] = None
+        # Start time and time spent in nested imports of the modules being imported
+        self._stack: List[List[float]] = []
+
+    def install(self):
+        """Start timing imports, call before the imports to profile."""
+        self.started = time.perf_counter()
+        if self._finder is None:
+            self._finder = _TimingFinder(self)
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder is not None:
+            sys.meta_path.remove(self._finder)
+            self._finder = None
+
+    def _enter(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _leave(self, name: str):
+        started, nested = self._stack.pop()
+        total = time.perf_counter() - started
+        self.imports[name] = total - nested
+        if self._stack:
+            self._stack[-1][1] += total
+
+    def slowest_imports(self, count: int = 15) -> List[Tuple[str, float]]:
+        """The modules with the longest self import time, slowest first."""
+        return sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def report_imports(self, count: int = 15):
+        """Log the total and the slowest imports, and stop timing imports."""
+        self.uninstall()
+        elapsed = time.perf_counter() - self.started
+        logger.info(
+            f"Startup profile: {len(self.imports)} modules imported in {sum(self.imports.values()):.3f} s, "
+            f"{elapsed:.3f} s since start"
+        )
+        for name, seconds in self.slowest_imports(count):
+            logger.info(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    async def first_update_middleware(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Outer update middleware logging the time from start to the first handled update."""
+        try:
+            return await handler(event, data)
+        finally:
+            if self.first_update is None:
+                self.first_update = time.perf_counter() - self.started
+                logger.info(f"Startup profile: first update handled {self.first_update:.3f} s after start")
+
+
+# Profiler of this process, installed by main when STARTUP_PROFILE is set
+startup_profiler = StartupProfiler()
@@ -1,33 +1,183 @@
+import asyncio
+import glob
 import json
+import logging
 import os
 import uuid
-import aiofiles
 from datetime import datetime
 from aiogram import Bot
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 from tg_bot_pet911.app.models import PetInfo, PetPhoto
+from tg_bot_pet911.config.config import (
+    MAX_CONCURRENT_DOWNLOADS, STORAGE_BACKEND, PHOTO_STORE_ENABLED, PETS_LAYOUT
+)
+from tg_bot_pet911.utils.catalog import get_catalog
+from tg_bot_pet911.utils.durable import write_file
+from tg_bot_pet911.utils.geo_index import add_to_geo_index
+from tg_bot_pet911.utils.images import process_photos
+from tg_bot_pet911.utils.log_store import get_log_store
+from tg_bot_pet911.utils.photo_store import get_photo_store
 
 
 # Base path for storing data
 BASE_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 PETS_DATA_PATH = os.path.join(BASE_DATA_PATH, "pets")
 
+logger = logging.getLogger(__name__)
 
-async def save_pet_data(pet_info: PetInfo, bot: Bot) -> Tuple[str, Dict[str, Any]]:
+
+def pet_dir_path(pet_dir_name: str, pet_id: str, created: datetime, layout: str = None) -> str:
+    """
+    Get the directory a pet record is stored in.
+    
+    The sharded layout spreads records over YYYY/MM/DD/<id prefix>/ so that no
+    directory grows past a few hundred entries. The id is a random hex string,
+    so its first two characters work as a hash prefix.
+    
+    Args:
+        pet_dir_name: Directory name, <timestamp>_<type>_<gender>_<id>
+        pet_id: Pet record id
+        created: Time the record was created
+        layout: "sharded" or "flat", defaults to PETS_LAYOUT
+    
+    Returns:
+        Path to the pet directory
+    """
+    if (layout or PETS_LAYOUT) == "sharded":
+        return os.path.join(
+            PETS_DATA_PATH, created.strftime("%Y"), created.strftime("%m"), created.strftime("%d"),
+            pet_id[:2], pet_dir_name
+        )
+    return os.path.join(PETS_DATA_PATH, pet_dir_name)
+
+
+def resolve_pet_dir(pet_id: str) -> Optional[str]:
+    """
+    Find the directory of a saved pet record in either layout.
+    
+    Args:
+        pet_id: Pet record id
+    
+    Returns:
+        Path to the pet directory, None if it does not exist
+    """
+    # The catalog knows where the record was saved or moved to
+    pet_dir = get_catalog().get_pet_dir(pet_id)
+    if pet_dir and os.path.isdir(pet_dir):
+        return pet_dir
+    
+    # Fall back to looking in both layouts
+    patterns = [
+        os.path.join(PETS_DATA_PATH, f"*_{pet_id}"),
+        os.path.join(PETS_DATA_PATH, "*", "*", "*", glob.escape(pet_id[:2]), f"*_{pet_id}"),
+    ]
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            if os.path.isdir(path):
+                return path
+    return None
+
+
+# Global limit on concurrent photo downloads, created lazily inside the running loop
+_download_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_download_semaphore() -> asyncio.Semaphore:
+    """Return the semaphore shared by all photo downloads."""
+    global _download_semaphore
+    if _download_semaphore is None:
+        _download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    return _download_semaphore
+
+
+async def _download_photo(bot: Bot, photo: PetPhoto, local_name: str, pet_dir: str) -> Dict[str, Any]:
+    """Resolve and download a single photo, returning its local filename and blob hash."""
+    store = get_photo_store() if PHOTO_STORE_ENABLED else None
+    
+    # A photo we already hold is only linked, never downloaded again
+    blob = await asyncio.to_thread(store.lookup, photo.file_unique_id) if store else None
+    
+    if blob is None:
+        async with _get_download_semaphore():
+            # Get file info
+            file_info = await bot.get_file(photo.file_id)
+            file_path = file_info.file_path
+            
+            # Keep the extension reported by Telegram, default to .jpg
+            ext = os.path.splitext(file_path)[1] or ".jpg"
+            
+            if store is None:
+                # Download the file
+                local_filename = f"{local_name}{ext}"
+                await bot.download_file(file_path, os.path.join(pet_dir, local_filename))
+                return {"file": local_filename, "sha256": None}
+            
+            # Download into memory and store the content once
+            content = await bot.download_file(file_path)
+        blob = await asyncio.to_thread(store.put, photo.file_unique_id, content.getvalue(), ext)
+    
+    local_filename = f"{local_name}{os.path.splitext(blob.path)[1]}"
+    await asyncio.to_thread(store.link, blob, os.path.join(pet_dir, local_filename))
+    return {"file": local_filename, "sha256": blob.sha256}
+
+
+async def download_photos(
+    bot: Bot, photos: List[PetPhoto], pet_dir: str, file_prefix: str
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Download photos concurrently into a pet directory.
+    
+    Args:
+        bot: Bot instance for downloading photos
+        photos: Photos in the order the user sent them
+        pet_dir: Directory to store the photos in
+        file_prefix: Filename prefix, photos are saved as <prefix>_image_<n>
+    
+    Returns:
+        Tuple containing (saved photos in the original order, per-photo failures).
+        Each saved photo is a dict with its filename and blob hash.
+    """
+    results = await asyncio.gather(
+        *(
+            _download_photo(bot, photo, f"{file_prefix}_image_{i+1}", pet_dir)
+            for i, photo in enumerate(photos)
+        ),
+        return_exceptions=True
+    )
+    
+    saved = []
+    failures = []
+    for i, (photo, result) in enumerate(zip(photos, results)):
+        if isinstance(result, BaseException):
+            logger.warning("Failed to download photo %s (%s): %s", i + 1, photo.file_unique_id, result)
+            failures.append({
+                "index": i + 1,
+                "file_unique_id": photo.file_unique_id,
+                "error": str(result)
+            })
+        else:
+            saved.append(result)
+    
+    return saved, failures
+
+
+async def save_pet_data(pet_info: PetInfo, bot: Bot, pet_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
     """
     Save pet data to a JSON file and download photos.
     
     Args:
         pet_info: PetInfo object containing pet data
         bot: Bot instance for downloading photos
+        pet_id: Id to save the record under, a new one is generated if omitted
     
     Returns:
-        Tuple containing (path to the saved data directory, pet data as dict)
+        Tuple containing (path to the saved data directory or log segment, pet data as dict)
     """
     # Create a unique ID for this pet
-    pet_id = str(uuid.uuid4())[:8]  # Use shorter UUID for filenames
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    pet_id = pet_id or str(uuid.uuid4())[:8]  # Use shorter UUID for filenames
+    now = datetime.now()
+    timestamp = now.strftime("%Y%m%d_%H%M%S")
     
     # Create a clean type and gender string for the folder name
     pet_type_str = pet_info.pet_type if pet_info.pet_type else "unknown"
@@ -36,26 +186,19 @@ async def save_pet_data(pet_info: PetInfo, bot: Bot) -> Tuple[str, Dict[str, Any
     # Create more descriptive directory name
     pet_dir_name = f"{timestamp}_{pet_type_str}_{gender_str}_{pet_id}"
     
-    # Create directory for this pet
-    pet_dir = os.path.join(PETS_DATA_PATH, pet_dir_name)
-    os.makedirs(pet_dir, exist_ok=True)
+    # Create directory for this pet, the log backend keeps all photos in one directory
+    if STORAGE_BACKEND == "log":
+        pet_dir = None
+        photo_dir = get_log_store().photos_path
+    else:
+        pet_dir = pet_dir_path(pet_dir_name, pet_id, now)
+        photo_dir = pet_dir
+    os.makedirs(photo_dir, exist_ok=True)
     
     # Download photos directly to the data directory
-    photo_paths = []
-    if pet_info.photos:
-        for i, photo in enumerate(pet_info.photos):
-            # Get file info
-            file_info = await bot.get_file(photo.file_id)
-            file_path = file_info.file_path
-            
-            # Create local path for the photo with better naming
-            ext = os.path.splitext(file_path)[1] or ".jpg"  # Default to .jpg if no extension
-            local_filename = f"{pet_type_str}_{gender_str}_{pet_id}_image_{i+1}{ext}"
-            local_path = os.path.join(pet_dir, local_filename)
-            
-            # Download the file
-            await bot.download_file(file_path, local_path)
-            photo_paths.append(local_filename)
+    saved_photos, photo_errors = await download_photos(
+        bot, pet_info.photos, photo_dir, f"{pet_type_str}_{gender_str}_{pet_id}"
+    )
     
     # Prepare data for JSON
     pet_data = pet_info.model_dump()
@@ -66,7 +209,17 @@ async def save_pet_data(pet_info: PetInfo, bot: Bot) -> Tuple[str, Dict[str, Any
     # Format datetime in a more human-readable way
     current_time = datetime.now()
     pet_data["created_at"] = current_time.strftime("%Y-%m-%d %H:%M:%S")
-    pet_data["photo_files"] = photo_paths
+    pet_data["photo_files"] = [photo["file"] for photo in saved_photos]
+    if PHOTO_STORE_ENABLED:
+        pet_data["photo_blobs"] = [photo["sha256"] for photo in saved_photos]
+    
+    # Thumbnails, medium versions and perceptual hashes are created in a separate process pool
+    processed = await process_photos(photo_dir, pet_data["photo_files"])
+    if processed:
+        pet_data["derivatives"] = {name: result["derivatives"] for name, result in processed.items()}
+        pet_data["photo_hashes"] = {name: result["dhash"] for name, result in processed.items()}
+    if photo_errors:
+        pet_data["photo_errors"] = photo_errors
     
     # Add human-readable pet type and gender
     pet_type_map = {
@@ -88,10 +241,18 @@ async def save_pet_data(pet_info: PetInfo, bot: Bot) -> Tuple[str, Dict[str, Any
     if "photos" in pet_data:
         del pet_data["photos"]
     
-    # Save JSON data with matching name to photos
-    json_path = os.path.join(pet_dir, f"{pet_type_str}_{gender_str}_{pet_id}_data.json")
-    async with aiofiles.open(json_path, "w", encoding="utf-8") as f:
+    if STORAGE_BACKEND == "log":
+        # Append the record to the log, legacy directories are materialized on demand
+        saved_path = await asyncio.to_thread(get_log_store().append, pet_data, pet_dir_name)
+    else:
+        # Save JSON data with matching name to photos
+        json_path = os.path.join(pet_dir, f"{pet_type_str}_{gender_str}_{pet_id}_data.json")
         json_str = json.dumps(pet_data, ensure_ascii=False, indent=2)
-        await f.write(json_str)
+        await write_file(json_path, json_str, root=PETS_DATA_PATH)
+        saved_path = pet_dir
+    
+    # Index the record in the catalog
+    await asyncio.to_thread(get_catalog().add_record, pet_data, pet_dir)
+    add_to_geo_index(pet_data)
     
-    return pet_dir, pet_data 
\ No newline at end of file
+    return saved_path, pet_data 
\ No newline at end of file
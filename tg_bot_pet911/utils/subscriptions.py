@@ -0,0 +1,267 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from tg_bot_pet911.utils.geo_index import KM_PER_DEGREE, haversine_km
+
+
+# Subscription database lives next to the pet directories
+SUBSCRIPTIONS_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "subscriptions.sqlite3")
+
+
+class Subscription(NamedTuple):
+    """A saved area a user wants to hear about."""
+    id: int
+    user_id: int
+    chat_id: int
+    # None matches every pet type
+    pet_type: Optional[str]
+    latitude: float
+    longitude: float
+    radius_km: float
+
+
+class SubscriptionStore:
+    """SQLite storage of subscriptions."""
+
+    def __init__(self, db_path: str = SUBSCRIPTIONS_DB_PATH):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "user_id INTEGER NOT NULL, "
+            "chat_id INTEGER NOT NULL, "
+            "pet_type TEXT, "
+            "latitude REAL NOT NULL, "
+            "longitude REAL NOT NULL, "
+            "radius_km REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions (user_id)")
+        self._conn.commit()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def add(
+        self, user_id: int, chat_id: int, pet_type: Optional[str], latitude: float, longitude: float, radius_km: float
+    ) -> Subscription:
+        """Save a new subscription."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO subscriptions (user_id, chat_id, pet_type, latitude, longitude, radius_km, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, pet_type, latitude, longitude, radius_km, time.time())
+            )
+        return Subscription(cursor.lastrowid, user_id, chat_id, pet_type, latitude, longitude, radius_km)
+
+    def remove_user(self, user_id: int) -> List[Subscription]:
+        """Delete all subscriptions of a user and return them."""
+        subscriptions = self.list_user(user_id)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,))
+        return subscriptions
+
+    def list_user(self, user_id: int) -> List[Subscription]:
+        """Subscriptions of a user, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, user_id, chat_id, pet_type, latitude, longitude, radius_km "
+                "FROM subscriptions WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()
+        return [Subscription(*row) for row in rows]
+
+    def data_version(self) -> int:
+        """Number that changes whenever another connection commits to the database."""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def iter_all(self) -> Iterator[Subscription]:
+        """Iterate over all subscriptions."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT id, user_id, chat_id, pet_type, latitude, longitude, radius_km FROM subscriptions"
+            )
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1024)
+            if not rows:
+                break
+            for row in rows:
+                yield Subscription(*row)
+
+
+class SubscriptionIndex:
+    """Grid index of subscription areas.
+
+    Every subscription is registered in all cells its circle's bounding box
+    overlaps, so matching a report only reads the single cell the report
+    falls into and checks the exact distance for the few subscriptions there.
+    """
+
+    def __init__(self, cell_size: float = 0.1):
+        self.cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], Dict[int, Subscription]] = {}
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def _covered_cells(self, subscription: Subscription) -> Iterator[Tuple[int, int]]:
+        """Cells overlapping the bounding box of a subscription circle."""
+        lat_delta = subscription.radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.0, abs(subscription.latitude) + lat_delta)))
+        lon_delta = min(180.0, subscription.radius_km / (KM_PER_DEGREE * cos_lat))
+        min_lat, min_lon = self._cell(subscription.latitude - lat_delta, subscription.longitude - lon_delta)
+        max_lat, max_lon = self._cell(subscription.latitude + lat_delta, subscription.longitude + lon_delta)
+        for cell_lat in range(min_lat, max_lat + 1):
+            for cell_lon in range(min_lon, max_lon + 1):
+                yield cell_lat, cell_lon
+
+    def add(self, subscription: Subscription):
+        """Add a subscription."""
+        with self._lock:
+            self._subscriptions[subscription.id] = subscription
+            for cell in self._covered_cells(subscription):
+                self._cells.setdefault(cell, {})[subscription.id] = subscription
+
+    def subscriptions(self) -> Dict[int, Subscription]:
+        """Indexed subscriptions by id."""
+        with self._lock:
+            return dict(self._subscriptions)
+
+    def remove(self, subscription: Subscription):
+        """Remove a subscription."""
+        with self._lock:
+            if self._subscriptions.pop(subscription.id, None) is None:
+                return
+            for cell in self._covered_cells(subscription):
+                bucket = self._cells.get(cell)
+                if bucket is not None:
+                    bucket.pop(subscription.id, None)
+                    if not bucket:
+                        del self._cells[cell]
+
+    def match(self, latitude: float, longitude: float, pet_type: Optional[str] = None) -> List[Tuple[float, Subscription]]:
+        """
+        Find the subscriptions whose area contains a report.
+
+        Returns:
+            List of (distance in km, subscription), at most one per chat, closest first
+        """
+        with self._lock:
+            candidates = list(self._cells.get(self._cell(latitude, longitude), {}).values())
+
+        best: Dict[int, Tuple[float, Subscription]] = {}
+        for subscription in candidates:
+            if subscription.pet_type is not None and subscription.pet_type != pet_type:
+                continue
+            distance = haversine_km(latitude, longitude, subscription.latitude, subscription.longitude)
+            if distance > subscription.radius_km:
+                continue
+            if subscription.chat_id not in best or distance < best[subscription.chat_id][0]:
+                best[subscription.chat_id] = (distance, subscription)
+        return sorted(best.values(), key=lambda item: item[0])
+
+
+# Shared store and index, opened on first use
+_subscription_store: Optional[SubscriptionStore] = None
+_subscription_index: Optional[SubscriptionIndex] = None
+_subscription_lock = threading.Lock()
+# Store data version the shared index was last synced at
+_subscription_version: Optional[int] = None
+
+
+def get_subscription_store() -> SubscriptionStore:
+    """Get the shared subscription store."""
+    global _subscription_store
+    with _subscription_lock:
+        if _subscription_store is None:
+            _subscription_store = SubscriptionStore()
+        return _subscription_store
+
+
+def get_subscription_index() -> SubscriptionIndex:
+    """Get the shared subscription index, loading all subscriptions the first time."""
+    global _subscription_index, _subscription_version
+    store = get_subscription_store()
+    with _subscription_lock:
+        if _subscription_index is None:
+            _subscription_version = store.data_version()
+            index = SubscriptionIndex()
+            for subscription in store.iter_all():
+                index.add(subscription)
+            _subscription_index = index
+        return _subscription_index
+
+
+def refresh_subscription_index() -> int:
+    """
+    Apply the subscriptions other workers added or deleted since the last refresh.
+
+    The store is only read again if another connection committed to it.
+
+    Returns:
+        Number of subscriptions added or removed
+    """
+    global _subscription_version
+    store = get_subscription_store()
+    with _subscription_lock:
+        if _subscription_index is None:
+            return 0
+        version = store.data_version()
+        if version == _subscription_version:
+            return 0
+        _subscription_version = version
+        current = {subscription.id: subscription for subscription in store.iter_all()}
+        indexed = _subscription_index.subscriptions()
+        for subscription_id in indexed.keys() - current.keys():
+            _subscription_index.remove(indexed[subscription_id])
+        for subscription_id in current.keys() - indexed.keys():
+            _subscription_index.add(current[subscription_id])
+        return len(indexed.keys() ^ current.keys())
+
+
+def subscribe(
+    user_id: int, chat_id: int, pet_type: Optional[str], latitude: float, longitude: float, radius_km: float
+) -> Subscription:
+    """Save a subscription and add it to the shared index."""
+    subscription = get_subscription_store().add(user_id, chat_id, pet_type, latitude, longitude, radius_km)
+    get_subscription_index().add(subscription)
+    return subscription
+
+
+def unsubscribe(user_id: int) -> int:
+    """Delete all subscriptions of a user. Returns how many there were."""
+    removed = get_subscription_store().remove_user(user_id)
+    index = get_subscription_index()
+    for subscription in removed:
+        index.remove(subscription)
+    return len(removed)
+
+
+def matching_chats(
+    latitude: float, longitude: float, pet_type: Optional[str], exclude_chat_id: Optional[int] = None
+) -> List[Tuple[int, float]]:
+    """(chat id, distance in km) of every chat subscribed to a report at this point."""
+    return [
+        (subscription.chat_id, distance)
+        for distance, subscription in get_subscription_index().match(latitude, longitude, pet_type)
+        if subscription.chat_id != exclude_chat_id
+    ]
@@ -0,0 +1,361 @@
+import asyncio
+import copy
+import logging
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Set, Tuple, Union
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StateType, StorageKey
+
+from tg_bot_pet911.config.config import FSM_CACHE_SIZE, FSM_WRITE_BEHIND_MS
+from tg_bot_pet911.utils.fsm_patch import DataPatch, apply_patch
+from tg_bot_pet911.utils.redis_storage import SerializingRedisStorage
+
+
+logger = logging.getLogger(__name__)
+
+# Deletes a lock only if it still belongs to the worker releasing it
+RELEASE_LOCK_SCRIPT = 'if redis.call("get", KEYS[1]) == ARGV[1] then return redis.call("del", KEYS[1]) end return 0'
+
+
+def _seconds(ttl: Union[int, timedelta]) -> int:
+    return int(ttl.total_seconds()) if isinstance(ttl, timedelta) else int(ttl)
+
+
+def _decode(value: Optional[bytes]) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class _Entry:
+    """A cached conversation: its state, data and the version it was read or written at."""
+
+    __slots__ = ("key", "state", "data", "version", "dirty")
+
+    def __init__(self, key: StorageKey, state: Optional[str], data: Dict[str, Any], version: Optional[str]):
+        self.key = key
+        self.state = state
+        self.data = data
+        self.version = version
+        self.dirty = False
+
+
+class TieredStorage(BaseStorage):
+    """
+    FSM storage keeping hot conversations in process, in front of Redis.
+
+    Reads are served from a bounded LRU and go to Redis only on a miss.
+    Writes change the cached copy and are written back to Redis later in
+    one pipeline, so the several writes of a step cost a single round trip.
+    Every write-back gives the conversation a new version and publishes
+    it, and other workers drop their copy when they hear of it. Versions
+    are unique tokens rather than counters: the version key expires with
+    the conversation, and a counter starting over could match a copy a
+    worker still holds.
+
+    Pub/sub alone cannot stop a worker from reading its copy just before
+    the invalidation arrives, so with event isolation (see
+    TieredEventIsolation) the version is checked when the chat's lock is
+    taken and the writes go back before it is released: one round trip
+    each, and a step never sees another worker's outdated data.
+    """
+
+    def __init__(
+        self,
+        backend: SerializingRedisStorage,
+        max_size: int = FSM_CACHE_SIZE,
+        write_delay: float = FSM_WRITE_BEHIND_MS / 1000
+    ):
+        self.backend = backend
+        self.redis = backend.redis
+        self.max_size = max_size
+        self.write_delay = write_delay
+        self.worker_id = uuid.uuid4().hex
+        self.channel = f"{backend.key_builder.prefix}:invalidate"
+        # The version lives as long as the longer lived of state and data
+        ttls = [_seconds(ttl) for ttl in (backend.state_ttl, backend.data_ttl) if ttl]
+        self.version_ttl = max(ttls) if ttls else None
+        self._writes = 0
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.write_backs = 0
+        self.invalidations = 0
+
+    # Keys
+
+    def _key(self, key: StorageKey, part: str) -> str:
+        return self.backend.key_builder.build(key, part)
+
+    def _version_key(self, key: StorageKey) -> str:
+        return self._key(key, "version")
+
+    # Cache
+
+    def _remember(
+        self, key: StorageKey, state: Optional[bytes], data: Optional[bytes], fields: Any, version: Optional[bytes]
+    ) -> _Entry:
+        """Cache a conversation read from Redis."""
+        if isinstance(state, bytes):
+            state = state.decode("utf-8")
+        entry = _Entry(key, state, self.backend.decode_data(data, fields), _decode(version))
+        self._cache[self._version_key(key)] = entry
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """Drop the least recently used conversations above the limit, unless they wait for write-back."""
+        # The most recent one is being used by the caller
+        for vkey in list(self._cache)[:-1]:
+            if len(self._cache) <= self.max_size:
+                return
+            if vkey not in self._dirty:
+                del self._cache[vkey]
+
+    def _cached(self, key: StorageKey) -> Optional[_Entry]:
+        vkey = self._version_key(key)
+        entry = self._cache.get(vkey)
+        if entry is not None:
+            self._cache.move_to_end(vkey)
+        return entry
+
+    def forget(self, key: StorageKey):
+        """Drop the cached copy of a conversation, unless it has writes not yet in Redis."""
+        vkey = self._version_key(key)
+        if vkey not in self._dirty:
+            self._cache.pop(vkey, None)
+
+    async def _load(self, key: StorageKey) -> _Entry:
+        entry = self._cached(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(self._key(key, "state"))
+            pipe.get(self._key(key, "data"))
+            pipe.hgetall(self._key(key, "fields"))
+            pipe.get(self._version_key(key))
+            state, data, fields, version = await pipe.execute()
+        return self._remember(key, state, data, fields, version)
+
+    # BaseStorage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._load(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        entry = await self._load(key)
+        entry.data = copy.deepcopy(data)
+        self._mark_dirty(entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._load(key)).data)
+
+    async def patch_data(self, key: StorageKey, patch: DataPatch) -> None:
+        entry = await self._load(key)
+        apply_patch(entry.data, copy.deepcopy(patch))
+        self._mark_dirty(entry)
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        await self.flush()
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.backend.close()
+
+    def create_isolation(self) -> "TieredEventIsolation":
+        return TieredEventIsolation(self)
+
+    # Write-back
+
+    def _mark_dirty(self, entry: _Entry):
+        entry.dirty = True
+        self._dirty.add(self._version_key(entry.key))
+        if self._flush_handle is None:
+            # Writes arriving within the delay go back together
+            self._flush_handle = asyncio.get_running_loop().call_later(self.write_delay, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        task = asyncio.create_task(self._flush_in_background())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            # The writes stay pending, try again after the next delay
+            logger.error(f"Failed to write FSM data back to Redis: {e}")
+            if self._dirty and self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.write_delay, self._start_flush)
+
+    def _take_dirty(self, vkeys) -> List[_Entry]:
+        entries = []
+        for vkey in vkeys:
+            if vkey in self._dirty:
+                self._dirty.discard(vkey)
+                entry = self._cache[vkey]
+                entry.dirty = False
+                entries.append(entry)
+        return entries
+
+    async def _write_back(self, pipe, entries: List[_Entry], release_lock: Optional[Tuple[str, str]] = None):
+        """
+        Write conversations back with the commands already in the pipeline, in one round trip.
+
+        Each write bumps the conversation's version and announces it to the
+        other workers. ``release_lock`` (lock key, token) releases a chat's
+        lock after the writes: the pipeline is not a transaction, so a lock
+        released before them would let another worker read the old version.
+        """
+        versions = []
+        for entry in entries:
+            key = entry.key
+            if entry.state is None:
+                pipe.delete(self._key(key, "state"))
+            else:
+                pipe.set(self._key(key, "state"), entry.state, ex=self.backend.state_ttl)
+            if entry.data:
+                pipe.set(self._key(key, "data"), self.backend.serializer.dumps(entry.data), ex=self.backend.data_ttl)
+            else:
+                pipe.delete(self._key(key, "data"))
+            # Patched fields are part of the data written
+            pipe.delete(self._key(key, "fields"))
+            self._writes += 1
+            versions.append(f"{self.worker_id}.{self._writes}")
+            pipe.set(self._version_key(key), versions[-1], ex=self.version_ttl)
+            pipe.publish(self.channel, f"{self.worker_id} {self._version_key(key)}")
+        if release_lock is not None:
+            pipe.eval(RELEASE_LOCK_SCRIPT, 1, *release_lock)
+        try:
+            results = await pipe.execute()
+        except Exception:
+            # Keep the writes for the next attempt
+            for entry in entries:
+                entry.dirty = True
+                self._dirty.add(self._version_key(entry.key))
+            raise
+        for entry, version in zip(entries, versions):
+            entry.version = version
+        self.write_backs += len(entries)
+        return results
+
+    async def flush(self, key: Optional[StorageKey] = None):
+        """Write back one conversation, or all that have pending writes."""
+        entries = self._take_dirty(list(self._dirty) if key is None else [self._version_key(key)])
+        if entries:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                await self._write_back(pipe, entries)
+
+    # Invalidation
+
+    async def start(self):
+        """Listen for conversations written back by other workers."""
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(), name="fsm-invalidation")
+
+    async def _listen(self):
+        async for message in self._pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            data = message["data"]
+            worker_id, _, vkey = (data.decode() if isinstance(data, bytes) else data).partition(" ")
+            if worker_id != self.worker_id and vkey not in self._dirty and self._cache.pop(vkey, None) is not None:
+                self.invalidations += 1
+
+    def metrics(self) -> Dict[str, int]:
+        """Cache hits and misses, conversations written back and copies dropped for other workers."""
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "write_backs": self.write_backs,
+            "invalidations": self.invalidations
+        }
+
+
+class TieredEventIsolation(BaseEventIsolation):
+    """
+    Per-chat lock in Redis that also keeps the tiered cache consistent.
+
+    Taking the lock reads the conversation's version in the same round trip
+    and drops the cached copy if another worker changed it (loading it right
+    away if it was not cached). Releasing the lock writes the conversation
+    back in the same round trip, so the next worker to take it reads the
+    current data.
+    """
+
+    def __init__(self, storage: TieredStorage, timeout: float = 60, retry_delay: float = 0.005):
+        self.storage = storage
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        storage = self.storage
+        lock_key = storage._key(key, "lock")
+        token = uuid.uuid4().hex
+        await self._acquire(key, lock_key, token)
+        try:
+            yield
+        finally:
+            async with storage.redis.pipeline(transaction=False) as pipe:
+                await storage._write_back(
+                    pipe, storage._take_dirty([storage._version_key(key)]), release_lock=(lock_key, token)
+                )
+
+    async def _acquire(self, key: StorageKey, lock_key: str, token: str):
+        storage = self.storage
+        delay = self.retry_delay
+        while True:
+            entry = storage._cached(key)
+            async with storage.redis.pipeline(transaction=False) as pipe:
+                pipe.set(lock_key, token, nx=True, px=int(self.timeout * 1000))
+                pipe.get(storage._version_key(key))
+                if entry is None:
+                    pipe.get(storage._key(key, "state"))
+                    pipe.get(storage._key(key, "data"))
+                    pipe.hgetall(storage._key(key, "fields"))
+                results = await pipe.execute()
+            if not results[0]:
+                # Another worker handles this chat, wait for it
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+                continue
+            version = _decode(results[1])
+            if entry is None:
+                storage.misses += 1
+                storage._remember(key, *results[2:5], version)
+            elif entry.version != version and not entry.dirty:
+                storage.invalidations += 1
+                storage.forget(key)
+            return
+
+    async def close(self) -> None:
+        pass